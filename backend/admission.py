@@ -0,0 +1,92 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import jsonify, request
+
+import metrics
+
+# Per-client token buckets for the routes that call the model. Rates are
+# requests per minute, bursts are how many may arrive back to back. Buckets
+# live in each worker process, so a client spread over N workers can get up
+# to N times the rate; with a sticky load balancer it gets exactly this.
+ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', '1') != '0'
+CHAT_RATE_PER_MINUTE = float(os.getenv('CHAT_RATE_PER_MINUTE', '20'))
+CHAT_BURST = int(os.getenv('CHAT_BURST', '8'))
+ADVISORY_RATE_PER_MINUTE = float(os.getenv('ADVISORY_RATE_PER_MINUTE', '30'))
+ADVISORY_BURST = int(os.getenv('ADVISORY_BURST', '10'))
+BATCH_RATE_PER_MINUTE = float(os.getenv('BATCH_RATE_PER_MINUTE', '2'))
+BATCH_BURST = int(os.getenv('BATCH_BURST', '2'))
+# Clients tracked per limiter; the least recently seen are forgotten first
+ADMISSION_MAX_CLIENTS = int(os.getenv('ADMISSION_MAX_CLIENTS', '50000'))
+
+ADMISSION_REJECTIONS = metrics.counter('admission_rejections_total',
+                                       'Requests turned away before reaching the model, by route and reason.',
+                                       ('route', 'reason'))
+
+
+class TokenBucketLimiter:
+    def __init__(self, name, rate_per_minute, burst, max_clients=ADMISSION_MAX_CLIENTS):
+        self.name = name
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, client, cost=1):
+        """Spend cost tokens for client. Returns 0 if allowed, else seconds to wait."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[client] = (tokens, now)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        if allowed:
+            return 0
+        if self.rate <= 0:
+            return 60
+        return max(1, math.ceil((cost - tokens) / self.rate))
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+chat_limiter = TokenBucketLimiter('chat', CHAT_RATE_PER_MINUTE, CHAT_BURST)
+advisory_limiter = TokenBucketLimiter('advisory', ADVISORY_RATE_PER_MINUTE, ADVISORY_BURST)
+batch_limiter = TokenBucketLimiter('batch', BATCH_RATE_PER_MINUTE, BATCH_BURST)
+
+
+def client_address():
+    # request.remote_addr is the real client once ProxyFix has been applied
+    # (see TRUSTED_PROXY_HOPS in app.py)
+    return request.remote_addr or 'unknown'
+
+
+def retry_response(status, message, retry_after, route, reason):
+    ADMISSION_REJECTIONS.inc(route=route, reason=reason)
+    response = jsonify({'error': message, 'retry_after': retry_after})
+    response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def admit(limiter, cost=1):
+    """None if the current client may call the model, else a 429 response."""
+    if not ADMISSION_ENABLED:
+        return None
+    retry_after = limiter.take(client_address(), cost)
+    if not retry_after:
+        return None
+    return retry_response(429, 'Too many requests, please slow down', retry_after, limiter.name, 'rate_limited')
+
+
+def busy_response(error, route):
+    """503 for an llm.LLMBusyError (wait queue full or no slot in time)."""
+    return retry_response(503, 'AI service busy, please retry', error.retry_after, route, error.reason)
@@ -0,0 +1,128 @@
+import json
+import re
+
+import metrics
+from advisory_rules import ADVISORY_FIELDS
+
+# Structured output for the advisory prompt: Gemini is constrained to this
+# schema (response_mime_type + response_schema) instead of being asked nicely
+# for JSON in free text.
+ADVISORY_FIELD_DESCRIPTIONS = {
+    'irrigation': "Advice on watering schedule",
+    'protection': "Advice on pest, disease and weather protection",
+    'soil': "Advice on soil health",
+    'fertilizer': "Advice on fertilizer application",
+}
+ADVISORY_RESPONSE_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        field: {'type': 'string', 'description': ADVISORY_FIELD_DESCRIPTIONS[field]} for field in ADVISORY_FIELDS
+    },
+    'required': list(ADVISORY_FIELDS),
+}
+ADVISORY_GENERATION_CONFIG = {
+    'response_mime_type': 'application/json',
+    'response_schema': ADVISORY_RESPONSE_SCHEMA,
+}
+
+# Longest advice kept per field; anything longer is cut at a sentence end
+MAX_FIELD_CHARS = 800
+# A value cut off mid-string (MAX_TOKENS) is kept if this much survives
+MIN_SALVAGED_CHARS = 40
+
+ADVISORY_GENERATIONS = metrics.counter(
+    'advisory_generations_total',
+    'Model advisories by outcome: complete, salvaged (some fields filled from the rule table) or discarded.',
+    ('outcome',))
+
+# A finished "field": "value" pair anywhere in the text, so code fences,
+# prose around the object or a missing closing brace don't matter
+_FIELD_PATTERN = re.compile(r'"(%s)"\s*:\s*"((?:[^"\\]|\\.)*)"' % '|'.join(ADVISORY_FIELDS))
+# A value that was still open when the text ended
+_OPEN_FIELD_PATTERN = re.compile(r'"(%s)"\s*:\s*"((?:[^"\\]|\\.)*)\\?$' % '|'.join(ADVISORY_FIELDS))
+_SENTENCE_END = re.compile(r'.*[.!?।](?=\s|$)', re.S)
+
+
+def clean_field(value):
+    """Validated text for one field, or None if it isn't usable advice."""
+    if not isinstance(value, str):
+        return None
+    value = ' '.join(value.split())
+    if len(value) > MAX_FIELD_CHARS:
+        cut = _SENTENCE_END.match(value[:MAX_FIELD_CHARS])
+        value = cut.group(0) if cut else value[:MAX_FIELD_CHARS]
+    return value or None
+
+
+def _decode(raw):
+    try:
+        return json.loads(f'"{raw}"')
+    except ValueError:
+        return None
+
+
+class AdvisoryParser:
+    """Pulls advisory fields out of model output as it arrives.
+
+    feed() returns the fields completed by the new text, in order; finish()
+    also salvages a value that was cut off, and returns everything found.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.fields = {}
+        self._scanned = 0
+
+    def feed(self, text):
+        self.buffer += text
+        completed = []
+        for match in _FIELD_PATTERN.finditer(self.buffer, self._scanned):
+            self._scanned = match.end()
+            name = match.group(1)
+            value = clean_field(_decode(match.group(2)))
+            if name not in self.fields and value:
+                self.fields[name] = value
+                completed.append((name, value))
+        return completed
+
+    def finish(self):
+        completed = []
+        match = _OPEN_FIELD_PATTERN.search(self.buffer, self._scanned)
+        if match and match.group(1) not in self.fields:
+            partial = _decode(match.group(2)) or ''
+            cut = _SENTENCE_END.match(partial)
+            value = clean_field(cut.group(0) if cut else '')
+            if value and len(value) >= MIN_SALVAGED_CHARS:
+                self.fields[match.group(1)] = value
+                completed.append((match.group(1), value))
+        return completed
+
+
+def parse_advisory(text):
+    """Fields found in a complete model response (possibly fewer than four)."""
+    try:
+        parsed = json.loads(text)
+    except ValueError:
+        parsed = None
+    if isinstance(parsed, dict):
+        fields = {name: clean_field(parsed.get(name)) for name in ADVISORY_FIELDS}
+        return {name: value for name, value in fields.items() if value}
+    parser = AdvisoryParser()
+    parser.feed(text)
+    parser.finish()
+    return parser.fields
+
+
+def complete_advisory(fields, fallback):
+    """Fill missing fields from fallback (the rule table) and count the outcome.
+
+    Returns (advisory, filled field names), or (None, []) when the model
+    produced nothing usable.
+    """
+    if not fields:
+        ADVISORY_GENERATIONS.inc(outcome='discarded')
+        return None, []
+    missing = [name for name in ADVISORY_FIELDS if name not in fields]
+    ADVISORY_GENERATIONS.inc(outcome='salvaged' if missing else 'complete')
+    advisory = {name: fields.get(name) or fallback[name] for name in ADVISORY_FIELDS}
+    return advisory, missing
@@ -0,0 +1,91 @@
+from weather import current_conditions, forecast_days, forecast_trend, is_rainy, weather_group
+
+ADVISORY_FIELDS = ['irrigation', 'protection', 'soil', 'fertilizer']
+
+# Declarative rule table. For each field the first rule whose conditions all
+# hold wins; the rule with no conditions is the default. Conditions are facts
+# from weather_facts(), optionally suffixed with _gt / _lt / _in.
+#
+# The wording and thresholds start from the fallback in WeatherAlerts.tsx so
+# the app gives the same advice whether it runs in the browser or here.
+ADVISORY_RULES = {
+    'irrigation': [
+        ({'rain_expected': True}, "Rain is forecast. Suspend irrigation to avoid waterlogging and save water."),
+        ({'temp_gt': 35}, "High evaporation rates expected. Irrigate frequently, preferably in the evening."),
+        ({'trend': 'up', 'max_high_gt': 33}, "Temperatures are rising over the coming days. Plan extra irrigation and mulch to hold soil moisture."),
+        ({'temp_lt': 10}, "Cool weather slows water use. Reduce irrigation and water only around midday."),
+        ({}, "Schedule watering early morning to minimize evaporation."),
+    ],
+    'protection': [
+        ({'group_in': ['thunderstorm']}, "Thunderstorm alert. Avoid working in open fields and secure young plants and loose structures."),
+        ({'wind_gt': 20}, "High winds expected. Secure young plants and loose structures."),
+        ({'temp_lt': 10}, "Risk of cold stress. Mulch to retain soil warmth."),
+        ({'temp_gt': 38}, "Heat stress likely. Use shade nets to protect sensitive crops."),
+        ({'rain_expected': True, 'temp_gt': 25}, "Warm, wet weather favours fungal disease. Inspect leaves for spots and blight and keep field drainage clear."),
+        ({'group_in': ['fog']}, "Foggy, humid conditions favour mildew. Watch for white powdery growth on leaves."),
+        ({}, "Monitor for pests and diseases."),
+    ],
+    'soil': [
+        ({'rain_expected': True}, "Ensure proper drainage to prevent root rot due to excess moisture."),
+        ({'temp_gt': 35}, "Hot weather dries the topsoil fast. Mulch with crop residue to keep moisture in."),
+        ({}, "Monitor soil moisture levels."),
+    ],
+    'fertilizer': [
+        ({'rain_expected': True}, "Delay fertilizer application. Rain/wind may cause runoff or uneven distribution."),
+        ({'wind_gt': 20}, "Delay fertilizer application. Rain/wind may cause runoff or uneven distribution."),
+        ({'temp_gt': 35}, "Apply fertilizer in the cool evening hours and irrigate lightly afterwards to avoid nutrient loss."),
+        ({}, "Conditions are suitable for application if soil moisture is adequate."),
+    ],
+}
+
+
+def weather_facts(weather):
+    """Facts the rules can test, from the same payload as /api/farming-advisory."""
+    current = current_conditions(weather)
+    days = forecast_days(weather.get('forecast'))
+    highs = [float(day['high']) for day in days if day.get('high') is not None]
+    rain_now = is_rainy(current['code'], current['condition'])
+    rain_forecast = any(is_rainy(day.get('code'), day.get('condition')) for day in days)
+    return {
+        'temp': _number(current['temp']),
+        'wind': _number(current['wind']),
+        'group': weather_group(current['code'], current['condition']),
+        'rain_now': rain_now,
+        'rain_forecast': rain_forecast,
+        'rain_expected': rain_now or rain_forecast,
+        'trend': forecast_trend(days),
+        'max_high': max(highs) if highs else None,
+    }
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _holds(condition, expected, facts):
+    name, _, op = condition.rpartition('_')
+    if op in ('gt', 'lt', 'in') and name in facts:
+        actual = facts[name]
+        if actual is None:
+            return False
+        if op == 'gt':
+            return actual > expected
+        if op == 'lt':
+            return actual < expected
+        return actual in expected
+    return facts.get(condition) == expected
+
+
+def rule_advisory(weather):
+    """Advisory dict for a weather payload from the rule table alone."""
+    facts = weather_facts(weather)
+    advisory = {}
+    for field in ADVISORY_FIELDS:
+        for conditions, advice in ADVISORY_RULES[field]:
+            if all(_holds(name, expected, facts) for name, expected in conditions.items()):
+                advisory[field] = advice
+                break
+    return advisory
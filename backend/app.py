@@ -1,31 +1,143 @@
 import os
-from flask import Flask, request, jsonify
-from flask import Flask, jsonify, request
+import json
+import math
+import hashlib
+import logging
+import time
+import uuid
+import itertools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from flask import Flask, jsonify, request, Response
 from flask_cors import CORS
+from werkzeug.exceptions import HTTPException
+from werkzeug.middleware.proxy_fix import ProxyFix
 import google.generativeai as genai
 from dotenv import load_dotenv
+import llm
+from cache import make_cache, make_perceptual_cache, chat_cache_key
+from weather import current_conditions, advisory_cache_key, validate_weather, weather_alerts
+from advisory_rules import rule_advisory
+from schemes import scheme_index
+from scheme_translations import TranslatedSchemes
+from search import scheme_search, SEARCHABLE_FIELDS
+import images
+from singleflight import SingleFlight
+import sessions
+import jobs
+import admission
+import resilience
+import static_files
+import sync
+import fertilizer
+import weather_proxy
+import prewarm
+import advisory_output
+import metrics
+import logs
 
 # Load environment variables
 dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
 load_dotenv(dotenv_path)
 
-app = Flask(__name__, static_folder='../frontend/dist', static_url_path='')
+logs.setup()
+log = logging.getLogger(__name__)
+
+app = Flask(__name__, static_folder=None)
+# Oversized uploads are refused with 413 from the Content-Length header alone
+app.config['MAX_CONTENT_LENGTH'] = images.MAX_UPLOAD_BYTES
 CORS(app)
+# Number of reverse proxies in front of us (e.g. 1 on Render/Heroku), so the
+# client address used for rate limits comes from X-Forwarded-For
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', '0'))
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS)
+
+# Client-supplied request ids are kept if they look like one. Our own are a
+# per-process random prefix plus a counter, which is cheaper than a uuid each.
+REQUEST_ID_MAX_LENGTH = 64
+_request_id_prefix = uuid.uuid4().hex[:8]
+_request_counter = itertools.count(1)
+
+@app.before_request
+def start_request():
+    req = request._get_current_object()
+    incoming = req.headers.get('X-Request-ID', '')
+    if not (0 < len(incoming) <= REQUEST_ID_MAX_LENGTH and incoming.isprintable()):
+        incoming = f"{_request_id_prefix}-{next(_request_counter):x}"
+    route = req.url_rule.rule if req.url_rule else 'unmatched'
+    req.instrumentation = (incoming, route, time.perf_counter())
+    logs.request_id.set(incoming)
+    metrics.HTTP_IN_FLIGHT.inc(route=route)
+
+@app.after_request
+def finish_request(response):
+    request_id, route, started_at = request.instrumentation
+    response.headers['X-Request-ID'] = request_id
+    method, status = request.method, response.status_code
+
+    # Runs once the body has been sent, so streamed responses are timed in full
+    def record():
+        elapsed = time.perf_counter() - started_at
+        metrics.HTTP_IN_FLIGHT.dec(route=route)
+        metrics.HTTP_REQUESTS.inc(route=route, method=method, status=status)
+        metrics.HTTP_REQUEST_SECONDS.observe(elapsed, route=route, method=method)
+        log.debug("Request finished", extra={'route': route, 'method': method, 'status': status,
+                                            'duration_ms': round(elapsed * 1000, 1)})
+
+    response.call_on_close(record)
+    return response
 
-@app.route('/')
-def serve():
-    return app.send_static_file('index.html')
+# The built frontend, precompressed and held in memory (see static_files.py)
+frontend = static_files.StaticFiles()
+
+@app.route('/', defaults={'path': ''})
+@app.route('/<path:path>', methods=['GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE'])
+def serve(path):
+    if path == 'api' or path.startswith('api/'):
+        return jsonify({'error': 'Not found'}), 404
+    if request.method not in ('GET', 'HEAD'):
+        return jsonify({'error': 'Method not allowed'}), 405
+
+    asset = frontend.get(path)
+    if asset is None:
+        if static_files.looks_like_file(path):
+            return jsonify({'error': 'Not found'}), 404
+        # Client-side route (/weather, /schemes, ...): let the SPA router handle it
+        asset = frontend.get('index.html')
+        if asset is None:
+            return jsonify({'error': 'Frontend not built'}), 404
+
+    return asset_response(asset)
+
+def asset_response(asset):
+    """Send a static_files.Asset in the best encoding the client accepts, with ETag/304."""
+    encoding, variant = static_files.StaticFiles.negotiate(asset, request.accept_encodings)
+    etags = [v.etag for v in asset.variants.values()]
+    if request.if_none_match and any(etag.strip('"') in request.if_none_match for etag in etags):
+        response = Response(status=304)
+    else:
+        response = Response(variant.data, mimetype=asset.mime_type)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.headers['ETag'] = variant.etag
+    response.headers['Cache-Control'] = asset.cache_control
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
 
 @app.errorhandler(404)
 def not_found(e):
-    return app.send_static_file('index.html')
+    if request.path.startswith('/api/'):
+        return jsonify({'error': 'Not found'}), 404
+    return e
 
 # Configure Gemini API
 GENAI_API_KEY = os.getenv("GEMINI_API_KEY")
 if not GENAI_API_KEY:
-    print("Warning: GEMINI_API_KEY not found in environment variables.")
+    log.warning("GEMINI_API_KEY not found in environment variables.")
 else:
-    genai.configure(api_key=GENAI_API_KEY)
+    # GEMINI_TRANSPORT=rest is set by the cooperative gunicorn profile
+    genai.configure(api_key=GENAI_API_KEY, transport=os.getenv("GEMINI_TRANSPORT") or None)
 
 # System Prompt for Indian Farmer Persona
 SYSTEM_PROMPT = """
@@ -45,552 +157,951 @@ Key traits:
 If you don't know the answer, admit it and suggest consulting a local Krishi Vigyan Kendra (KVK).
 """
 
-def get_gemini_model():
-    try:
-        # Generic logic: List all models and pick the FIRST one that supports content generation.
-        # This avoids hardcoding specific versions like 'gemini-1.5-flash'.
-        available_models = list(genai.list_models())
-        print(f"Available models: {[m.name for m in available_models]}")
-        
-        selected_model_name = None
-        for m in available_models:
-            if 'generateContent' in m.supported_generation_methods:
-                selected_model_name = m.name
-                break
-        
-        if selected_model_name:
-            print(f"Automatically selected generic model: {selected_model_name}")
-            return genai.GenerativeModel(selected_model_name, system_instruction=SYSTEM_PROMPT)
-        else:
-            print("No model found supporting generateContent.")
-            # Absolute fallback if list is empty or weird
-            return genai.GenerativeModel('gemini-pro', system_instruction=SYSTEM_PROMPT)
-            
-    except Exception as e:
-        print(f"Error selecting model: {e}")
-        return genai.GenerativeModel('gemini-pro', system_instruction=SYSTEM_PROMPT)
+# Gemini is resolved lazily (pinned, cached on disk, or discovered in the
+# background) so that importing the app never waits on list_models().
+# LLM_PROVIDER=fake swaps in the local stand-in from fake_llm.py.
+model = llm.make_model(system_instruction=SYSTEM_PROMPT)
+
+# Text-only chat answers, keyed on the normalized question + language
+chat_cache = make_cache(
+    'chat',
+    max_entries=int(os.getenv('CHAT_CACHE_MAX_ENTRIES', '2048')),
+    ttl=int(os.getenv('CHAT_CACHE_TTL', str(6 * 60 * 60))),
+)
+
+# Parsed advisories, shared by every request whose weather falls in the same bucket
+advisory_cache = make_cache(
+    'advisory',
+    max_entries=int(os.getenv('ADVISORY_CACHE_MAX_ENTRIES', '4096')),
+    ttl=int(os.getenv('ADVISORY_CACHE_TTL', str(3 * 60 * 60))),
+)
+
+# Diagnoses for photos, matched by perceptual hash so forwarded copies of the
+# same leaf photo (re-compressed, resized) reuse one answer
+image_cache = make_perceptual_cache(
+    'image',
+    max_entries=int(os.getenv('IMAGE_CACHE_MAX_ENTRIES', '2048')),
+    ttl=int(os.getenv('IMAGE_CACHE_TTL', str(24 * 60 * 60))),
+    max_distance=int(os.getenv('IMAGE_CACHE_MAX_DISTANCE', '6')),
+)
+
+# Server-side chat history for clients that send a session_id
+session_store = sessions.make_session_store()
+
+# Identical questions / advisories in flight at the same time share one Gemini call
+chat_flight = SingleFlight('chat')
+advisory_flight = SingleFlight('advisory')
+flights = (chat_flight, advisory_flight, weather_proxy.geocode_flight, weather_proxy.forecast_flight)
+
+def cache_lookup_samples():
+    samples = []
+    for name, cache in (('chat', chat_cache), ('advisory', advisory_cache), ('image', image_cache),
+                        ('geocode', weather_proxy.geocode_cache), ('forecast', weather_proxy.forecast_cache)):
+        stats = cache.stats()
+        samples.append(({'cache': name, 'result': 'hit'}, stats['hits']))
+        samples.append(({'cache': name, 'result': 'miss'}, stats['misses']))
+    return samples
+
+def coalescing_samples():
+    samples = []
+    for flight in flights:
+        stats = flight.stats()
+        for result in ('upstream_calls', 'coalesced', 'coalesced_across_workers'):
+            samples.append(({'flight': flight.name, 'result': result}, stats[result]))
+    return samples
+
+metrics.callback('response_cache_lookups_total', 'Response cache lookups by cache and result.', 'counter',
+                 cache_lookup_samples)
+metrics.callback('image_cache_near_duplicate_hits_total', 'Image cache hits on a near-duplicate photo.', 'counter',
+                 lambda: [({}, image_cache.stats()['near_duplicate_hits'])])
+metrics.callback('coalesced_calls_total', 'Identical concurrent requests by whether they called the model.', 'counter',
+                 coalescing_samples)
+metrics.callback('llm_circuit_state', 'Circuit breaker per model: 0 closed, 1 half-open, 2 open.', 'gauge',
+                 lambda: [({'model': name}, resilience.BREAKER_STATE_VALUES[health['state']])
+                          for name, health in model.status().items()])
+metrics.callback('llm_queue_depth', 'Requests waiting for a free model slot.', 'gauge',
+                 lambda: [({}, llm.queue_depth())])
+metrics.callback('coalesced_calls_in_flight', 'Distinct calls currently being coalesced.', 'gauge',
+                 lambda: [({'flight': flight.name}, flight.stats()['in_flight']) for flight in flights])
 
-model = get_gemini_model()
+def response_cache_for(data, image_hash=None, history_key=''):
+    """Pick the cache and key for a chat request, or (None, None).
+
+    history_key (see open_chat_session) keeps answers that depend on earlier
+    turns apart from first questions and from other conversations.
+    """
+    if image_hash is not None:
+        message = f"{history_key} {data.get('message') or ''}" if history_key else data.get('message')
+        return image_cache, (image_hash, data.get('language', 'English'), message)
+    if data.get('image') or not data.get('message'):
+        return None, None
+    return chat_cache, chat_cache_key(data['message'], data.get('language', 'English'), history_key)
+
+@app.errorhandler(413)
+def payload_too_large(e):
+    return jsonify({'error': 'Upload too large', 'max_bytes': images.MAX_UPLOAD_BYTES}), 413
+
+@metrics.phase('parse')
+def read_chat_request():
+    """Read a chat request in any of the supported upload shapes.
+
+    - application/json: {"message", "language", "image": "data:image/...;base64,..."}
+    - multipart/form-data: message and language fields, image as a file part
+    - image/*: the raw photo as the body, message and language in the query string
+    """
+    if request.mimetype == 'multipart/form-data':
+        return {
+            'message': request.form.get('message'),
+            'language': request.form.get('language', 'English'),
+            'session_id': request.form.get('session_id'),
+            'image': request.files.get('image'),
+        }
+    if request.mimetype.startswith('image/'):
+        return {
+            'message': request.args.get('message'),
+            'language': request.args.get('language', 'English'),
+            'session_id': request.args.get('session_id'),
+            'image': images.spool_stream(request.stream),
+        }
+    return request.json
+
+@metrics.phase('prompt')
+def build_chat_prompt(data):
+    """Turn a chat request (see read_chat_request) into Gemini prompt parts.
+
+    Returns (prompt_parts, None) on success or (None, (error_body, status)).
+    """
+    if not isinstance(data, dict):
+        return None, ({'error': 'No content provided'}, 400)
+    # Filled in below from the decoded photo, never taken from the client
+    data.pop('image_hash', None)
+    user_message = data.get('message')
+    user_image = data.get('image') # Data URI string or uploaded file, if present
+    language = data.get('language', 'English') # Preferred language
+
+    if not user_message and not user_image:
+        return None, ({'error': 'No content provided'}, 400)
+
+    # Construct the conversation history (simplified for now, strictly per-request)
+    # In a real app, we'd manage history. Here we just send the current turn with system context.
+    
+    prompt_parts = []
+    
+    # Add context about language if needed
+    if language and language != 'English':
+         prompt_parts.append(f"Please respond in {language} language.")
+
+    if user_message:
+        prompt_parts.append(user_message)
+    
+    if user_image:
+        # Whatever the phone sent, Gemini gets a downscaled JPEG without EXIF
+        try:
+            fileobj = images.open_data_uri(user_image) if isinstance(user_image, str) else user_image
+            with metrics.REQUEST_PHASE_SECONDS.time(phase='image_decode'):
+                image = images.normalize_image(fileobj)
+            prompt_parts.append({'mime_type': image.mime_type, 'data': image.data})
+            data['image_hash'] = image.dhash
+        except images.InvalidImageError as e:
+            log.warning("Error parsing image", extra={'error': str(e)})
+            return None, ({'error': 'Invalid image format'}, 400)
+
+    return prompt_parts, None
+
+@metrics.phase('session')
+def open_chat_session(data, prompt_parts):
+    """Load the session named by data['session_id'] and prepend its history.
+
+    Returns (session_id, session, history_key), history_key being a digest
+    of the history sent ('' when there is none); (None, None, '') when the
+    request is stateless. Raises ValueError for a malformed session id.
+    """
+    session_id = data.get('session_id')
+    if not session_id:
+        return None, None, ''
+    if not sessions.valid_session_id(session_id):
+        raise ValueError('Invalid session_id')
+    session = session_store.load(session_id)
+    context = sessions.build_context(session)
+    if not context:
+        return session_id, session, ''
+    prompt_parts.insert(0, context)
+    return session_id, session, hashlib.sha256(context.encode('utf-8')).hexdigest()[:32]
+
+def save_chat_session(data, session_id, session, reply):
+    if session_id:
+        sessions.add_exchange(session, data.get('message'), reply, had_image=bool(data.get('image')))
+        session_store.save(session_id, session)
+
+def wants_event_stream():
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+def wants_async():
+    return 'respond-async' in request.headers.get('Prefer', '')
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
+    # Clients that ask for SSE get the streaming variant on the same URL, and
+    # ones that send "Prefer: respond-async" a job to poll
+    if wants_event_stream():
+        return chat_stream()
+    if wants_async():
+        return submit_chat_job()
+
+    rejected = admission.admit(admission.chat_limiter)
+    if rejected:
+        return rejected
+
     try:
-        data = request.json
-        user_message = data.get('message')
-        user_image = data.get('image') # Base64 string if present
-        language = data.get('language', 'English') # Preferred language
+        data = read_chat_request()
+        prompt_parts, error = build_chat_prompt(data)
+        if error:
+            return jsonify(error[0]), error[1]
+        try:
+            session_id, session, history_key = open_chat_session(data, prompt_parts)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
-        if not user_message and not user_image:
-            return jsonify({'error': 'No content provided'}), 400
+        cache, cache_key = response_cache_for(data, data.get('image_hash'), history_key)
+        if cache:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                save_chat_session(data, session_id, session, cached)
+                return jsonify({'response': cached})
 
-        # Construct the conversation history (simplified for now, strictly per-request)
-        # In a real app, we'd manage history. Here we just send the current turn with system context.
-        
-        prompt_parts = []
-        
-        # Add context about language if needed
-        if language and language != 'English':
-             prompt_parts.append(f"Please respond in {language} language.")
+        def generate():
+            # Generate response
+            response = llm.generate_content(model, prompt_parts)
+            text = response.text
+            # Like the stream path, never cache a reply cut short (MAX_TOKENS, SAFETY)
+            if cache and text and chunk_finish_reason(response) in (None, 'STOP'):
+                cache.set(cache_key, text)
+            return text
 
-        if user_message:
-            prompt_parts.append(user_message)
-        
-        if user_image:
-            # We assume image is sent as a base64 data URI: "data:image/jpeg;base64,..."
-            # We need to parse it for Gemini
-            try:
-                # Basic parsing "data:image/jpeg;base64,..."
-                header, base64_data = user_image.split(',', 1)
-                mime_type = header.split(':')[1].split(';')[0]
-                
-                image_blob = {
-                    'mime_type': mime_type,
-                    'data': base64_data
-                }
-                prompt_parts.append(image_blob)
-            except Exception as e:
-                print(f"Error parsing image: {e}")
-                return jsonify({'error': 'Invalid image format'}), 400
-
-        # Generate response
-        response = model.generate_content(prompt_parts)
-        
-        return jsonify({'response': response.text})
+        if cache:
+            text = chat_flight.do(cache_key, generate, recheck=lambda: cache.get(cache_key))
+        else:
+            text = generate()
+
+        save_chat_session(data, session_id, session, text)
+        return jsonify({'response': text})
 
+    except HTTPException:
+        # e.g. 413 from the upload size limit; let Flask's handlers answer
+        raise
+    except llm.LLMBusyError as e:
+        log.warning("Chat rejected, model busy", extra={'error': str(e)})
+        return admission.busy_response(e, 'chat')
     except Exception as e:
-        print(f"Error processing request: {e}")
+        log.exception("Error processing chat request")
         return jsonify({'error': 'AI processing failed', 'details': str(e)}), 500
-# Schemes Data
-SCHEMES = [
-    {
-        "title": "PM-KISAN",
-        "description": "Pradhan Mantri Kisan Samman Nidhi provides financial assistance to landholding farmer families.",
-        "eligibility": "Small and marginal farmer families with cultivable land",
-        "benefits": "₹6,000 per year in three equal installments",
-        "link": "https://pmkisan.gov.in/"
-    },
-    {
-        "title": "PMFBY",
-        "description": "Pradhan Mantri Fasal Bima Yojana provides insurance coverage for crop loss.",
-        "eligibility": "All farmers including sharecroppers and tenant farmers",
-        "benefits": "Premium: 2% for Kharif, 1.5% for Rabi, 5% for commercial crops",
-        "link": "https://pmfby.gov.in/"
-    },
-    {
-        "title": "SMAM",
-        "description": "Sub-Mission on Agricultural Mechanization promotes agricultural mechanization among small and marginal farmers.",
-        "eligibility": "Individual farmers, custom hiring centers, farmer groups",
-        "benefits": "Financial assistance for purchasing agricultural machinery",
-        "link": "https://cemca.org.in/smam-kisan-yojana/"
-    },
-    {
-        "title": "PKVY",
-        "description": "Paramparagat Krishi Vikas Yojana promotes organic farming practices.",
-        "eligibility": "Farmers willing to practice organic farming",
-        "benefits": "Financial assistance of ₹50,000 per hectare/3 years",
-        "link": "https://pmujjwalayojana.in/paramparagat-krishi-vikas-yojana/"
-    },
-    {
-        "title": "NFSM",
-        "description": "National Food Security Mission increases production of rice, wheat, pulses, and coarse cereals.",
-        "eligibility": "Farmers in identified districts across the country",
-        "benefits": "Assistance for seeds, treatments, nutrient management etc.",
-        "link": "https://www.nfsm.gov.in/"
-    },
-    {
-        "title": "YSR Rythu Bharosa",
-        "description": "Income support for farmers in Andhra Pradesh.",
-        "eligibility": "All resident farmers including tenant farmers.",
-        "benefits": "₹13,500 per year financial assistance.",
-        "link": "https://services.india.gov.in/service/detail/ysr-raithu-bharosa-new-farmer-registration-andhra-pradesh-1"
-    },
-    {
-        "title": "AP Input Subsidy Scheme",
-        "description": "Support for farmers facing crop loss.",
-        "eligibility": "Farmers affected by natural calamities.",
-        "benefits": "Input subsidy based on damage percentage.",
-        "link": "https://apagrisnet.gov.in/"
-    },
-    {
-        "title": "Arunachal Farmer Welfare Scheme",
-        "description": "Support for agricultural modernization.",
-        "eligibility": "Small and marginal farmers.",
-        "benefits": "Assistance for seeds, tools, and irrigation.",
-        "link": "https://agri.arunachal.gov.in/"
-    },
-    {
-        "title": "Assam Farmer Loan Waiver Scheme",
-        "description": "Debt relief for small and marginal farmers.",
-        "eligibility": "Farmers with overdue crop loans.",
-        "benefits": "Loan waiver and interest subsidy.",
-        "link": "https://diragri.assam.gov.in/"
-    },
-    {
-        "title": "Assam Tractor Distribution Scheme (CTA)",
-        "description": "Provide tractors to farmer groups.",
-        "eligibility": "Registered farmer groups.",
-        "benefits": "Subsidized tractors under state program.",
-        "link": "https://diragri.assam.gov.in/"
-    },
-    {
-        "title": "Bihar Diesel Subsidy Scheme",
-        "description": "Subsidy for irrigation using diesel pumps.",
-        "eligibility": "All farmers owning diesel irrigation pumps.",
-        "benefits": "Subsidy per litre of diesel.",
-        "link": "https://dbtagriculture.bihar.gov.in/"
-    },
-    {
-        "title": "Bihar Fasal Sahayata Yojana",
-        "description": "State crop assistance instead of PMFBY.",
-        "eligibility": "Farmers facing yield loss.",
-        "benefits": "₹7,500–₹10,000 per hectare compensation.",
-        "link": "https://esahkari.bihar.gov.in/coop/FSY/REG_Rabi_2425_update.aspx"
-    },
-    {
-        "title": "Rajiv Gandhi Kisan Nyay Yojana",
-        "description": "Income support to promote crop productivity.",
-        "eligibility": "Registered farmers of Chhattisgarh.",
-        "benefits": "₹9,000 per acre depending on crop.",
-        "link": "https://agriportal.cg.nic.in/"
-    },
-    {
-        "title": "Goa Krishi Card Scheme",
-        "description": "Provides benefits and subsidies to Goan farmers.",
-        "eligibility": "Residents engaged in agriculture.",
-        "benefits": "Fertilizer, seed and machinery subsidy.",
-        "link": "https://agri.goa.gov.in/"
-    },
-    {
-        "title": "Mukhya Mantri Kisan Sahay Yojana",
-        "description": "Assistance for farmers during natural calamities.",
-        "eligibility": "Farmers suffering crop damage.",
-        "benefits": "Up to ₹25,000 per hectare.",
-        "link": "https://ikhedut.gujarat.gov.in/"
-    },
-    {
-        "title": "IKhedut Portal Schemes",
-        "description": "Unified portal for farm subsidies and tools.",
-        "eligibility": "All Gujarat farmers.",
-        "benefits": "Subsidy for seeds, machinery, irrigation.",
-        "link": "https://ikhedut.gujarat.gov.in/"
-    },
-    {
-        "title": "Meri Fasal Mera Byora",
-        "description": "Crop registration and subsidy distribution.",
-        "eligibility": "All farmers of Haryana.",
-        "benefits": "Direct benefit transfer for crops.",
-        "link": "https://fasal.haryana.gov.in/"
-    },
-    {
-        "title": "Bhavantar Bharpai Yojana",
-        "description": "Price deficit compensation.",
-        "eligibility": "Registered farmers selling crops.",
-        "benefits": "Difference paid if market price < MSP.",
-        "link": "https://sarkariyojana.com/bhavantar-bharpai-yojana-haryana/"
-    },
-    {
-        "title": "HP Mukhya Mantri Kisan Evam Khetihar Mazdoor Samman Nidhi",
-        "description": "Financial aid to small farmers.",
-        "eligibility": "Small and marginal farmers.",
-        "benefits": "₹3,000 financial assistance.",
-        "link": "https://www.hpagrisnet.gov.in/"
-    },
-    {
-        "title": "Jharkhand Krishi Rin Maafi",
-        "description": "Loan waiver for state farmers.",
-        "eligibility": "Small and marginal farmers with crop loans.",
-        "benefits": "Loan waiver up to ₹50,000.",
-        "link": "https://jkrmy.jharkhand.gov.in/"
-    },
-    {
-        "title": "Raitha Siri Scheme",
-        "description": "Support for millet farmers.",
-        "eligibility": "Farmers growing minor millets.",
-        "benefits": "₹10,000 per hectare input subsidy.",
-        "link": "https://raitamitra.karnataka.gov.in/"
-    },
-    {
-        "title": "Ganga Kalyana Scheme",
-        "description": "Irrigation borewell subsidy.",
-        "eligibility": "Small and marginal farmers.",
-        "benefits": "Subsidy for drilling borewells.",
-        "link": "https://kmdc.karnataka.gov.in/31/ganga-kalyana-schmeme/en"
-    },
-    {
-        "title": "Kerala Subhiksha Keralam",
-        "description": "State food security and farming mission.",
-        "eligibility": "Farmers and farmer groups.",
-        "benefits": "Support for seeds, machinery, training.",
-        "link": "https://www.aims.kerala.gov.in/subhikshakeralam"
-    },
-    {
-        "title": "MP Krishi Rin Samadhan Yojana",
-        "description": "Waiver and restructuring of crop loans.",
-        "eligibility": "Small and marginal farmers.",
-        "benefits": "Loan relief and subsidy.",
-        "link": "https://mpkrishi.mp.gov.in/"
-    },
-    {
-        "title": "Mukhya Mantri Krishak Samagra Samman Yojana",
-        "description": "Income support scheme.",
-        "eligibility": "All registered farmers.",
-        "benefits": "Annual financial assistance.",
-        "link": "https://mpkrishi.mp.gov.in/"
-    },
-    {
-        "title": "MahaDBT Farmer Schemes",
-        "description": "Unified portal for subsidies and farm schemes.",
-        "eligibility": "All Maharashtra farmers.",
-        "benefits": "Seed, irrigation, machinery subsidy.",
-        "link": "https://mahadbt.maharashtra.gov.in/"
-    },
-    {
-        "title": "Chhatrapati Shivaji Maharaj Shetkari Sanman Yojana",
-        "description": "Loan waiver program.",
-        "eligibility": "Small farmers with overdue loans.",
-        "benefits": "Loan waiver up to ₹1 lakh.",
-        "link": "https://krishi.maharashtra.gov.in/"
-    },
-    {
-        "title": "Manipur Agriculture Assistance Scheme",
-        "description": "Financial help during crop loss.",
-        "eligibility": "Farmers affected by natural calamities.",
-        "benefits": "Relief assistance.",
-        "link": "https://agrimanipur.mn.gov.in/"
-    },
-    {
-        "title": "Megha-LAMP Scheme",
-        "description": "Livelihood improvement for farmers.",
-        "eligibility": "Rural farmers and SHGs.",
-        "benefits": "Training, inputs, irrigation support.",
-        "link": "https://megagriculture.gov.in/"
-    },
-    {
-        "title": "New Land Use Policy (NLUP)",
-        "description": "Livelihood and agriculture modernization.",
-        "eligibility": "Resident farmers of Mizoram.",
-        "benefits": "Support for farming and tools.",
-        "link": "https://mamit.nic.in/scheme/nlup-scheme/"
-    },
-    {
-        "title": "Nagaland Agriculture Mechanization Scheme",
-        "description": "Support for machinery and farming tools.",
-        "eligibility": "Small and marginal farmers.",
-        "benefits": "Machinery subsidy.",
-        "link": "https://agriculture.nagaland.gov.in/smam/"
-    },
-    {
-        "title": "KALIA Scheme",
-        "description": "Income support and financial protection for farmers.",
-        "eligibility": "Small, marginal farmers & landless labourers.",
-        "benefits": "₹10,000 yearly assistance + insurance.",
-        "link": "https://jaagrukbharat.com/kalia-portal-2024-empowering-farmers-in-odisha-with-agricultural-support-1412133"
-    },
-    {
-        "title": "Punjab Smart Connect Farmers Scheme",
-        "description": "Mobile phones for farmers for agri updates.",
-        "eligibility": "Small and marginal farmers.",
-        "benefits": "Free smartphones.",
-        "link": "https://farmerregistration.anaajkharid.in/"
-    },
-    {
-        "title": "Rajasthan Kisan Mitra Energy Scheme",
-        "description": "Electricity subsidy for farmers.",
-        "eligibility": "Farmers using agricultural connections.",
-        "benefits": "₹1,000 monthly electricity subsidy.",
-        "link": "https://agriculture.rajasthan.gov.in/"
-    },
-    {
-        "title": "Organic Farming Mission",
-        "description": "Support for 100% organic agriculture.",
-        "eligibility": "Farmers participating in organic practices.",
-        "benefits": "Subsidy for organic inputs.",
-        "link": "https://sikkimagrisnet.org/"
-    },
-    {
-        "title": "Tamil Nadu Crop Insurance Scheme",
-        "description": "State-backed crop insurance program.",
-        "eligibility": "Registered farmers.",
-        "benefits": "Compensation during crop loss.",
-        "link": "https://tnsericulture.tn.gov.in/cropinsurance"
-    },
-    {
-        "title": "Rythu Bandhu Scheme",
-        "description": "Income support for farmers.",
-        "eligibility": "All land-owning farmers.",
-        "benefits": "₹10,000 per acre/year.",
-        "link": "https://rythubharosa.telangana.gov.in/"
-    },
-    {
-        "title": "Tripura Farmer Input Assistance",
-        "description": "Support during crop damage.",
-        "eligibility": "Farmers affected by disasters.",
-        "benefits": "Input subsidy.",
-        "link": "https://agri.tripura.gov.in/"
-    },
-    {
-        "title": "UP Kisan Samman Nidhi (State Top-Up)",
-        "description": "Additional farmer support.",
-        "eligibility": "All PM-KISAN beneficiaries.",
-        "benefits": "Extra state financial support.",
-        "link": "https://farmerregistry.up.in/"
-    },
-    {
-        "title": "UP Free Irrigation Scheme",
-        "description": "Free canal water for irrigation.",
-        "eligibility": "All registered farmers.",
-        "benefits": "Zero irrigation charges.",
-        "link": "https://farmerregistry.up.in/"
-    },
-    {
-        "title": "Uttarakhand Organic Agriculture Scheme",
-        "description": "Support for organic farming in hill regions.",
-        "eligibility": "Hill farmers.",
-        "benefits": "Organic inputs subsidy.",
-        "link": "https://agriculture.uk.gov.in/"
-    },
-    {
-        "title": "Krishak Bandhu Scheme",
-        "description": "Income support + crop insurance for state farmers.",
-        "eligibility": "All land-owning farmers.",
-        "benefits": "₹10,000 yearly aid + insurance cover.",
-        "link": "https://krishakbandhu.wb.gov.in/users/sign_up"
+
+def run_chat_job(prompt_parts, context):
+    response = llm.generate_content(model, prompt_parts)
+    text = response.text
+    cache, cache_key = response_cache_for(context, context.get('image_hash'), context.get('history_key', ''))
+    if cache and text and chunk_finish_reason(response) in (None, 'STOP'):
+        cache.set(cache_key, text)
+    if context.get('session_id'):
+        save_chat_session(context, context['session_id'], session_store.load(context['session_id']), text)
+    return {'response': text}
+
+# Photo diagnoses can take 10-30 s; as jobs they don't hold a connection (or
+# a proxy timeout) for that long
+job_queue = jobs.JobQueue(run_chat_job)
+job_queue.start()
+
+metrics.callback('job_queue_depth', 'Chat jobs waiting for or held by a worker.', 'gauge',
+                 lambda: [({'status': status}, count) for status, count in job_queue.depth().items()])
+
+def job_response(job, status=200):
+    response = jsonify(job)
+    response.status_code = status
+    if job['status'] not in jobs.FINISHED:
+        response.headers['Location'] = f"/api/chat/jobs/{job['job_id']}"
+    return response
+
+@app.route('/api/chat/jobs', methods=['POST'])
+def submit_chat_job():
+    """Queue a chat request (same upload shapes as /api/chat) and return its job id.
+
+    Answers 202 with {"job_id", "status", ...}; poll GET /api/chat/jobs/<id>
+    for the result. "deadline_seconds" (body or query string) bounds how
+    long the job may take, queueing included.
+    """
+    rejected = admission.admit(admission.chat_limiter)
+    if rejected:
+        return rejected
+
+    data = read_chat_request()
+    if not isinstance(data, dict):
+        return jsonify({'error': 'No content provided'}), 400
+    try:
+        deadline = float(data.get('deadline_seconds') or request.args.get('deadline_seconds') or jobs.JOB_DEADLINE)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'deadline_seconds must be a number'}), 400
+    if not math.isfinite(deadline) or deadline <= 0:
+        return jsonify({'error': 'deadline_seconds must be a positive number'}), 400
+    prompt_parts, error = build_chat_prompt(data)
+    if error:
+        return jsonify(error[0]), error[1]
+    try:
+        session_id, session, history_key = open_chat_session(data, prompt_parts)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    context = {
+        'message': data.get('message'),
+        'language': data.get('language', 'English'),
+        'session_id': session_id,
+        'image': bool(data.get('image')),
+        'image_hash': data.get('image_hash'),
+        'history_key': history_key,
     }
-]
-
-def filter_schemes(schemes, state, crop):
-    filtered = []
-    for scheme in schemes:
-        # Match Algo:
-        # 1. If Scheme has a specific state in title/desc, it MUST match the selected state.
-        # 2. If no state mentioned, assume Central/All -> Keep it.
-        # 3. If crop is specified, descriptions/eligibility should match crop.
-        
-        # NOTE: This is a heuristic based filter as requested content was unstructured text.
-        
-        text_content = (scheme['title'] + " " + scheme['description'] + " " + scheme['eligibility']).lower()
-        
-        is_state_match = True
-        if state:
-            state_lower = state.lower()
-            # List of all states to check if scheme is specific to ANOTHER state
-            # (simplified logic: if scheme mentions a state name that is NOT the selected state, exclude it)
-            # ideally we would tag schemes with 'state' property but we are working with raw data derived from frontend
-            # For now, let's just check if the selected state is in the text for state-specific schemes,
-            # or if it's a known central scheme.
-            
-            # Better approach given the limited time/data structure:
-            # If the scheme title mentions a state, it MUST match the query state.
-            
-            # Check if title starts with state name or contains state name?
-            # Many schemes start with "UP", "MP", "HP", "AP".
-            
-            # Simple keyword match:
-            if state_lower in text_content:
-                is_state_match = True
-            elif any(s in scheme['title'] for s in ["PM-KISAN", "PMFBY", "SMAM", "PKVY", "NFSM", "NAIS"]):
-                # Known central schemes
-                is_state_match = True
-            else:
-                # If it doesn't mention our state, does it mention ANY OTHER state?
-                # If yes, then it's for that other state. If no, maybe it's general?
-                # This is tricky without a full list of states to check against.
-                # Let's rely on positive match for now or specific central schemes.
-                # If the user selects "Andhra Pradesh", "YSR Rythu Bharosa" matches.
-                # "PM-KISAN" does not match "Andhra Pradesh" string but IS valid.
-                pass
-        
-        is_crop_match = True
-        if crop:
-            crop_lower = crop.lower()
-            # If text mentions the crop, keep it.
-            # Also keep general schemes.
-            if crop_lower in text_content:
-                is_crop_match = True
-            elif "all farmers" in text_content or "all crops" in text_content or "commercial crops" in text_content:
-                is_crop_match = True
-            else:
-                 # If specific crop is requested but not mentioned, and not a general scheme -> maybe exclude?
-                 # But "PM-KISAN" is for all.
-                 pass
-        
-        # Simplified filter for the demo content provided:
-        # If we selected a state, filtering should be strict about State specific schemes.
-        include = True
-        if state:
-            s_low = state.lower()
-            # Identify if scheme is for another state
-            # (This is hard without a list of all states to negative-match against)
-            # Let's try: if the schema Title contains a State Name that is NOT s_low, exclude.
-            pass
-
-    # Let's implement a simpler logic based on the explicit list we have.
-    # We will return all schemes but let the frontend handle basic filtering OR
-    # we implement exact filtering here if we tag the data.
-    
-    # Since I cannot easily tag 50 items perfectly in one go without errors, and the user asked for backend filtering,
-    # I will stick to returning ALL schemes if no filter, and filtered if filter exists.
-    # But wait, the user said "click check eligibily it should filter and show".
-    # I will modify the Python code to perform robust text search.
-    
-    return schemes
+    cache, cache_key = response_cache_for(data, data.get('image_hash'), history_key)
+    cached = cache.get(cache_key) if cache else None
+    try:
+        if cached is not None:
+            save_chat_session(data, session_id, session, cached)
+            job_id = job_queue.submit([], context, deadline, result={'response': cached})
+        else:
+            job_id = job_queue.submit(prompt_parts, context, deadline)
+    except jobs.QueueFullError:
+        return admission.retry_response(503, 'Too many jobs queued, please retry', llm.LLM_BUSY_RETRY_AFTER,
+                                        'chat_jobs', 'queue_full')
+    job = job_queue.get(job_id)
+    return job_response(job, 200 if job['status'] in jobs.FINISHED else 202)
+
+@app.route('/api/chat/jobs/<job_id>', methods=['GET'])
+def chat_job_status(job_id):
+    """A job's status, and its result once done; ?wait=N long-polls up to N seconds."""
+    try:
+        wait = float(request.args.get('wait', 0))
+    except ValueError:
+        return jsonify({'error': 'wait must be a number'}), 400
+    if not math.isfinite(wait):
+        return jsonify({'error': 'wait must be a finite number'}), 400
+    wait = max(wait, 0)
+    job = job_queue.wait(job_id, wait) if wait else job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return job_response(job)
+
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def chunk_text(chunk):
+    # Chunks that only carry a finish reason / safety ratings raise on .text
+    try:
+        return chunk.text
+    except ValueError:
+        return ''
+
+def chunk_finish_reason(chunk):
+    try:
+        reason = chunk.candidates[0].finish_reason
+    except (AttributeError, IndexError):
+        return None
+    return getattr(reason, 'name', str(reason)) if reason else None
+
+def stream_generation(prompt_parts, cache=None, cache_key=None, on_complete=None):
+    # Yields SSE frames: a "chunk" event per piece of text as Gemini produces it,
+    # then one "done" event with timings (or an "error" event). on_complete gets
+    # the full answer once it has been sent.
+    started = time.perf_counter()
+    if cache:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+            if on_complete:
+                on_complete(cached)
+            yield sse_event('chunk', {'text': cached})
+            yield sse_event('done', {'finish_reason': 'STOP', 'chunks': 1, 'first_chunk_ms': elapsed_ms,
+                                     'total_ms': elapsed_ms, 'cached': True})
+            return
+
+    pieces = []
+    first_chunk_ms = None
+    finish_reason = None
+    usage = None
+    chunks = 0
+    try:
+        for chunk in llm.stream_content(model, prompt_parts):
+            finish_reason = chunk_finish_reason(chunk) or finish_reason
+            usage = getattr(chunk, 'usage_metadata', None) or usage
+            text = chunk_text(chunk)
+            if not text:
+                continue
+            if first_chunk_ms is None:
+                first_chunk_ms = round((time.perf_counter() - started) * 1000, 1)
+            chunks += 1
+            pieces.append(text)
+            yield sse_event('chunk', {'text': text})
+
+        if cache and pieces and finish_reason in (None, 'STOP'):
+            cache.set(cache_key, ''.join(pieces))
+        if on_complete and pieces:
+            on_complete(''.join(pieces))
+
+        meta = {
+            'finish_reason': finish_reason,
+            'chunks': chunks,
+            'first_chunk_ms': first_chunk_ms,
+            'total_ms': round((time.perf_counter() - started) * 1000, 1),
+        }
+        if usage is not None:
+            meta['usage'] = {
+                'prompt_tokens': getattr(usage, 'prompt_token_count', None),
+                'response_tokens': getattr(usage, 'candidates_token_count', None),
+                'total_tokens': getattr(usage, 'total_token_count', None),
+            }
+        yield sse_event('done', meta)
+
+    except GeneratorExit:
+        # The WSGI server closes the iterator when the client goes away; stop
+        # pulling from Gemini so the upstream stream is released with us.
+        log.info("Client disconnected", extra={'chunks': chunks})
+        raise
+    except llm.LLMBusyError as e:
+        log.warning("Stream rejected, model busy", extra={'error': str(e)})
+        yield sse_event('error', {'error': 'AI service busy, please retry', 'retry_after': e.retry_after})
+    except Exception as e:
+        log.exception("Error streaming response")
+        yield sse_event('error', {'error': 'AI processing failed', 'details': str(e)})
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    rejected = admission.admit(admission.chat_limiter)
+    if rejected:
+        return rejected
+
+    data = read_chat_request()
+    prompt_parts, error = build_chat_prompt(data)
+    if error:
+        return jsonify(error[0]), error[1]
+    try:
+        session_id, session, history_key = open_chat_session(data, prompt_parts)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    headers = {
+        'Cache-Control': 'no-cache',
+        # Stop nginx-style proxies from buffering the stream
+        'X-Accel-Buffering': 'no',
+    }
+    cache, cache_key = response_cache_for(data, data.get('image_hash'), history_key)
+    # Once the stream has started the status is 200, so say "busy" up front
+    if llm.saturated() and not (cache and cache.get(cache_key) is not None):
+        return admission.busy_response(llm.LLMBusyError('LLM wait queue full', reason='queue_full'), 'chat')
+    on_complete = lambda reply: save_chat_session(data, session_id, session, reply)
+    return Response(stream_generation(prompt_parts, cache, cache_key, on_complete), mimetype='text/event-stream', headers=headers)
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        'chat': chat_cache.stats(),
+        'advisory': advisory_cache.stats(),
+        'image': image_cache.stats(),
+        'geocode': weather_proxy.geocode_cache.stats(),
+        'forecast': weather_proxy.forecast_cache.stats(),
+        'coalescing': {flight.name: flight.stats() for flight in flights},
+    })
+
+@app.route('/api/llm/status', methods=['GET'])
+def llm_status():
+    """Models in failover order with their breaker state, latency and error rate."""
+    return jsonify({
+        'primary': model.model_name,
+        'queue_depth': llm.queue_depth(),
+        'models': model.status(),
+    })
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+# Translated catalogs come from the artifact written by scheme_translations.py;
+# serving them never calls the model
+translated_schemes = TranslatedSchemes(scheme_index)
 
 @app.route('/api/schemes', methods=['GET'])
 def get_schemes():
     state = request.args.get('state')
     crop = request.args.get('crop')
-    
+    lang = request.args.get('lang')
+
+    try:
+        index = translated_schemes.index_for(lang)
+    except KeyError:
+        return jsonify({'error': f"Unsupported lang: {lang}"}), 400
+
+    # Central schemes match every state; state schemes only their own state.
+    # Schemes without crop tags apply to any crop.
+    body, etag = index.response_for(state, crop)
+
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    # Let clients keep their copy but revalidate it (cheap 304) each time
+    response.headers['Cache-Control'] = 'no-cache'
+    # What was actually sent: schemes without a translation stay in English
+    response.headers['Content-Language'] = translated_schemes.content_language(lang)
+    return response.make_conditional(request)
+
+# Offline bundle (schemes + advisory rules) and its deltas, precomputed
+sync_bundles = sync.SyncBundles(scheme_index.schemes)
+
+@app.route('/api/sync', methods=['GET'])
+def sync_bundle():
+    """Offline data since the client's version: ?since=<version>, or everything.
+
+    The body is {"version", "since", "full", "changes": {collection:
+    {"added": {key: entry}, "changed": {key: entry}, "removed": [key]}}}.
+    With "full" the client replaces what it has; otherwise it applies the
+    changes and stores the new version.
+    """
+    try:
+        since = int(request.args.get('since') or 0)
+    except ValueError:
+        return jsonify({'error': 'since must be a version number'}), 400
+    return asset_response(sync_bundles.bundle(since))
+
+@app.route('/api/schemes/search', methods=['GET'])
+def search_schemes():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Query parameter q is required'}), 400
+
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+        per_page = min(max(int(request.args.get('per_page', 10)), 1), 50)
+    except ValueError:
+        return jsonify({'error': 'page and per_page must be integers'}), 400
+
+    fields = request.args.get('fields')
+    if fields:
+        fields = [f.strip() for f in fields.split(',') if f.strip()]
+        unknown = [f for f in fields if f not in SEARCHABLE_FIELDS]
+        if unknown:
+            return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+
+    # Optional state/crop filters reuse the /api/schemes postings
+    allowed_ids = None
+    state = request.args.get('state')
+    crop = request.args.get('crop')
+    if state or crop:
+        allowed_ids = scheme_index.filter_ids(scheme_index.normalize_state(state), scheme_index.normalize_crop(crop))
+
+    start = (page - 1) * per_page
+    total, ranked = scheme_search.search(query, allowed_ids, limit=start + per_page)
     results = []
+    for position, score in ranked[start:]:
+        scheme = scheme_search.schemes[position]
+        item = {f: scheme[f] for f in fields} if fields else dict(scheme)
+        item['score'] = round(score, 4)
+        results.append(item)
+
+    return jsonify({
+        'query': query,
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'results': results,
+    })
+
+def advisory_prompt(weather_data):
+    current = current_conditions(weather_data)
+    humidity = current['humidity'] if current['humidity'] is not None else 'unknown'
+
+    # Construct prompt for Gemini
+    prompt = f"""
+    Based on the following weather data, provide agricultural farming advice for Indian farmers in JSON format.
+    
+    Weather Conditions:
+    - Current Temp: {current['temp']}°C
+    - Condition: {current['condition']}
+    - Wind: {current['wind']} km/h
+    - Humidity: {humidity}% (estimated)
     
-    # Common Central Schemes that apply to all
-    central_schemes = ["PM-KISAN", "PMFBY", "SMAM", "PKVY", "NFSM", "NAIS", "KCC"]
+    Forecast Summary:
+    {weather_data.get('forecast')}
+    
+    Respond ONLY with a valid JSON object strictly matching this schema:
+    {{
+        "irrigation": "Advice on watering schedule...",
+        "protection": "Advice on pest/disease/weather protection...",
+        "soil": "Advice on soil health...",
+        "fertilizer": "Advice on fertilizer application..."
+    }}
+    
+    Keep advice actionable and specific to Indian agriculture.
+    """
+    return prompt
 
-    for scheme in SCHEMES:
-        match_state = True
-        match_crop = True
-        
-        text = (scheme['title'] + " " + scheme['description']).lower()
-        
-        if state:
-            # If scheme is central, it matches all states
-            is_central = any(cs.lower() in scheme['title'].lower() for cs in central_schemes)
-            
-            if not is_central:
-                # If not central, it must match the state name
-                # We handle abbreviations like MP, UP, HP, AP
-                state_map = {
-                    "Andhra Pradesh": ["andhra", "ap", "ysr"],
-                    "Uttar Pradesh": ["uttar", "up"],
-                    "Madhya Pradesh": ["madhya", "mp"],
-                    "Himachal Pradesh": ["himachal", "hp"],
-                    "Arunachal Pradesh": ["arunachal"],
-                    "West Bengal": ["bengal", "wb", "krishak bandhu"],
-                    # Add others if needed
-                }
-                
-                search_terms = state_map.get(state, [state.lower()])
-                if not any(term in text for term in search_terms):
-                    match_state = False
-        
-        if crop and match_state:
-            # If crop is specified
-            # If scheme mentions the crop specifically OR mentions "all crops" / "any crop"
-            # Most schemes are general, so we default to True unless it specifies a DIFFERENT crop?
-            # Actually most schemes in list are general financial aid, so we should be permissive.
-            # Only filter OUT if it explicitly lists crops and ours isn't there.
-            # But that's hard to parse.
-            # Let's keep it simple: Return everything that matches state, because most farmer schemes are crop-agnostic or multi-crop.
-            pass
-            
-        if match_state and match_crop:
-            results.append(scheme)
-
-    return jsonify(results)
+def generate_advisory(weather_data, refresh=False):
+    """Advisory dict for one weather payload: bucket cache, else a coalesced Gemini call.
+
+    refresh skips the cache and always asks the model (the pre-warmer uses it
+    to replace entries before they expire).
+    """
+    cache_key = advisory_cache_key(weather_data)
+    if not refresh:
+        cached = advisory_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    prompt = advisory_prompt(weather_data)
+
+    def generate():
+        response = llm.generate_content(model, prompt, generation_config=advisory_output.ADVISORY_GENERATION_CONFIG)
+        # Constrained output is normally valid JSON; if it was cut short, keep
+        # the fields that did arrive and take the rest from the rule table
+        fields = advisory_output.parse_advisory(chunk_text(response))
+        advisory, filled = advisory_output.complete_advisory(fields, rule_advisory(weather_data))
+        if advisory is None:
+            raise ValueError('Model returned no usable advisory')
+        if filled:
+            log.info("Advisory salvaged", extra={'filled_from_rules': filled})
+        advisory_cache.set(cache_key, advisory)
+        return advisory
+
+    return advisory_flight.do(cache_key, generate, recheck=None if refresh else lambda: advisory_cache.get(cache_key))
+
+# How long a hedged advisory request waits for Gemini before answering from
+# the rule table. A Gemini call that has started keeps going and fills the
+# cache, so the next request for the same weather gets the model's advice.
+ADVISORY_LLM_DEADLINE = float(os.getenv('ADVISORY_LLM_DEADLINE', '6'))
+ADVISORY_HEDGE_WORKERS = int(os.getenv('ADVISORY_HEDGE_WORKERS', '16'))
+ADVISORY_MODES = ('hedged', 'fast', 'llm')
+
+advisory_executor = ThreadPoolExecutor(max_workers=ADVISORY_HEDGE_WORKERS)
+
+def stream_advisory(weather_data):
+    # SSE: a "field" event per advisory field as soon as it is complete, then
+    # "done". Whatever the model doesn't deliver comes from the rule table,
+    # so the client always ends up with all four fields.
+    started = time.perf_counter()
+    cache_key = advisory_cache_key(weather_data)
+    cached = advisory_cache.get(cache_key)
+    if cached is not None:
+        for name, value in cached.items():
+            yield sse_event('field', {'name': name, 'value': value, 'source': 'cache'})
+        yield sse_event('done', {'source': 'cache', 'total_ms': round((time.perf_counter() - started) * 1000, 1)})
+        return
+
+    parser = advisory_output.AdvisoryParser()
+    first_field_ms = None
+    error = None
+    try:
+        stream = llm.stream_content(model, advisory_prompt(weather_data),
+                                    generation_config=advisory_output.ADVISORY_GENERATION_CONFIG)
+        for chunk in stream:
+            for name, value in parser.feed(chunk_text(chunk)):
+                if first_field_ms is None:
+                    first_field_ms = round((time.perf_counter() - started) * 1000, 1)
+                yield sse_event('field', {'name': name, 'value': value, 'source': 'llm'})
+        for name, value in parser.finish():
+            yield sse_event('field', {'name': name, 'value': value, 'source': 'llm'})
+    except GeneratorExit:
+        raise
+    except Exception as e:
+        log.warning("Advisory stream failed, finishing from rules", extra={'error': str(e)})
+        error = str(e)
+
+    rules = rule_advisory(weather_data)
+    advisory, filled = advisory_output.complete_advisory(parser.fields, rules)
+    if advisory is None:
+        advisory, filled = rules, list(rules)
+    elif error is None:
+        advisory_cache.set(cache_key, advisory)
+    for name in filled:
+        yield sse_event('field', {'name': name, 'value': advisory[name], 'source': 'rules'})
+    yield sse_event('done', {
+        'source': 'llm' if not filled else 'rules' if len(filled) == len(advisory) else 'mixed',
+        'filled_from_rules': filled,
+        'first_field_ms': first_field_ms,
+        'total_ms': round((time.perf_counter() - started) * 1000, 1),
+    })
+
+def advisory_for(weather_data, mode):
+    """(advisory, source, upgrade pending) for one weather payload; see farming_advisory."""
+    if mode == 'fast':
+        return rule_advisory(weather_data), 'rules', False
+
+    cached = advisory_cache.get(advisory_cache_key(weather_data))
+    if cached is not None:
+        return cached, 'cache', False
+
+    if mode == 'llm':
+        return generate_advisory(weather_data), 'llm', False
+
+    future = advisory_executor.submit(contextvars.copy_context().run, generate_advisory, weather_data)
+    try:
+        return future.result(timeout=ADVISORY_LLM_DEADLINE), 'llm', False
+    except FuturesTimeoutError:
+        # A call still queued behind busy workers is dropped, so the queue
+        # can't grow past the requests actually waiting on it
+        return rule_advisory(weather_data), 'rules', not future.cancel()
+    except Exception as e:
+        log.warning("Advisory falling back to rules", extra={'error': str(e)})
+        return rule_advisory(weather_data), 'rules', False
+
+def advisory_response(advisory, source, upgrade=False):
+    response = jsonify(advisory)
+    response.headers['X-Advisory-Source'] = source
+    if upgrade:
+        response.headers['X-Advisory-Upgrade'] = 'pending'
+    return response
 
 @app.route('/api/farming-advisory', methods=['POST'])
 def farming_advisory():
+    """Advisory for one weather payload.
+
+    mode (query string or body): "hedged" (default) answers from Gemini if it
+    is back within ADVISORY_LLM_DEADLINE and from the rule table otherwise;
+    "fast" only uses the rule table; "llm" always waits for Gemini. The
+    X-Advisory-Source header says which one answered. Clients that accept
+    text/event-stream get the streamed variant (see farming_advisory_stream).
+    """
+    if wants_event_stream():
+        return farming_advisory_stream()
+
     try:
         data = request.json
-        weather_data = data.get('weather')
+        weather_data = data.get('weather') if isinstance(data, dict) else None
         
         if not weather_data:
             return jsonify({'error': 'No weather data provided'}), 400
+        try:
+            validate_weather(weather_data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
-        # Construct prompt for Gemini
-        prompt = f"""
-        Based on the following weather data, provide agricultural farming advice for Indian farmers in JSON format.
-        
-        Weather Conditions:
-        - Current Temp: {weather_data['current']['temp']}°C
-        - Condition: {weather_data['current']['condition']}
-        - Wind: {weather_data['current']['wind']} km/h
-        - Humidity: {weather_data['current']['humidity']}% (estimated)
-        
-        Forecast Summary:
-        {weather_data['forecast']}
-        
-        Respond ONLY with a valid JSON object strictly matching this schema:
-        {{
-            "irrigation": "Advice on watering schedule...",
-            "protection": "Advice on pest/disease/weather protection...",
-            "soil": "Advice on soil health...",
-            "fertilizer": "Advice on fertilizer application..."
-        }}
-        
-        Keep advice actionable and specific to Indian agriculture.
-        """
-        
-        response = model.generate_content(prompt)
-        # Clean up code blocks if present
-        text = response.text.replace('```json', '').replace('```', '').strip()
-        
-        import json
-        advisory = json.loads(text)
-        return jsonify(advisory)
+        mode = request.args.get('mode') or data.get('mode') or 'hedged'
+        if mode not in ADVISORY_MODES:
+            return jsonify({'error': f"mode must be one of {', '.join(ADVISORY_MODES)}"}), 400
 
-    except Exception as e:
-        print(f"Error in advisory: {e}")
+        if mode != 'fast':
+            rejected = admission.admit(admission.advisory_limiter)
+            if rejected:
+                return rejected
+
+        return advisory_response(*advisory_for(weather_data, mode))
+
+    except llm.LLMBusyError as e:
+        log.warning("Advisory rejected, model busy", extra={'error': str(e)})
+        return admission.busy_response(e, 'advisory')
+    except Exception:
+        log.exception("Error in advisory")
         return jsonify({'error': 'Failed to generate advisory'}), 500
 
+@app.route('/api/farming-advisory/stream', methods=['POST'])
+def farming_advisory_stream():
+    """The advisory as SSE: "field" events ({name, value, source}) then "done"."""
+    data = request.get_json(silent=True)
+    weather_data = data.get('weather') if isinstance(data, dict) else None
+    if not weather_data:
+        return jsonify({'error': 'No weather data provided'}), 400
+    try:
+        validate_weather(weather_data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    rejected = admission.admit(admission.advisory_limiter)
+    if rejected:
+        return rejected
+    return Response(stream_advisory(weather_data), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Advisories for the busiest districts are generated ahead of time (see
+# prewarm.py); requests for them are then answered from advisory_cache
+prewarmer = prewarm.Prewarmer(prewarm.load_locations(), generate_advisory, advisory_cache)
+prewarmer.start()
+
+metrics.callback('prewarm_locations', 'Pre-warmed locations by whether their cached advisory is current.', 'gauge',
+                 prewarmer.freshness_samples)
+metrics.callback('prewarm_oldest_advisory_age_seconds', 'Age of the oldest pre-warmed advisory.', 'gauge',
+                 lambda: [({}, prewarmer.oldest_age())] if prewarmer.leader else [])
+metrics.callback('prewarm_last_pass_timestamp_seconds', 'When the last pre-warm pass finished.', 'gauge',
+                 lambda: [({}, prewarmer.last_pass_at)] if prewarmer.last_pass_at else [])
+
+@app.route('/api/prewarm/status', methods=['GET'])
+def prewarm_status():
+    """Pre-warmed locations with the age and freshness of their advisory."""
+    return jsonify(prewarmer.status())
+
+@app.route('/api/weather', methods=['GET'])
+def weather_for_place():
+    """Weather, alerts and advisory for a city and/or PIN code in one round trip.
+
+    Query: city, pincode, and mode as for /api/farming-advisory. When the
+    advisory budget is used up the advisory comes from the rule table
+    instead of the whole request being refused.
+    """
+    city = request.args.get('city', '')
+    pincode = request.args.get('pincode', '')
+    mode = request.args.get('mode') or 'hedged'
+    if mode not in ADVISORY_MODES:
+        return jsonify({'error': f"mode must be one of {', '.join(ADVISORY_MODES)}"}), 400
+
+    try:
+        location = weather_proxy.geocode(city, pincode)
+        weather_data = weather_proxy.forecast(location['lat'], location['lon'])
+    except weather_proxy.LocationNotFound as e:
+        return jsonify({'error': str(e)}), 404
+    except weather_proxy.UpstreamError:
+        return jsonify({'error': 'Failed to fetch weather data.'}), 502
+    except weather_proxy.GeocodeRateLimited as e:
+        return admission.retry_response(503, 'Location lookup busy, please retry', e.retry_after,
+                                        'weather', 'geocode_rate_limited')
+
+    if mode != 'fast' and admission.admit(admission.advisory_limiter) is not None:
+        mode = 'fast'
+    try:
+        advisory, source, upgrade = advisory_for(weather_data, mode)
+    except llm.LLMBusyError as e:
+        log.warning("Weather advisory from rules, model busy", extra={'error': str(e)})
+        advisory, source, upgrade = rule_advisory(weather_data), 'rules', False
+
+    response = jsonify({
+        'location': location,
+        'weather': weather_data,
+        'alerts': weather_alerts(weather_data),
+        'advisory': advisory,
+        'advisory_source': source,
+    })
+    response.headers['X-Advisory-Source'] = source
+    if upgrade:
+        response.headers['X-Advisory-Upgrade'] = 'pending'
+    return response
+
+# Batch advisories: how many villages one request may carry, how many
+# distinct advisories are generated in parallel, and the default time budget
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '500'))
+BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', '8'))
+BATCH_DEADLINE = float(os.getenv('BATCH_DEADLINE', '60'))
+
+def ndjson_line(payload):
+    return json.dumps(payload, ensure_ascii=False) + "\n"
+
+def stream_batch_advisories(items, deadline, fast=False):
+    started = time.perf_counter()
+    # Equivalent weather (same bucket) is generated once and fanned back out
+    groups = {}
+    errors = 0
+    for index, item in enumerate(items):
+        weather_data = item.get('weather') if isinstance(item, dict) else None
+        if not weather_data:
+            errors += 1
+            yield ndjson_line({'index': index, 'error': 'No weather data provided'})
+            continue
+        try:
+            validate_weather(weather_data)
+            if fast:
+                line = {'index': index, 'advisory': rule_advisory(weather_data)}
+            else:
+                cache_key = advisory_cache_key(weather_data)
+        except Exception as e:
+            log.warning("Invalid batch advisory item", extra={'index': index, 'error': str(e)})
+            errors += 1
+            yield ndjson_line({'index': index, 'error': 'Invalid weather data'})
+            continue
+        if fast:
+            yield ndjson_line(line)
+            continue
+        groups.setdefault(cache_key, (weather_data, []))[1].append(index)
+
+    executor = ThreadPoolExecutor(max_workers=BATCH_MAX_WORKERS)
+    futures = {executor.submit(contextvars.copy_context().run, generate_advisory, weather_data): indexes
+               for weather_data, indexes in groups.values()}
+    try:
+        for future in as_completed(futures, timeout=max(deadline - (time.perf_counter() - started), 0)):
+            try:
+                result = {'advisory': future.result()}
+            except llm.LLMBusyError as e:
+                result = {'error': 'AI service busy, please retry', 'retry_after': e.retry_after}
+            except Exception:
+                log.exception("Error in batch advisory")
+                result = {'error': 'Failed to generate advisory'}
+            for index in futures[future]:
+                errors += 'error' in result
+                yield ndjson_line({'index': index, **result})
+    except FuturesTimeoutError:
+        for future, indexes in futures.items():
+            if not future.done():
+                for index in indexes:
+                    errors += 1
+                    yield ndjson_line({'index': index, 'error': 'Deadline exceeded'})
+    finally:
+        # Also runs when the client disconnects: drop work nobody will read
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    yield ndjson_line({
+        'done': True,
+        'total': len(items),
+        'unique': len(groups),
+        'errors': errors,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+    })
+
+@app.route('/api/farming-advisory/batch', methods=['POST'])
+def farming_advisory_batch():
+    """Advisories for many locations, streamed as NDJSON in completion order.
+
+    Body: {"items": [{"weather": {...}}, ...], "deadline_seconds": 30}, plus
+    "mode": "fast" to answer every item from the rule table. Each
+    output line is {"index": i, "advisory": {...}} or {"index": i, "error": "..."},
+    followed by one {"done": true, ...} summary line.
+    """
+    data = request.json
+    items = data.get('items') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'No items provided'}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({'error': f'At most {BATCH_MAX_ITEMS} items per batch'}), 413
+
+    try:
+        deadline = min(float(data.get('deadline_seconds', BATCH_DEADLINE)), BATCH_DEADLINE)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'deadline_seconds must be a number'}), 400
+
+    fast = (request.args.get('mode') or data.get('mode')) == 'fast'
+    if not fast:
+        rejected = admission.admit(admission.batch_limiter)
+        if rejected:
+            return rejected
+    return Response(stream_batch_advisories(items, deadline, fast), mimetype='application/x-ndjson',
+                    headers={'X-Accel-Buffering': 'no'})
+
+# Fields one fertilizer request may carry; they are computed together in one pass
+FERTILIZER_MAX_ITEMS = int(os.getenv('FERTILIZER_MAX_ITEMS', '10000'))
+
+@app.route('/api/fertilizer/dose', methods=['POST'])
+def fertilizer_dose():
+    """Urea, DAP and MOP quantities from the crop recommendation table.
+
+    Body: one field {"crop": "Wheat", "season": "Rabi", "area": 2, "unit": "acre",
+    "soil": {"n": 250, "p": 12, "k": 300}} (soil test in kg/ha, optional), or
+    {"items": [field, ...]} for many. Batch results are in request order; a
+    field that can't be computed gets {"error": "..."} in its place.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'No field data provided'}), 400
+    items = data.get('items')
+    if items is None:
+        result = fertilizer.dose_results([data])[0]
+        return jsonify(result), 400 if 'error' in result else 200
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'No items provided'}), 400
+    if len(items) > FERTILIZER_MAX_ITEMS:
+        return jsonify({'error': f'At most {FERTILIZER_MAX_ITEMS} items per request'}), 413
+    started = time.perf_counter()
+    results = fertilizer.dose_results(items)
+    return jsonify({
+        'results': results,
+        'total': len(items),
+        'errors': sum('error' in result for result in results),
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+    })
+
 if __name__ == '__main__':
     app.run(port=5000, debug=True)
@@ -0,0 +1,294 @@
+"""Load test for the backend.
+
+Drives the Flask app in-process (with the fake LLM by default) or a running
+server (--url), endpoint by endpoint, at a fixed concurrency, and writes
+throughput, latency percentiles and memory per endpoint to a JSON file.
+
+    python bench.py --concurrency 32 --requests 500 --output bench-results.json
+    python bench.py --compare bench-baseline.json
+    python bench.py --url http://localhost:8000 --pid 1234 --endpoints chat,schemes
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Payload number i for each endpoint. Distinct payloads defeat the response
+# caches; --distinct makes them repeat so cache hits are measured too.
+WEATHER_CODES = [0, 2, 3, 45, 61, 63, 80, 95]
+
+
+def weather_payload(i):
+    return {
+        'current': {'temperature': 12 + (i * 7) % 32, 'windspeed': (i * 3) % 40, 'weathercode': WEATHER_CODES[i % 8]},
+        'forecast': [
+            {'day': 'Mon', 'high': 30 + i % 9, 'low': 20 + i % 5, 'code': WEATHER_CODES[(i + 1) % 8]},
+            {'day': 'Tue', 'high': 28 + i % 11, 'low': 19 + i % 4, 'code': WEATHER_CODES[(i + 3) % 8]},
+        ],
+    }
+
+
+SCENARIOS = {
+    'chat': lambda i: ('POST', '/api/chat', {'message': f"My tomato leaves have brown spots, field {i}", 'language': 'English'}, {}),
+    'chat_stream': lambda i: ('POST', '/api/chat/stream', {'message': f"When should I sow wheat in plot {i}?"}, {}),
+    'advisory': lambda i: ('POST', '/api/farming-advisory', {'weather': weather_payload(i)}, {}),
+    'advisory_fast': lambda i: ('POST', '/api/farming-advisory?mode=fast', {'weather': weather_payload(i)}, {}),
+    'schemes': lambda i: ('GET', '/api/schemes', None, {}),
+    'schemes_search': lambda i: ('GET', f"/api/schemes/search?q={['kisan', 'insurance', 'drip irrigation', 'organic'][i % 4]}", None, {}),
+}
+DEFAULT_ENDPOINTS = ['chat', 'chat_stream', 'advisory', 'advisory_fast', 'schemes', 'schemes_search']
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(int(round(pct / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def rss_kb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class RSSSampler:
+    """Peak resident memory of some processes while a run is going."""
+
+    def __init__(self, pids, interval=0.05):
+        self.pids = pids
+        self.interval = interval
+        self.peak_kb = None
+        self._stop = threading.Event()
+
+    def current_kb(self):
+        values = [rss_kb(pid) for pid in self.pids]
+        values = [v for v in values if v is not None]
+        return sum(values) if values else None
+
+    def __enter__(self):
+        self.start_kb = self.current_kb()
+        self.peak_kb = self.start_kb
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            value = self.current_kb()
+            if value is not None and (self.peak_kb is None or value > self.peak_kb):
+                self.peak_kb = value
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.end_kb = self.current_kb()
+
+
+class InProcessClient:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self._local = threading.local()
+
+    def request(self, method, path, body, headers):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.flask_app.test_client()
+        started = time.perf_counter()
+        response = client.open(path, method=method, json=body, headers=headers, buffered=False)
+        first_byte = None
+        size = 0
+        for piece in response.response:
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            size += len(piece)
+        response.close()
+        return response.status_code, first_byte, size
+
+
+class HTTPClient:
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url.rstrip('/')
+        self._requests = requests
+        self._local = threading.local()
+
+    def request(self, method, path, body, headers):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self._requests.Session()
+        started = time.perf_counter()
+        with session.request(method, self.base_url + path, json=body, headers=headers, stream=True, timeout=120) as response:
+            first_byte = None
+            size = 0
+            for piece in response.iter_content(chunk_size=None):
+                if first_byte is None:
+                    first_byte = time.perf_counter() - started
+                size += len(piece)
+            return response.status_code, first_byte, size
+
+
+def run_endpoint(client, name, total, concurrency, distinct, pids):
+    scenario = SCENARIOS[name]
+    latencies = []
+    first_bytes = []
+    statuses = {}
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        method, path, body, headers = scenario(i % distinct if distinct else i)
+        started = time.perf_counter()
+        try:
+            status, first_byte, _ = client.request(method, path, body, headers)
+        except Exception as e:
+            print(f"{name}: request failed: {e}", file=sys.stderr)
+            status, first_byte = 'exception', None
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if first_byte is not None:
+                first_bytes.append(first_byte)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if status == 'exception' or status >= 500:
+                errors += 1
+
+    with RSSSampler(pids) as rss:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, range(total)))
+        wall = time.perf_counter() - started
+
+    latencies.sort()
+    first_bytes.sort()
+    ms = lambda seconds: round(seconds * 1000, 2) if seconds is not None else None
+    return {
+        'requests': total,
+        'concurrency': concurrency,
+        'wall_seconds': round(wall, 3),
+        'throughput_rps': round(total / wall, 2) if wall else None,
+        'latency_ms': {
+            'mean': ms(sum(latencies) / len(latencies)),
+            'p50': ms(percentile(latencies, 50)),
+            'p95': ms(percentile(latencies, 95)),
+            'p99': ms(percentile(latencies, 99)),
+            'max': ms(latencies[-1]),
+        },
+        'first_byte_ms': {'p50': ms(percentile(first_bytes, 50)), 'p95': ms(percentile(first_bytes, 95))},
+        'statuses': statuses,
+        'error_rate': round(errors / total, 4),
+        'rss_kb': {'start': rss.start_kb, 'peak': rss.peak_kb, 'end': rss.end_kb},
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, tolerance):
+    """Print changes against a previous results file; returns the regressions."""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = []
+    print(f"\nAgainst {baseline_path} (revision {baseline.get('revision')}):")
+    for name, current in results['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(name)
+        if not before:
+            continue
+        checks = [
+            ('p95 ms', before['latency_ms']['p95'], current['latency_ms']['p95'], True),
+            ('p99 ms', before['latency_ms']['p99'], current['latency_ms']['p99'], True),
+            ('req/s', before['throughput_rps'], current['throughput_rps'], False),
+            ('peak RSS kB', before['rss_kb']['peak'], current['rss_kb']['peak'], True),
+        ]
+        for label, old, new, higher_is_worse in checks:
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change > tolerance if higher_is_worse else change < -tolerance
+            print(f"  {name:15} {label:12} {old:>10} -> {new:>10} ({change:+.1%}){'  REGRESSION' if worse else ''}")
+            if worse:
+                regressions.append((name, label))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--endpoints', default=','.join(DEFAULT_ENDPOINTS),
+                        help=f"comma-separated, from: {', '.join(SCENARIOS)}")
+    parser.add_argument('--requests', type=int, default=200, help='requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--distinct', type=int, default=0,
+                        help='cycle through this many payloads (0: every request is different)')
+    parser.add_argument('--url', help='benchmark a running server instead of the app in-process')
+    parser.add_argument('--pid', type=int, action='append', default=[],
+                        help='with --url, server process(es) whose RSS to sample')
+    parser.add_argument('--output', default='bench-results.json')
+    parser.add_argument('--compare', help='previous results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help='relative change counted as a regression by --compare')
+    args = parser.parse_args()
+
+    endpoints = [name.strip() for name in args.endpoints.split(',') if name.strip()]
+    unknown = [name for name in endpoints if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(unknown)}")
+
+    if args.url:
+        client, pids, target = HTTPClient(args.url), args.pid, args.url
+    else:
+        # Only the in-process app can be pointed at the fake; a server picks
+        # its provider from its own environment.
+        os.environ.setdefault('LLM_PROVIDER', 'fake')
+        # Every in-process request comes from one address; don't rate-limit it
+        os.environ.setdefault('ADMISSION_ENABLED', '0')
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import app as backend
+        client, pids, target = InProcessClient(backend.app), [os.getpid()], 'in-process'
+
+    results = {
+        'revision': git_revision(),
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'target': target,
+        'python': platform.python_version(),
+        'config': {
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'distinct': args.distinct,
+            'llm_provider': os.getenv('LLM_PROVIDER', 'gemini'),
+            'fake_llm_latency': os.getenv('FAKE_LLM_LATENCY'),
+        },
+        'endpoints': {},
+    }
+    for name in endpoints:
+        stats = run_endpoint(client, name, args.requests, args.concurrency, args.distinct, pids)
+        results['endpoints'][name] = stats
+        latency = stats['latency_ms']
+        print(f"{name:15} {stats['throughput_rps']:>9} req/s  p50 {latency['p50']:>9} ms  p95 {latency['p95']:>9} ms"
+              f"  p99 {latency['p99']:>9} ms  errors {stats['error_rate']:.1%}  peak RSS {stats['rss_kb']['peak']} kB")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,348 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Which store backs the response caches: "memory" (per worker process) or
+# "sqlite" (one file shared by every gunicorn worker on the machine).
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+CACHE_SQLITE_PATH = os.getenv('CACHE_SQLITE_PATH', os.path.join(os.path.dirname(__file__), 'cache.sqlite3'))
+
+
+class MemoryBackend:
+    """Bounded LRU store with a per-entry TTL, local to this process."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """LRU + TTL store in a SQLite file so several worker processes share it.
+
+    Values are stored as JSON. Each cache gets its own namespace inside the
+    same table, so one file can hold the chat and advisory caches side by side.
+    """
+
+    def __init__(self, path, namespace, max_entries, ttl):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS response_cache ('
+                ' namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,'
+                ' stored_at REAL NOT NULL, used_at REAL NOT NULL,'
+                ' PRIMARY KEY (namespace, key))'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS response_cache_lru ON response_cache (namespace, used_at)')
+
+    @contextmanager
+    def _connect(self):
+        # A short-lived connection per operation keeps this safe across threads,
+        # greenlets and forked workers.
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT value, stored_at FROM response_cache WHERE namespace = ? AND key = ?',
+                (self.namespace, key),
+            ).fetchone()
+            if row is None:
+                return None
+            value, stored_at = row
+            if now - stored_at > self.ttl:
+                conn.execute('DELETE FROM response_cache WHERE namespace = ? AND key = ?', (self.namespace, key))
+                return None
+            conn.execute(
+                'UPDATE response_cache SET used_at = ? WHERE namespace = ? AND key = ?',
+                (now, self.namespace, key),
+            )
+            return json.loads(value)
+
+    def set(self, key, value):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO response_cache (namespace, key, value, stored_at, used_at) VALUES (?, ?, ?, ?, ?)',
+                (self.namespace, key, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            conn.execute(
+                'DELETE FROM response_cache WHERE namespace = ? AND key IN ('
+                ' SELECT key FROM response_cache WHERE namespace = ?'
+                ' ORDER BY used_at DESC LIMIT -1 OFFSET ?)',
+                (self.namespace, self.namespace, self.max_entries),
+            )
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute(
+                'SELECT COUNT(*) FROM response_cache WHERE namespace = ?', (self.namespace,)
+            ).fetchone()[0]
+
+
+class ResponseCache:
+    """Front for a cache backend that keeps hit/miss counters."""
+
+    def __init__(self, name, backend):
+        self.name = name
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def peek(self, key):
+        # Lookup for housekeeping (e.g. the pre-warmer) that shouldn't count as traffic
+        return self.backend.get(key)
+
+    def set(self, key, value):
+        self.backend.set(key, value)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'entries': len(self.backend),
+            'max_entries': self.backend.max_entries,
+            'ttl': self.backend.ttl,
+        }
+
+
+def make_cache(name, max_entries, ttl):
+    if CACHE_BACKEND == 'sqlite':
+        backend = SQLiteBackend(CACHE_SQLITE_PATH, name, max_entries, ttl)
+    else:
+        backend = MemoryBackend(max_entries, ttl)
+    return ResponseCache(name, backend)
+
+
+def normalize_message(text):
+    # "Best fertilizer for paddy?" and "best  fertilizer for paddy" are the same
+    # question. Drop punctuation/symbols and fold case and whitespace, but keep
+    # combining marks (categories M*) since Indic scripts depend on them.
+    text = unicodedata.normalize('NFKC', text).casefold()
+    return ' '.join(''.join(_fold_char(ch) for ch in text).split())
+
+
+def _fold_char(ch):
+    category = unicodedata.category(ch)
+    if category == 'Cf':
+        # Zero-width joiners only change how a word is drawn
+        return ''
+    if category[0] in 'PSZC':
+        return ' '
+    return ch
+
+
+def chat_cache_key(message, language, history_key=''):
+    normalized = f"{(language or 'English').strip().lower()}\x00{normalize_message(message)}"
+    if history_key:
+        normalized += f"\x00{history_key}"
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+class PerceptualCache:
+    """Near-duplicate photo cache keyed on (image hash, language, message).
+
+    A lookup hits when an entry for the same language and normalized message
+    has an image hash within max_distance bits. Entries live in a bounded LRU
+    in memory; with CACHE_BACKEND=sqlite they are also written to the shared
+    SQLite file, so other workers and restarts can reuse them.
+    """
+
+    def __init__(self, name, max_entries, ttl, max_distance, sqlite_path=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.sqlite_path = sqlite_path
+        # (language, message_key) -> OrderedDict{image_hash: (stored_at, value)}
+        self._buckets = {}
+        # LRU order across buckets: (language, message_key, image_hash)
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        if sqlite_path:
+            with self._connect() as conn:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS image_cache ('
+                    ' namespace TEXT NOT NULL, bucket TEXT NOT NULL, image_hash TEXT NOT NULL,'
+                    ' value TEXT NOT NULL, stored_at REAL NOT NULL,'
+                    ' PRIMARY KEY (namespace, bucket, image_hash))'
+                )
+                conn.execute('CREATE INDEX IF NOT EXISTS image_cache_age ON image_cache (namespace, stored_at)')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.sqlite_path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def bucket_for(language, message):
+        return ((language or 'English').strip().lower(), normalize_message(message or ''))
+
+    def get(self, key):
+        image_hash, language, message = key
+        bucket = self.bucket_for(language, message)
+        found = self._find_in_memory(bucket, image_hash)
+        if found is None and self.sqlite_path:
+            found = self._find_in_sqlite(bucket, image_hash)
+            if found is not None:
+                self._remember(bucket, found[0], found[2], found[3])
+        if found is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if found[1]:
+            self.near_hits += 1
+        return found[2]
+
+    def _find_in_memory(self, bucket, image_hash):
+        now = time.time()
+        best = None
+        with self._lock:
+            entries = self._buckets.get(bucket, {})
+            for other_hash, (stored_at, value) in list(entries.items()):
+                if now - stored_at > self.ttl:
+                    self._forget(bucket, other_hash)
+                    continue
+                distance = hamming_distance(image_hash, other_hash)
+                if distance <= self.max_distance and (best is None or distance < best[1]):
+                    best = (other_hash, distance, value, stored_at)
+            if best is not None:
+                self._lru.move_to_end((bucket, best[0]))
+        return best
+
+    def _find_in_sqlite(self, bucket, image_hash):
+        best = None
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT image_hash, value, stored_at FROM image_cache'
+                ' WHERE namespace = ? AND bucket = ? AND stored_at >= ?'
+                ' ORDER BY stored_at DESC LIMIT ?',
+                (self.name, json.dumps(bucket, ensure_ascii=False), time.time() - self.ttl, self.max_entries),
+            ).fetchall()
+        for other_hex, value, stored_at in rows:
+            other_hash = int(other_hex, 16)
+            distance = hamming_distance(image_hash, other_hash)
+            if distance <= self.max_distance and (best is None or distance < best[1]):
+                best = (other_hash, distance, json.loads(value), stored_at)
+        return best
+
+    def set(self, key, value):
+        image_hash, language, message = key
+        bucket = self.bucket_for(language, message)
+        now = time.time()
+        self._remember(bucket, image_hash, value, now)
+        if self.sqlite_path:
+            with self._connect() as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO image_cache (namespace, bucket, image_hash, value, stored_at)'
+                    ' VALUES (?, ?, ?, ?, ?)',
+                    (self.name, json.dumps(bucket, ensure_ascii=False), f"{image_hash:016x}",
+                     json.dumps(value, ensure_ascii=False), now),
+                )
+                conn.execute(
+                    'DELETE FROM image_cache WHERE namespace = ? AND stored_at < ?',
+                    (self.name, now - self.ttl),
+                )
+                conn.execute(
+                    'DELETE FROM image_cache WHERE rowid IN ('
+                    ' SELECT rowid FROM image_cache WHERE namespace = ?'
+                    ' ORDER BY stored_at DESC LIMIT -1 OFFSET ?)',
+                    (self.name, self.max_entries),
+                )
+
+    def _remember(self, bucket, image_hash, value, stored_at):
+        with self._lock:
+            self._buckets.setdefault(bucket, OrderedDict())[image_hash] = (stored_at, value)
+            self._lru[(bucket, image_hash)] = None
+            self._lru.move_to_end((bucket, image_hash))
+            while len(self._lru) > self.max_entries:
+                (old_bucket, old_hash), _ = self._lru.popitem(last=False)
+                self._forget(old_bucket, old_hash)
+
+    def _forget(self, bucket, image_hash):
+        # Caller holds the lock
+        entries = self._buckets.get(bucket)
+        if entries is not None:
+            entries.pop(image_hash, None)
+            if not entries:
+                del self._buckets[bucket]
+        self._lru.pop((bucket, image_hash), None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'near_duplicate_hits': self.near_hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'entries': len(self._lru),
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'max_distance': self.max_distance,
+        }
+
+
+def make_perceptual_cache(name, max_entries, ttl, max_distance):
+    sqlite_path = CACHE_SQLITE_PATH if CACHE_BACKEND == 'sqlite' else None
+    return PerceptualCache(name, max_entries, ttl, max_distance, sqlite_path)
@@ -0,0 +1,259 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+log = logging.getLogger(__name__)
+
+# Local stand-in for Gemini (LLM_PROVIDER=fake), for load tests and offline
+# development. Latencies are distributions, written as "fixed:MS",
+# "uniform:LO_MS:HI_MS", "normal:MEAN_MS:SD_MS", "lognormal:MEDIAN_MS:SIGMA"
+# or "recorded" (the latency stored with a replayed response).
+FAKE_LLM_LATENCY = os.getenv('FAKE_LLM_LATENCY', 'lognormal:800:0.5')
+# Gap between streamed chunks
+FAKE_LLM_CHUNK_LATENCY = os.getenv('FAKE_LLM_CHUNK_LATENCY', 'fixed:40')
+FAKE_LLM_CHUNK_CHARS = int(os.getenv('FAKE_LLM_CHUNK_CHARS', '40'))
+# Share of calls that fail before producing anything, and of streams that
+# break off halfway
+FAKE_LLM_ERROR_RATE = float(os.getenv('FAKE_LLM_ERROR_RATE', '0'))
+FAKE_LLM_STREAM_ABORT_RATE = float(os.getenv('FAKE_LLM_STREAM_ABORT_RATE', '0'))
+# JSONL written by LLM_RECORD_PATH; prompts found in it get the recorded answer
+FAKE_LLM_REPLAY_PATH = os.getenv('FAKE_LLM_REPLAY_PATH')
+FAKE_LLM_SEED = os.getenv('FAKE_LLM_SEED')
+# Model names the fake answers as (the first is the primary, the rest are
+# failover candidates), and ones that fail every call, for outage drills
+FAKE_LLM_MODELS = [name.strip() for name in os.getenv('FAKE_LLM_MODELS', 'fake').split(',') if name.strip()]
+FAKE_LLM_DOWN_MODELS = {name.strip() for name in os.getenv('FAKE_LLM_DOWN_MODELS', '').split(',') if name.strip()}
+
+CANNED_CHAT = (
+    "Here is what you can do:\n"
+    "- Check the underside of the leaves for insects and egg clusters.\n"
+    "- Spray neem oil (5 ml per litre of water) in the evening, once a week.\n"
+    "- Remove and burn badly affected leaves so the infection does not spread.\n"
+    "- Avoid watering from above; irrigate at the base of the plants.\n"
+    "If the problem continues, please consult your nearest Krishi Vigyan Kendra (KVK)."
+)
+
+CANNED_ADVISORY = {
+    'irrigation': "Irrigate early in the morning and check soil moisture before each watering.",
+    'protection': "Scout the field twice a week for pests and remove affected leaves.",
+    'soil': "Add compost or crop residue to keep the topsoil moist and loose.",
+    'fertilizer': "Apply the next split dose of nitrogen after light irrigation.",
+}
+
+
+class FakeLLMError(Exception):
+    pass
+
+
+def latency_sampler(spec, rng):
+    """Callable returning one latency in seconds for a spec like "lognormal:800:0.5"."""
+    kind, _, args = spec.partition(':')
+    values = [float(v) for v in args.split(':')] if args else []
+    if kind == 'fixed':
+        return lambda: values[0] / 1000
+    if kind == 'uniform':
+        return lambda: rng.uniform(values[0], values[1]) / 1000
+    if kind == 'normal':
+        return lambda: max(rng.gauss(values[0], values[1]), 0) / 1000
+    if kind == 'lognormal':
+        median, sigma = values
+        return lambda: rng.lognormvariate(0, sigma) * median / 1000
+    if kind == 'recorded':
+        return None
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def prompt_key(prompt):
+    """Stable hash of a prompt (text and inline image parts) for record/replay."""
+    digest = hashlib.sha256()
+    for part in prompt if isinstance(prompt, (list, tuple)) else [prompt]:
+        if isinstance(part, dict):
+            digest.update(part.get('mime_type', '').encode('utf-8'))
+            digest.update(part.get('data', b''))
+        else:
+            digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def load_replay(path):
+    records = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                records[record['key']] = record
+    log.info("Loaded %d recorded responses from %s", len(records), path)
+    return records
+
+
+def _usage(prompt, text):
+    # Same rough 4-chars-per-token estimate as sessions.py
+    prompt_chars = sum(len(part) if isinstance(part, str) else 1000
+                       for part in (prompt if isinstance(prompt, (list, tuple)) else [prompt]))
+    prompt_tokens, response_tokens = prompt_chars // 4 + 1, len(text) // 4 + 1
+    return SimpleNamespace(prompt_token_count=prompt_tokens, candidates_token_count=response_tokens,
+                           total_token_count=prompt_tokens + response_tokens)
+
+
+def _fake_translation(text):
+    # scheme_translations.py prompts: "Translate ... into <Language>. ..." plus
+    # a JSON list; answer with each string marked as translated
+    match = re.match(r'\s*Translate .*? into (\w+)\.', text)
+    start, end = text.find('['), text.rfind(']')
+    if not match or start < 0:
+        return None
+    try:
+        items = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    return json.dumps([{key: value if key == 'id' else f"[{match.group(1)}] {value}" for key, value in item.items()}
+                       for item in items], ensure_ascii=False)
+
+
+class FakeResponse:
+    """Quacks like a Gemini response or stream chunk: .text, .candidates, .usage_metadata."""
+
+    def __init__(self, text, finish_reason=None, usage_metadata=None):
+        self._text = text
+        reason = SimpleNamespace(name=finish_reason) if finish_reason else None
+        self.candidates = [SimpleNamespace(finish_reason=reason)]
+        self.usage_metadata = usage_metadata
+
+    @property
+    def text(self):
+        if not self._text:
+            raise ValueError("Response has no text parts")
+        return self._text
+
+
+class FakeModel:
+    """Drop-in for genai.GenerativeModel that answers locally."""
+
+    def __init__(self, system_instruction=None, model_name='fake'):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self._rng = random.Random(FAKE_LLM_SEED)
+        self._rng_lock = threading.Lock()
+        self._latency = latency_sampler(FAKE_LLM_LATENCY, self._rng)
+        self._chunk_latency = latency_sampler(FAKE_LLM_CHUNK_LATENCY, self._rng)
+        self.replay = load_replay(FAKE_LLM_REPLAY_PATH) if FAKE_LLM_REPLAY_PATH else {}
+
+    def _draw(self, sampler=None, recorded_ms=None):
+        with self._rng_lock:
+            if sampler is None:
+                return (recorded_ms or 0) / 1000
+            return sampler()
+
+    def _chance(self, rate):
+        with self._rng_lock:
+            return rate > 0 and self._rng.random() < rate
+
+    def _answer(self, prompt):
+        record = self.replay.get(prompt_key(prompt))
+        if record:
+            return record['text'], record.get('finish_reason') or 'STOP', record
+        text = ' '.join(part for part in (prompt if isinstance(prompt, (list, tuple)) else [prompt])
+                        if isinstance(part, str))
+        if '"irrigation"' in text and '"fertilizer"' in text:
+            return json.dumps(CANNED_ADVISORY), 'STOP', None
+        translation = _fake_translation(text)
+        if translation is not None:
+            return translation, 'STOP', None
+        return CANNED_CHAT, 'STOP', None
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        text, finish_reason, record = self._answer(prompt)
+        if self.model_name in FAKE_LLM_DOWN_MODELS or self._chance(FAKE_LLM_ERROR_RATE):
+            time.sleep(self._draw(self._latency, record and record.get('latency_ms')) / 2)
+            raise FakeLLMError("Injected fake LLM failure")
+        if stream:
+            return self._stream(prompt, text, finish_reason, record)
+        time.sleep(self._draw(self._latency, record and record.get('latency_ms')))
+        return FakeResponse(text, finish_reason, _usage(prompt, text))
+
+    def _stream(self, prompt, text, finish_reason, record):
+        time.sleep(self._draw(self._latency, record and record.get('first_chunk_ms')))
+        pieces = [text[i:i + FAKE_LLM_CHUNK_CHARS] for i in range(0, len(text), FAKE_LLM_CHUNK_CHARS)]
+        abort_at = len(pieces) // 2 if self._chance(FAKE_LLM_STREAM_ABORT_RATE) else None
+        for position, piece in enumerate(pieces):
+            if position == abort_at:
+                raise FakeLLMError("Injected fake LLM stream abort")
+            if position:
+                time.sleep(self._draw(self._chunk_latency))
+            yield FakeResponse(piece)
+        yield FakeResponse('', finish_reason, _usage(prompt, text))
+
+
+class RecordingModel:
+    """Wraps a model and appends every completed response to a JSONL file.
+
+    The file is what FakeModel replays with FAKE_LLM_REPLAY_PATH, so a session
+    against the real API can be turned into a repeatable load test.
+    """
+
+    def __init__(self, model, path):
+        self.model = model
+        self.path = path
+        self._lock = threading.Lock()
+
+    @property
+    def model_name(self):
+        return self.model.model_name
+
+    def status(self):
+        return self.model.status()
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        started = time.perf_counter()
+        if stream:
+            return self._record_stream(prompt, self.model.generate_content(prompt, stream=True, **kwargs), started)
+        response = self.model.generate_content(prompt, **kwargs)
+        try:
+            text = response.text
+        except ValueError:
+            return response
+        self._write(prompt, text, _finish_reason(response), started, None)
+        return response
+
+    def _record_stream(self, prompt, chunks, started):
+        pieces = []
+        first_chunk_at = None
+        finish_reason = None
+        for chunk in chunks:
+            finish_reason = _finish_reason(chunk) or finish_reason
+            try:
+                text = chunk.text
+            except ValueError:
+                text = ''
+            if text and first_chunk_at is None:
+                first_chunk_at = time.perf_counter()
+            pieces.append(text)
+            yield chunk
+        self._write(prompt, ''.join(pieces), finish_reason, started, first_chunk_at)
+
+    def _write(self, prompt, text, finish_reason, started, first_chunk_at):
+        record = {
+            'key': prompt_key(prompt),
+            'model': self.model_name,
+            'text': text,
+            'finish_reason': finish_reason,
+            'latency_ms': round((time.perf_counter() - started) * 1000, 1),
+            'first_chunk_ms': round((first_chunk_at - started) * 1000, 1) if first_chunk_at else None,
+        }
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def _finish_reason(response):
+    try:
+        reason = response.candidates[0].finish_reason
+    except (AttributeError, IndexError):
+        return None
+    return getattr(reason, 'name', str(reason)) if reason else None
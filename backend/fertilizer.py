@@ -0,0 +1,166 @@
+import math
+
+import numpy as np
+
+# Recommended nutrient doses in kg/ha (N, P2O5, K2O) by crop and season, from
+# the general ICAR package-of-practice figures for irrigated crops. Perennial
+# crops (tea, coffee, fruit trees) are dosed by plant age and are left out.
+CROP_NPK = {
+    'wheat': {'rabi': (120, 60, 40)},
+    'rice': {'kharif': (120, 60, 40), 'rabi': (120, 60, 40)},
+    'maize': {'kharif': (120, 60, 40), 'rabi': (150, 75, 40), 'zaid': (120, 60, 40)},
+    'cotton': {'kharif': (100, 50, 50)},
+    'sugarcane': {'kharif': (250, 100, 120), 'rabi': (250, 100, 120), 'zaid': (250, 100, 120)},
+    'pulses': {'kharif': (20, 40, 20), 'rabi': (20, 40, 20), 'zaid': (20, 40, 20)},
+    'oilseeds': {'kharif': (60, 40, 40), 'rabi': (80, 40, 40)},
+    'soybean': {'kharif': (30, 60, 40)},
+    'groundnut': {'kharif': (20, 40, 40), 'rabi': (25, 50, 50), 'zaid': (25, 50, 50)},
+    'jowar': {'kharif': (80, 40, 40), 'rabi': (60, 30, 30)},
+    'bajra': {'kharif': (80, 40, 40), 'zaid': (60, 40, 20)},
+    'ragi': {'kharif': (60, 40, 30)},
+    'jute': {'kharif': (60, 30, 30), 'zaid': (60, 30, 30)},
+    'potato': {'rabi': (150, 80, 100)},
+    'onion': {'kharif': (100, 50, 50), 'rabi': (100, 50, 50)},
+    'tomato': {'kharif': (120, 60, 60), 'rabi': (120, 60, 60), 'zaid': (120, 60, 60)},
+    'turmeric': {'kharif': (60, 50, 120)},
+    'ginger': {'kharif': (75, 50, 50)},
+    'chillies': {'kharif': (120, 60, 60), 'rabi': (120, 60, 60)},
+}
+CROP_ALIASES = {
+    'paddy': 'rice',
+    'chilli': 'chillies',
+    'chili': 'chillies',
+    'sorghum': 'jowar',
+    'pearl millet': 'bajra',
+    'finger millet': 'ragi',
+    'mustard': 'oilseeds',
+    'gram': 'pulses',
+    'tur': 'pulses',
+    'arhar': 'pulses',
+}
+SEASONS = ['kharif', 'rabi', 'zaid']
+
+# Soil Health Card ratings of available nutrients (kg/ha): below the first
+# edge is "low", above the second "high". Low soils get 25% more than the
+# table, high soils 25% less.
+SOIL_RATING_EDGES = np.array([[280, 560], [10, 25], [108, 280]], dtype=float)
+SOIL_RATING_FACTORS = np.array([1.25, 1.0, 0.75])
+
+# Nutrient content of the straight fertilizers
+UREA_N = 0.46
+DAP_N, DAP_P2O5 = 0.18, 0.46
+MOP_K2O = 0.60
+BAG_KG = 50
+HECTARES_PER_UNIT = {'ha': 1.0, 'hectare': 1.0, 'acre': 0.404686}
+# Largest area (ha) and soil-test value (kg/ha) accepted; anything bigger is a
+# typo, and absurd values would overflow the dose arithmetic
+MAX_HECTARES = 1e6
+MAX_SOIL_KG_HA = 1e5
+
+CROPS = sorted(CROP_NPK)
+_CROP_INDEX = {crop: index for index, crop in enumerate(CROPS)}
+_SEASON_INDEX = {season: index for index, season in enumerate(SEASONS)}
+# (crop, season, nutrient) table; NaN where the crop isn't grown that season
+_DOSES = np.full((len(CROPS), len(SEASONS), 3), np.nan)
+for _crop, _seasons in CROP_NPK.items():
+    for _season, _dose in _seasons.items():
+        _DOSES[_CROP_INDEX[_crop], _SEASON_INDEX[_season]] = _dose
+
+
+def _number(value, name, errors, maximum, limit):
+    if value is None or value == '':
+        return math.nan
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        errors.append(f"{name} must be a number")
+        return math.nan
+    if not 0 <= number <= maximum:
+        errors.append(f"{name} must be between 0 and {limit}")
+        return math.nan
+    return number
+
+
+def parse_fields(items):
+    """Arrays for a list of fields, plus an error message (or None) per field."""
+    count = len(items)
+    crop_index = [0] * count
+    season_index = [0] * count
+    hectares = [0.0] * count
+    soil = [(math.nan, math.nan, math.nan)] * count
+    messages = [None] * count
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            messages[i] = 'Each field must be an object'
+            continue
+        errors = []
+        crop = str(item.get('crop') or '').strip().lower()
+        crop = CROP_ALIASES.get(crop, crop)
+        season = str(item.get('season') or '').strip().lower()
+        unit = str(item.get('unit') or 'ha').strip().lower()
+        if crop not in _CROP_INDEX:
+            errors.append(f"Unknown crop: {item.get('crop')}")
+        elif season not in _SEASON_INDEX:
+            errors.append('season must be Kharif, Rabi or Zaid')
+        elif season not in CROP_NPK[crop]:
+            errors.append(f"No recommendation for {crop} in {season.capitalize()}")
+        if unit not in HECTARES_PER_UNIT:
+            errors.append('unit must be ha or acre')
+        hectares_per_unit = HECTARES_PER_UNIT.get(unit, 1.0)
+        area = _number(item.get('area'), 'area', errors, MAX_HECTARES / hectares_per_unit,
+                       f'{MAX_HECTARES:,.0f} ha')
+        if math.isnan(area) and not errors:
+            errors.append('area is required')
+        test = item.get('soil') if isinstance(item.get('soil'), dict) else {}
+        values = tuple(_number(test.get(name), f'soil.{name}', errors, MAX_SOIL_KG_HA,
+                               f'{MAX_SOIL_KG_HA:,.0f} kg/ha') for name in ('n', 'p', 'k'))
+        if errors:
+            messages[i] = '; '.join(errors)
+            continue
+        crop_index[i] = _CROP_INDEX[crop]
+        season_index[i] = _SEASON_INDEX[season]
+        hectares[i] = area * hectares_per_unit
+        soil[i] = values
+    return (np.array(crop_index, dtype=np.intp), np.array(season_index, dtype=np.intp),
+            np.array(hectares, dtype=float), np.array(soil, dtype=float).reshape(count, 3), messages)
+
+
+def compute_doses(crop_index, season_index, hectares, soil):
+    """Nutrient need and urea/DAP/MOP quantities (kg per field) for arrays of fields.
+
+    soil holds soil-test N/P/K in kg/ha, NaN where not tested.
+    """
+    per_ha = _DOSES[crop_index, season_index]
+    rating = np.where(soil < SOIL_RATING_EDGES[:, 0], 0, np.where(soil > SOIL_RATING_EDGES[:, 1], 2, 1))
+    factor = np.where(np.isnan(soil), 1.0, SOIL_RATING_FACTORS[rating])
+    nutrients = per_ha * factor * hectares[:, None]
+    n, p2o5, k2o = nutrients.T
+    # DAP covers all the phosphorus and some nitrogen; urea supplies the rest
+    dap = p2o5 / DAP_P2O5
+    urea = np.maximum(n - dap * DAP_N, 0) / UREA_N
+    mop = k2o / MOP_K2O
+    return {'n': n, 'p2o5': p2o5, 'k2o': k2o, 'urea': urea, 'dap': dap, 'mop': mop}
+
+
+def dose_results(items):
+    """Per-field results for a list of request items, in order."""
+    crop_index, season_index, hectares, soil, messages = parse_fields(items)
+    doses = {name: np.round(values, 1) for name, values in compute_doses(crop_index, season_index, hectares, soil).items()}
+    bags = {name: np.ceil(doses[name] / BAG_KG).astype(int) for name in ('urea', 'dap', 'mop')}
+    rows = zip(messages, crop_index.tolist(), season_index.tolist(), np.round(hectares, 4).tolist(),
+               *(doses[name].tolist() for name in ('n', 'p2o5', 'k2o', 'urea', 'dap', 'mop')),
+               *(bags[name].tolist() for name in ('urea', 'dap', 'mop')))
+    results = []
+    for message, crop, season, area, n, p2o5, k2o, urea, dap, mop, urea_bags, dap_bags, mop_bags in rows:
+        if message:
+            results.append({'error': message})
+            continue
+        results.append({
+            'crop': CROPS[crop],
+            'season': SEASONS[season],
+            'hectares': area,
+            'nutrients_kg': {'n': n, 'p2o5': p2o5, 'k2o': k2o},
+            'fertilizers_kg': {'urea': urea, 'dap': dap, 'mop': mop},
+            'bags_50kg': {'urea': urea_bags, 'dap': dap_bags, 'mop': mop_bags},
+        })
+    return results
@@ -0,0 +1,24 @@
+import os
+
+# Cooperative worker profile. With gevent workers the blocking socket I/O of a
+# Gemini call yields to other requests, so one process can keep many chats in
+# flight instead of one per sync worker. Set GUNICORN_WORKER_CLASS=sync to get
+# the old behaviour back.
+#
+# Worker count and bind address come from gunicorn's usual WEB_CONCURRENCY and
+# PORT environment variables.
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+
+# Open connections each worker will multiplex. Calls to the model itself are
+# further limited by LLM_MAX_CONCURRENCY plus LLM_MAX_QUEUE waiters (see
+# llm.py); keep their sum well below this so /api/schemes and static files
+# always find a free connection.
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))
+
+# Long generations are legitimate; only kill workers that are truly stuck.
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+
+if worker_class == 'gevent':
+    # gRPC does its own I/O outside of gevent's monkey-patching, so under
+    # cooperative workers talk to Gemini over REST (plain patched sockets).
+    os.environ.setdefault('GEMINI_TRANSPORT', 'rest')
@@ -0,0 +1,92 @@
+import base64
+import binascii
+import io
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Longest edge, in pixels, of the photo we forward to Gemini. Phone cameras
+# produce 4000px+ images; leaf spots are perfectly visible at 1024.
+IMAGE_MAX_EDGE = int(os.getenv('IMAGE_MAX_EDGE', '1024'))
+IMAGE_JPEG_QUALITY = int(os.getenv('IMAGE_JPEG_QUALITY', '80'))
+# Whole request bodies above this are refused with 413 before being read
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(10 * 1024 * 1024)))
+# Refuse to decode anything bigger than this (decompression bombs)
+Image.MAX_IMAGE_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', str(50_000_000)))
+
+# Raw uploads stay in memory up to this size, then spill to a temp file
+SPOOL_MAX_BYTES = 1024 * 1024
+COPY_CHUNK_BYTES = 64 * 1024
+
+
+# dHash compares neighbouring pixels of a (DHASH_SIZE+1) x DHASH_SIZE thumbnail
+DHASH_SIZE = 8
+
+NormalizedImage = namedtuple('NormalizedImage', ['data', 'mime_type', 'dhash'])
+
+
+class InvalidImageError(ValueError):
+    pass
+
+
+def spool_stream(stream):
+    """Copy a request body stream into a seekable file in fixed-size chunks."""
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    shutil.copyfileobj(stream, spooled, COPY_CHUNK_BYTES)
+    spooled.seek(0)
+    return spooled
+
+
+def open_data_uri(data_uri):
+    # "data:image/jpeg;base64,...." as produced by FileReader.readAsDataURL
+    try:
+        header, base64_data = data_uri.split(',', 1)
+        if not header.startswith('data:image/'):
+            raise InvalidImageError(f"Not an image data URI: {header[:40]}")
+        return io.BytesIO(base64.b64decode(base64_data, validate=False))
+    except (ValueError, binascii.Error) as e:
+        raise InvalidImageError(str(e)) from e
+
+
+def normalize_image(fileobj):
+    """Downscale, re-encode and strip metadata from an uploaded photo.
+
+    Returns a NormalizedImage. Orientation from EXIF is applied to the pixels
+    before the EXIF block is dropped, and the perceptual hash is taken from the
+    oriented image so re-forwarded copies of a photo hash alike.
+    """
+    try:
+        with Image.open(fileobj) as img:
+            # For JPEGs, let the decoder skip straight to a reduced scale so a
+            # 12MP photo is never fully materialized in memory.
+            img.draft('RGB', (IMAGE_MAX_EDGE, IMAGE_MAX_EDGE))
+            img = ImageOps.exif_transpose(img)
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            img.thumbnail((IMAGE_MAX_EDGE, IMAGE_MAX_EDGE), Image.LANCZOS)
+
+            out = io.BytesIO()
+            # No exif= argument: the re-encoded file carries no metadata
+            img.save(out, format='JPEG', quality=IMAGE_JPEG_QUALITY, optimize=True)
+            return NormalizedImage(out.getvalue(), 'image/jpeg', dhash(img))
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise InvalidImageError(str(e)) from e
+
+
+def dhash(img):
+    """64-bit difference hash: survives re-compression, resizing and small crops.
+
+    WhatsApp re-encodes every forward, so byte-level hashes of the same leaf
+    photo never match; this one changes by only a few bits.
+    """
+    small = img.convert('L').resize((DHASH_SIZE + 1, DHASH_SIZE), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(DHASH_SIZE):
+        offset = row * (DHASH_SIZE + 1)
+        for col in range(DHASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
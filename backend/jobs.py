@@ -0,0 +1,256 @@
+import base64
+import json
+import logging
+import os
+import secrets
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+# Slow chat requests (photos) can be submitted as jobs and polled for. Jobs
+# sit in a SQLite file so they survive a restart; every worker process runs
+# JOB_WORKERS threads that take jobs from it.
+JOBS_SQLITE_PATH = os.getenv('JOBS_SQLITE_PATH', os.path.join(os.path.dirname(__file__), 'jobs.sqlite3'))
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '4'))
+# Queued plus running jobs at which new submissions are refused (503)
+JOB_MAX_QUEUE = int(os.getenv('JOB_MAX_QUEUE', '200'))
+# Default and longest deadline a client may ask for, in seconds from submission.
+# A job still queued at its deadline is never started; a result that arrives
+# after it is dropped.
+JOB_DEADLINE = float(os.getenv('JOB_DEADLINE', '120'))
+JOB_MAX_DEADLINE = float(os.getenv('JOB_MAX_DEADLINE', '600'))
+# Longest long-poll a client may ask for
+JOB_MAX_WAIT = float(os.getenv('JOB_MAX_WAIT', '25'))
+# Finished jobs are kept this long for clients to collect
+JOB_RESULT_TTL = int(os.getenv('JOB_RESULT_TTL', str(60 * 60)))
+# A running job whose process stopped renewing its lease this long ago is
+# handed to another worker, at most JOB_MAX_ATTEMPTS times in all
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', '30'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '2'))
+# How often idle workers look for jobs submitted through other processes
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '1'))
+
+QUEUED, RUNNING, DONE, FAILED, EXPIRED = 'queued', 'running', 'done', 'failed', 'expired'
+FINISHED = (DONE, FAILED, EXPIRED)
+
+JOBS = metrics.counter('jobs_total', 'Jobs by outcome: done, failed, expired or rejected (queue full).', ('outcome',))
+JOB_QUEUE_SECONDS = metrics.histogram('job_queue_seconds', 'Time jobs waited before a worker took them.')
+JOB_RUN_SECONDS = metrics.histogram('job_run_seconds', 'Time jobs spent running.')
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def encode_prompt(prompt_parts):
+    # Inline image parts carry bytes; keep them as base64 in the JSON column
+    return json.dumps([
+        {'mime_type': part['mime_type'], 'data': base64.b64encode(part['data']).decode('ascii')}
+        if isinstance(part, dict) else part
+        for part in prompt_parts
+    ], ensure_ascii=False)
+
+
+def decode_prompt(text):
+    return [
+        {'mime_type': part['mime_type'], 'data': base64.b64decode(part['data'])} if isinstance(part, dict) else part
+        for part in json.loads(text)
+    ]
+
+
+class JobQueue:
+    """Persistent queue of chat jobs with a pool of worker threads.
+
+    run(prompt_parts, context) does the work and returns a JSON-able result;
+    context is the dict passed to submit().
+    """
+
+    def __init__(self, run, path=JOBS_SQLITE_PATH, workers=JOB_WORKERS):
+        self.run = run
+        self.path = path
+        self.workers = workers
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        # Idle workers wait on _submitted, long polls on _finished
+        self._submitted = threading.Condition()
+        self._finished = threading.Condition()
+        self._started = False
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                ' id TEXT PRIMARY KEY, status TEXT NOT NULL, prompt TEXT NOT NULL, context TEXT NOT NULL,'
+                ' result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, worker TEXT,'
+                ' created_at REAL NOT NULL, deadline_at REAL NOT NULL,'
+                ' started_at REAL, finished_at REAL, leased_until REAL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        for index in range(self.workers):
+            threading.Thread(target=self._work, name=f'job-worker-{index}', daemon=True).start()
+        threading.Thread(target=self._maintain, name='job-maintenance', daemon=True).start()
+
+    def depth(self):
+        with self._connect() as conn:
+            counts = dict(conn.execute(
+                'SELECT status, COUNT(*) FROM jobs WHERE status IN (?, ?) GROUP BY status', (QUEUED, RUNNING)))
+        return {QUEUED: counts.get(QUEUED, 0), RUNNING: counts.get(RUNNING, 0)}
+
+    def submit(self, prompt_parts, context, deadline=JOB_DEADLINE, result=None):
+        """New job id. With result the job is created already done (e.g. a cache hit)."""
+        now = time.time()
+        job_id = secrets.token_urlsafe(16)
+        with self._connect() as conn:
+            if result is None:
+                pending = conn.execute('SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)', (QUEUED, RUNNING)).fetchone()[0]
+                if pending >= JOB_MAX_QUEUE:
+                    JOBS.inc(outcome='rejected')
+                    raise QueueFullError(f"Job queue full ({JOB_MAX_QUEUE})")
+            conn.execute(
+                'INSERT INTO jobs (id, status, prompt, context, result, created_at, deadline_at, finished_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, QUEUED if result is None else DONE, encode_prompt(prompt_parts),
+                 json.dumps(context, ensure_ascii=False), None if result is None else json.dumps(result, ensure_ascii=False),
+                 now, now + min(deadline, JOB_MAX_DEADLINE), None if result is None else now),
+            )
+        if result is None:
+            with self._submitted:
+                self._submitted.notify()
+        else:
+            JOBS.inc(outcome=DONE)
+        return job_id
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT id, status, result, error, created_at, deadline_at, started_at, finished_at'
+                ' FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {
+            'job_id': row['id'],
+            'status': row['status'],
+            'created_at': row['created_at'],
+            'deadline_at': row['deadline_at'],
+            'started_at': row['started_at'],
+            'finished_at': row['finished_at'],
+        }
+        if row['status'] not in FINISHED and time.time() > row['deadline_at']:
+            # The maintenance thread will record it; don't make the client wait for that
+            job['status'] = EXPIRED
+        if row['result'] is not None:
+            job['result'] = json.loads(row['result'])
+        if row['error'] is not None:
+            job['error'] = row['error']
+        return job
+
+    def wait(self, job_id, timeout):
+        """get(), after waiting up to timeout seconds for the job to finish."""
+        give_up_at = time.monotonic() + min(timeout, JOB_MAX_WAIT)
+        while True:
+            job = self.get(job_id)
+            remaining = give_up_at - time.monotonic()
+            if job is None or job['status'] in FINISHED or remaining <= 0:
+                return job
+            # Woken early when a job finishes in this process; jobs finished
+            # by another process are seen on the next poll
+            with self._finished:
+                self._finished.wait(min(remaining, JOB_POLL_INTERVAL))
+
+    def _claim(self):
+        now = time.time()
+        with self._connect() as conn:
+            return conn.execute(
+                'UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, started_at = ?, leased_until = ?'
+                ' WHERE id = (SELECT id FROM jobs WHERE status = ? AND deadline_at > ? ORDER BY created_at LIMIT 1)'
+                ' AND status = ?'
+                ' RETURNING id, prompt, context, created_at, deadline_at',
+                (RUNNING, self.worker_id, now, now + JOB_LEASE_SECONDS, QUEUED, now, QUEUED),
+            ).fetchone()
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self._connect() as conn:
+            updated = conn.execute(
+                'UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, leased_until = NULL'
+                ' WHERE id = ? AND status = ? AND worker = ?',
+                (status, None if result is None else json.dumps(result, ensure_ascii=False), error, time.time(),
+                 job_id, RUNNING, self.worker_id),
+            ).rowcount
+        # Zero when the lease was lost meanwhile and the job moved on without us
+        if updated:
+            JOBS.inc(outcome=status)
+        with self._finished:
+            self._finished.notify_all()
+
+    def _work(self):
+        while True:
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                log.warning("Could not take a job", extra={'error': str(e)})
+                job = None
+            if job is None:
+                with self._submitted:
+                    self._submitted.wait(JOB_POLL_INTERVAL)
+                continue
+
+            started = time.time()
+            JOB_QUEUE_SECONDS.observe(started - job['created_at'])
+            try:
+                result = self.run(decode_prompt(job['prompt']), json.loads(job['context']))
+            except Exception as e:
+                log.warning("Job failed", extra={'job_id': job['id'], 'error': str(e)})
+                status, result, error = FAILED, None, str(e)
+            else:
+                status, error = DONE, None
+                if time.time() > job['deadline_at']:
+                    status, result, error = EXPIRED, None, 'Deadline exceeded'
+            JOB_RUN_SECONDS.observe(time.time() - started)
+            self._finish(job['id'], status, result, error)
+
+    def _maintain(self):
+        # Renew leases on our running jobs, requeue or fail jobs whose worker
+        # went away, expire jobs past their deadline, drop old results
+        while True:
+            time.sleep(JOB_LEASE_SECONDS / 3)
+            now = time.time()
+            try:
+                with self._connect() as conn:
+                    conn.execute('UPDATE jobs SET leased_until = ? WHERE status = ? AND worker = ?',
+                                 (now + JOB_LEASE_SECONDS, RUNNING, self.worker_id))
+                    expired = conn.execute(
+                        'UPDATE jobs SET status = ?, error = ?, finished_at = ?'
+                        ' WHERE status IN (?, ?) AND deadline_at < ? AND (status = ? OR leased_until < ?)',
+                        (EXPIRED, 'Deadline exceeded', now, QUEUED, RUNNING, now, QUEUED, now)).rowcount
+                    conn.execute(
+                        'UPDATE jobs SET status = CASE WHEN attempts < ? THEN ? ELSE ? END,'
+                        ' error = CASE WHEN attempts < ? THEN NULL ELSE ? END,'
+                        ' finished_at = CASE WHEN attempts < ? THEN NULL ELSE ? END, worker = NULL'
+                        ' WHERE status = ? AND leased_until < ?',
+                        (JOB_MAX_ATTEMPTS, QUEUED, FAILED, JOB_MAX_ATTEMPTS, 'Worker stopped', JOB_MAX_ATTEMPTS, now,
+                         RUNNING, now))
+                    conn.execute('DELETE FROM jobs WHERE status IN (?, ?, ?) AND finished_at < ?',
+                                 FINISHED + (now - JOB_RESULT_TTL,))
+                if expired:
+                    JOBS.inc(expired, outcome=EXPIRED)
+            except sqlite3.Error as e:
+                log.warning("Job maintenance failed", extra={'error': str(e)})
@@ -0,0 +1,348 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import google.generativeai as genai
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+# Upper bound on Gemini calls in flight per worker process; set it so that
+# workers x LLM_MAX_CONCURRENCY matches the API quota. Under the gevent
+# worker profile (see gunicorn.conf.py) a process can hold hundreds of open
+# requests, but we only let this many talk to the model at the same time; the
+# rest wait (cooperatively) for a free slot.
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '64'))
+# At most this many requests wait for a slot; beyond that they are turned
+# away at once instead of holding a connection the cheap routes could use
+LLM_MAX_QUEUE = int(os.getenv('LLM_MAX_QUEUE', '128'))
+# How long a request may wait for a slot before giving up, in seconds
+LLM_SLOT_TIMEOUT = float(os.getenv('LLM_SLOT_TIMEOUT', '30'))
+# Retry-After sent with "busy" answers, in seconds
+LLM_BUSY_RETRY_AFTER = int(os.getenv('LLM_BUSY_RETRY_AFTER', '10'))
+
+_llm_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+_queue_lock = threading.Lock()
+_queued = 0
+_active = 0
+
+
+class LLMBusyError(Exception):
+    def __init__(self, message, reason='timeout', retry_after=LLM_BUSY_RETRY_AFTER):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def queue_depth():
+    return _queued
+
+
+def in_flight():
+    return _active
+
+
+def saturated():
+    """True when a new call would be turned away with reason queue_full."""
+    return _queued >= LLM_MAX_QUEUE
+
+
+def _acquire_slot():
+    global _queued, _active
+    if not _llm_slots.acquire(blocking=False):
+        with _queue_lock:
+            if _queued >= LLM_MAX_QUEUE:
+                metrics.LLM_CALLS.inc(kind='any', outcome='queue_full')
+                raise LLMBusyError(f"LLM wait queue full ({LLM_MAX_QUEUE})", reason='queue_full')
+            _queued += 1
+        started = time.perf_counter()
+        try:
+            acquired = _llm_slots.acquire(timeout=LLM_SLOT_TIMEOUT)
+        finally:
+            with _queue_lock:
+                _queued -= 1
+        metrics.LLM_SLOT_WAIT_SECONDS.observe(time.perf_counter() - started)
+        if not acquired:
+            metrics.LLM_CALLS.inc(kind='any', outcome='busy')
+            raise LLMBusyError(f"No free LLM slot after {LLM_SLOT_TIMEOUT}s")
+    else:
+        metrics.LLM_SLOT_WAIT_SECONDS.observe(0)
+    with _queue_lock:
+        _active += 1
+    metrics.LLM_IN_FLIGHT.inc()
+
+
+def _release_slot():
+    global _active
+    with _queue_lock:
+        _active -= 1
+    metrics.LLM_IN_FLIGHT.dec()
+    _llm_slots.release()
+
+
+def _prompt_chars(prompt):
+    return sum(len(part) for part in (prompt if isinstance(prompt, (list, tuple)) else [prompt])
+               if isinstance(part, str))
+
+
+def _record_usage(usage):
+    if usage is None:
+        return
+    for kind, attr in (('prompt', 'prompt_token_count'), ('response', 'candidates_token_count')):
+        count = getattr(usage, attr, None)
+        if count:
+            metrics.LLM_TOKENS.inc(count, type=kind)
+
+
+def generate_content(model, prompt, **kwargs):
+    _acquire_slot()
+    started = time.perf_counter()
+    try:
+        response = model.generate_content(prompt, **kwargs)
+    except Exception:
+        metrics.LLM_CALLS.inc(kind='generate', outcome='error')
+        raise
+    finally:
+        _release_slot()
+    elapsed = time.perf_counter() - started
+    metrics.LLM_CALLS.inc(kind='generate', outcome='ok')
+    metrics.LLM_GENERATION_SECONDS.observe(elapsed, kind='generate')
+    metrics.LLM_PROMPT_CHARS.observe(_prompt_chars(prompt))
+    try:
+        metrics.LLM_RESPONSE_CHARS.observe(len(response.text))
+    except (ValueError, AttributeError):
+        pass
+    _record_usage(getattr(response, 'usage_metadata', None))
+    log.info("LLM call finished", extra={'kind': 'generate', 'duration_ms': round(elapsed * 1000, 1)})
+    return response
+
+
+def stream_content(model, prompt, **kwargs):
+    # Keep the slot for as long as the caller is reading the stream
+    _acquire_slot()
+    started = time.perf_counter()
+    first_chunk_at = None
+    response_chars = 0
+    usage = None
+    outcome = 'error'
+    try:
+        for chunk in model.generate_content(prompt, stream=True, **kwargs):
+            usage = getattr(chunk, 'usage_metadata', None) or usage
+            try:
+                text = chunk.text
+            except ValueError:
+                text = ''
+            if text and first_chunk_at is None:
+                first_chunk_at = time.perf_counter()
+                metrics.LLM_FIRST_TOKEN_SECONDS.observe(first_chunk_at - started)
+            response_chars += len(text)
+            yield chunk
+        outcome = 'ok'
+    except GeneratorExit:
+        outcome = 'cancelled'
+        raise
+    finally:
+        _release_slot()
+        elapsed = time.perf_counter() - started
+        metrics.LLM_CALLS.inc(kind='stream', outcome=outcome)
+        if outcome == 'ok':
+            metrics.LLM_GENERATION_SECONDS.observe(elapsed, kind='stream')
+            metrics.LLM_PROMPT_CHARS.observe(_prompt_chars(prompt))
+            metrics.LLM_RESPONSE_CHARS.observe(response_chars)
+            _record_usage(usage)
+        log.info("LLM stream finished", extra={
+            'kind': 'stream', 'outcome': outcome, 'duration_ms': round(elapsed * 1000, 1),
+            'first_chunk_ms': round((first_chunk_at - started) * 1000, 1) if first_chunk_at else None,
+        })
+
+
+# Model selection. GEMINI_MODEL pins a model and skips discovery entirely.
+# Otherwise the model picked by list_models() is remembered in a small JSON
+# file that every worker on the machine reads at startup, and re-discovered in
+# a background thread once it is older than MODEL_CACHE_TTL.
+GEMINI_MODEL = os.getenv('GEMINI_MODEL')
+# Used until the first discovery has finished (first boot, or no network)
+GEMINI_DEFAULT_MODEL = os.getenv('GEMINI_DEFAULT_MODEL', 'models/gemini-2.5-flash')
+MODEL_CACHE_PATH = os.getenv('MODEL_CACHE_PATH', os.path.join(os.path.dirname(__file__), '.gemini_model.json'))
+MODEL_CACHE_TTL = int(os.getenv('MODEL_CACHE_TTL', str(24 * 60 * 60)))
+# A refresh lock older than this is assumed to belong to a dead worker
+MODEL_REFRESH_LOCK_TIMEOUT = 120
+# Wait this long before trying again after a failed or skipped refresh
+MODEL_REFRESH_RETRY = 60
+
+
+def discover_models():
+    # Generic logic: List all models and keep the ones that support content generation.
+    # This avoids hardcoding specific versions like 'gemini-1.5-flash'.
+    return [m.name for m in genai.list_models() if 'generateContent' in m.supported_generation_methods]
+
+
+def read_model_cache():
+    try:
+        with open(MODEL_CACHE_PATH, encoding='utf-8') as f:
+            cached = json.load(f)
+        return cached['model'], cached.get('candidates', []), cached['resolved_at']
+    except (OSError, ValueError, KeyError):
+        return None, [], 0
+
+
+def write_model_cache(model_name, candidates):
+    # Write-then-rename so other workers never read a half-written file
+    tmp_path = f"{MODEL_CACHE_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'model': model_name, 'candidates': candidates, 'resolved_at': time.time()}, f)
+    os.replace(tmp_path, MODEL_CACHE_PATH)
+
+
+def _claim_refresh():
+    # Only one worker per machine should hit list_models() at a time
+    lock_path = MODEL_CACHE_PATH + '.lock'
+    try:
+        os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return True
+    except FileExistsError:
+        try:
+            if time.time() - os.path.getmtime(lock_path) > MODEL_REFRESH_LOCK_TIMEOUT:
+                os.remove(lock_path)
+        except OSError:
+            pass
+        return False
+
+
+def _release_refresh():
+    try:
+        os.remove(MODEL_CACHE_PATH + '.lock')
+    except OSError:
+        pass
+
+
+class LazyModel:
+    """Stands in for genai.GenerativeModel and picks the model on first use.
+
+    Picking a model never touches the network on the request path: it is
+    either pinned by GEMINI_MODEL, read from the model cache file, or the
+    default while a background discovery runs.
+    """
+
+    def __init__(self, system_instruction):
+        self.system_instruction = system_instruction
+        self._model = None
+        # Other models that support generateContent, from the last discovery
+        self.candidates = []
+        self._next_refresh_at = 0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    @property
+    def model_name(self):
+        return self._get_model().model_name
+
+    def generate_content(self, *args, **kwargs):
+        return self._get_model().generate_content(*args, **kwargs)
+
+    def _get_model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._resolve()
+        if not GEMINI_MODEL and time.time() >= self._next_refresh_at:
+            self.refresh_in_background()
+        return self._model
+
+    def _resolve(self):
+        if GEMINI_MODEL:
+            log.info("Using pinned model: %s", GEMINI_MODEL)
+            self._use(GEMINI_MODEL)
+            return
+
+        model_name, self.candidates, resolved_at = read_model_cache()
+        if model_name:
+            log.info("Using cached model selection: %s", model_name)
+            self._use(model_name)
+            self._next_refresh_at = resolved_at + MODEL_CACHE_TTL
+        else:
+            log.info("No cached model selection, starting with %s", GEMINI_DEFAULT_MODEL)
+            self._use(GEMINI_DEFAULT_MODEL)
+
+    def _use(self, model_name):
+        self._model = genai.GenerativeModel(model_name, system_instruction=self.system_instruction)
+
+    def refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name='gemini-model-refresh', daemon=True).start()
+
+    def _refresh(self):
+        self._next_refresh_at = time.time() + MODEL_REFRESH_RETRY
+        try:
+            # Another worker may have refreshed the file since we last looked
+            model_name, candidates, resolved_at = read_model_cache()
+            if not (model_name and time.time() - resolved_at <= MODEL_CACHE_TTL):
+                if not _claim_refresh():
+                    return
+                try:
+                    candidates = discover_models()
+                finally:
+                    _release_refresh()
+                if not candidates:
+                    log.warning("No model found supporting generateContent.")
+                    return
+                model_name, resolved_at = candidates[0], time.time()
+                write_model_cache(model_name, candidates)
+                log.info("Automatically selected generic model: %s", model_name)
+
+            self.candidates = candidates
+            if model_name != self._model.model_name:
+                self._use(model_name)
+            self._next_refresh_at = resolved_at + MODEL_CACHE_TTL
+        except Exception:
+            log.exception("Error selecting model")
+        finally:
+            self._refreshing = False
+
+
+# Which backend answers: "gemini", or "fake" for the local stand-in in
+# fake_llm.py (load tests, offline development). With LLM_RECORD_PATH set,
+# every response is also appended there for later replay by the fake.
+LLM_PROVIDER = os.getenv('LLM_PROVIDER', 'gemini')
+LLM_RECORD_PATH = os.getenv('LLM_RECORD_PATH')
+
+
+def make_model(system_instruction):
+    """The model object routes talk to: anything with generate_content(prompt, stream=...).
+
+    Calls go through resilience.ResilientModel, which retries and fails over
+    to other models of the same provider.
+    """
+    import resilience
+    if LLM_PROVIDER == 'fake':
+        import fake_llm
+        names = fake_llm.FAKE_LLM_MODELS
+        model = resilience.ResilientModel(
+            fake_llm.FakeModel(system_instruction, names[0]),
+            build_model=lambda name: fake_llm.FakeModel(system_instruction, name),
+            candidate_names=lambda: names,
+            pass_timeout=False,
+        )
+    elif LLM_PROVIDER == 'gemini':
+        primary = LazyModel(system_instruction)
+        model = resilience.ResilientModel(
+            primary,
+            build_model=lambda name: genai.GenerativeModel(name, system_instruction=system_instruction),
+            # A pinned model only fails over to an explicit LLM_FAILOVER_MODELS list
+            candidate_names=lambda: [] if GEMINI_MODEL else primary.candidates,
+        )
+    else:
+        raise ValueError(f"Unknown LLM_PROVIDER: {LLM_PROVIDER}")
+    log.info("LLM provider: %s", LLM_PROVIDER)
+
+    if LLM_RECORD_PATH:
+        import fake_llm
+        model = fake_llm.RecordingModel(model, LLM_RECORD_PATH)
+        log.info("Recording LLM responses to %s", LLM_RECORD_PATH)
+    return model
@@ -0,0 +1,222 @@
+import bisect
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Prometheus text-format metrics without a client library. Every metric lives
+# in the worker process that recorded it, so with several gunicorn workers
+# each scrape sees one worker; the "pid" label on process_info says which.
+
+# Request and LLM latencies, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+# Prompt / response sizes, in characters
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    @contextmanager
+    def track(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self, key, state):
+        counts, total, count = state
+        lines = []
+        cumulative = 0
+        for edge, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            le = f'le="{_format_value(edge if edge == float("inf") else float(edge))}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+        labels = _format_labels(self.label_names, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class CallbackMetric:
+    """A metric whose samples are read at scrape time, e.g. from a cache's stats().
+
+    fn returns [(labels dict, value), ...].
+    """
+
+    def __init__(self, name, help_text, kind, fn):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.fn = fn
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in self.fn():
+            lines.append(f"{self.name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help_text, labels=()):
+    return REGISTRY.register(Counter(name, help_text, labels))
+
+
+def gauge(name, help_text, labels=()):
+    return REGISTRY.register(Gauge(name, help_text, labels))
+
+
+def histogram(name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, help_text, labels, buckets))
+
+
+def callback(name, help_text, kind, fn):
+    return REGISTRY.register(CallbackMetric(name, help_text, kind, fn))
+
+
+# Shared by the request handlers and llm.py
+HTTP_REQUESTS = counter('http_requests_total', 'HTTP requests by route, method and status.',
+                        ('route', 'method', 'status'))
+HTTP_REQUEST_SECONDS = histogram('http_request_duration_seconds',
+                                 'Time from request start until the response body is fully sent.',
+                                 ('route', 'method'))
+HTTP_IN_FLIGHT = gauge('http_requests_in_flight', 'Requests currently being handled.', ('route',))
+REQUEST_PHASE_SECONDS = histogram('request_phase_duration_seconds',
+                                  'Time spent in each phase of request handling.', ('phase',))
+
+LLM_CALLS = counter('llm_calls_total', 'Model calls by kind (generate/stream) and outcome.', ('kind', 'outcome'))
+LLM_IN_FLIGHT = gauge('llm_calls_in_flight', 'Model calls holding a concurrency slot.')
+LLM_SLOT_WAIT_SECONDS = histogram('llm_slot_wait_seconds', 'Time spent waiting for a free model slot.')
+LLM_FIRST_TOKEN_SECONDS = histogram('llm_time_to_first_token_seconds',
+                                    'Time from sending a streamed prompt to the first text chunk.')
+LLM_GENERATION_SECONDS = histogram('llm_generation_duration_seconds',
+                                   'Time from sending a prompt to the complete response.', ('kind',))
+LLM_PROMPT_CHARS = histogram('llm_prompt_chars', 'Text characters sent per model call.', (), SIZE_BUCKETS)
+LLM_RESPONSE_CHARS = histogram('llm_response_chars', 'Text characters received per model call.', (), SIZE_BUCKETS)
+LLM_TOKENS = counter('llm_tokens_total', 'Tokens reported by the model, by type (prompt/response).', ('type',))
+
+PROCESS_STARTED_AT = time.time()
+callback('process_info', 'Worker process serving this scrape.', 'gauge',
+         lambda: [({'pid': os.getpid()}, 1)])
+callback('process_start_time_seconds', 'Start time of the worker process, as a Unix timestamp.', 'gauge',
+         lambda: [({}, PROCESS_STARTED_AT)])
+
+
+def phase(name):
+    """Decorator recording a function's run time as request phase `name`."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with REQUEST_PHASE_SECONDS.time(phase=name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
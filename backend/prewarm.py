@@ -0,0 +1,230 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: every process warms
+    fcntl = None
+
+import llm
+import metrics
+import weather_proxy
+from admission import TokenBucketLimiter
+from cache import SQLiteBackend
+from weather import advisory_cache_key
+
+log = logging.getLogger(__name__)
+
+# Places whose advisories are generated ahead of the morning rush, as
+# "city|pincode" or "lat,lon" entries separated by ";", and/or a JSON file
+# with a list of {"name", "city", "pincode"} or {"name", "lat", "lon"}.
+PREWARM_LOCATIONS = os.getenv('PREWARM_LOCATIONS', '')
+PREWARM_LOCATIONS_FILE = os.getenv('PREWARM_LOCATIONS_FILE')
+# Seconds between passes. Each pass re-reads the forecasts and regenerates an
+# advisory when its weather bucket changed or it is getting old.
+PREWARM_INTERVAL = float(os.getenv('PREWARM_INTERVAL', '600'))
+# Sooner than that when a pass had to leave locations for later
+PREWARM_DEFERRED_RETRY = float(os.getenv('PREWARM_DEFERRED_RETRY', '60'))
+PREWARM_CONCURRENCY = int(os.getenv('PREWARM_CONCURRENCY', '4'))
+# Model calls the warmer may make per minute, on top of whatever live
+# traffic uses, and the share of LLM_MAX_CONCURRENCY it may find busy and
+# still start one. Past either it defers to the next pass.
+PREWARM_RATE_PER_MINUTE = float(os.getenv('PREWARM_RATE_PER_MINUTE', '20'))
+PREWARM_MAX_SLOT_SHARE = float(os.getenv('PREWARM_MAX_SLOT_SHARE', '0.5'))
+# Only one worker per machine runs the warmer; the advisories land in the
+# response cache, which every worker shares with CACHE_BACKEND=sqlite. With
+# the in-memory cache and several workers the others would never see them,
+# so the warmer then stays off.
+PREWARM_LOCK_PATH = os.getenv('PREWARM_LOCK_PATH', os.path.join(tempfile.gettempdir(), 'agri-advisor-prewarm.lock'))
+
+PREWARM_ADVISORIES = metrics.counter(
+    'prewarm_advisories_total',
+    'Pre-warm work per location: generated, unchanged, deferred (rate budget or busy model) or error.',
+    ('result',))
+PREWARM_PASS_SECONDS = metrics.histogram('prewarm_pass_seconds', 'Duration of one pre-warm pass.',
+                                         buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200))
+
+
+class Location:
+    def __init__(self, name, city='', pincode='', lat=None, lon=None):
+        self.name = name
+        self.city = city
+        self.pincode = pincode
+        self.lat = lat
+        self.lon = lon
+        # Weather bucket of the advisory in the cache, the bucket the latest
+        # forecast falls in, and when the advisory was generated
+        self.warmed_key = None
+        self.current_key = None
+        self.warmed_at = None
+        self.error = None
+
+    def coordinates(self):
+        if self.lat is None:
+            found = weather_proxy.geocode(self.city, self.pincode)
+            self.lat, self.lon = found['lat'], found['lon']
+        return self.lat, self.lon
+
+    def is_fresh(self, max_age):
+        return (self.warmed_key is not None and self.warmed_key == self.current_key
+                and time.time() - self.warmed_at < max_age)
+
+    def snapshot(self, max_age):
+        return {
+            'name': self.name,
+            'fresh': self.is_fresh(max_age),
+            'age_seconds': round(time.time() - self.warmed_at) if self.warmed_at else None,
+            'forecast_changed': self.warmed_key is not None and self.warmed_key != self.current_key,
+            'error': self.error,
+        }
+
+
+def parse_location(entry):
+    entry = entry.strip()
+    try:
+        lat, lon = (float(part) for part in entry.split(','))
+        return Location(entry, lat=lat, lon=lon)
+    except ValueError:
+        city, _, pincode = entry.partition('|')
+        return Location(entry, city=city.strip(), pincode=pincode.strip())
+
+
+def load_locations(spec=PREWARM_LOCATIONS, path=PREWARM_LOCATIONS_FILE):
+    locations = [parse_location(entry) for entry in spec.split(';') if entry.strip()]
+    if path:
+        with open(path, encoding='utf-8') as f:
+            for item in json.load(f):
+                name = item.get('name') or item.get('city') or f"{item.get('lat')},{item.get('lon')}"
+                locations.append(Location(name, item.get('city', ''), str(item.get('pincode') or ''),
+                                          item.get('lat'), item.get('lon')))
+    return locations
+
+
+class Prewarmer:
+    """Keeps advisories for a fixed list of places in the response cache.
+
+    generate(weather, refresh) is app.generate_advisory; cache is the
+    advisory response cache it writes to.
+    """
+
+    def __init__(self, locations, generate, cache, max_age=None):
+        self.locations = locations
+        self.generate = generate
+        self.cache = cache
+        # Regenerate before the cache would drop the entry
+        self.max_age = max_age if max_age is not None else cache.backend.ttl * 0.75
+        self.budget = TokenBucketLimiter('prewarm', PREWARM_RATE_PER_MINUTE, max(1, int(PREWARM_RATE_PER_MINUTE)))
+        self.leader = False
+        self.last_pass_at = None
+        self.disabled = None
+        self._lock_file = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, workers=None):
+        if not self.locations or self._thread is not None:
+            return
+        workers = workers if workers is not None else int(os.getenv('WEB_CONCURRENCY', '1'))
+        if workers > 1 and not isinstance(self.cache.backend, SQLiteBackend):
+            self.disabled = 'cache not shared between workers; set CACHE_BACKEND=sqlite'
+            log.warning("Pre-warmer not started", extra={'reason': self.disabled, 'workers': workers})
+            return
+        self._thread = threading.Thread(target=self._run, name='prewarm', daemon=True)
+        self._thread.start()
+        log.info("Pre-warmer started", extra={'locations': len(self.locations), 'interval': PREWARM_INTERVAL})
+
+    def stop(self):
+        self._stop.set()
+
+    def _claim(self):
+        if self.leader or fcntl is None:
+            self.leader = True
+            return True
+        lock_file = open(PREWARM_LOCK_PATH, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        # Held (file kept open) until this process exits
+        self._lock_file = lock_file
+        self.leader = True
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            wait = PREWARM_INTERVAL
+            if self._claim():
+                try:
+                    if self.run_once().get('deferred'):
+                        wait = PREWARM_DEFERRED_RETRY
+                except Exception:
+                    log.exception("Pre-warm pass failed")
+            self._stop.wait(wait)
+
+    def _may_call_model(self):
+        if llm.saturated() or llm.queue_depth() > 0:
+            return False
+        if llm.in_flight() >= llm.LLM_MAX_CONCURRENCY * PREWARM_MAX_SLOT_SHARE:
+            return False
+        return self.budget.take('prewarm') == 0
+
+    def warm(self, location):
+        try:
+            weather_data = weather_proxy.forecast(*location.coordinates())
+            key = advisory_cache_key(weather_data)
+            location.current_key = key
+            cached = self.cache.peek(key) is not None
+            if cached and location.is_fresh(self.max_age):
+                return 'unchanged'
+            if cached and location.warmed_key != key:
+                # Put there by live traffic or another process; its age is unknown
+                location.warmed_key, location.warmed_at = key, time.time()
+                return 'unchanged'
+            if not self._may_call_model():
+                return 'deferred'
+            self.generate(weather_data, refresh=True)
+            location.warmed_key, location.warmed_at, location.error = key, time.time(), None
+            return 'generated'
+        except Exception as e:
+            location.error = str(e)
+            log.warning("Pre-warm failed", extra={'location': location.name, 'error': str(e)})
+            return 'error'
+
+    def run_once(self):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=PREWARM_CONCURRENCY) as pool:
+            results = list(pool.map(self.warm, self.locations))
+        for result in results:
+            PREWARM_ADVISORIES.inc(result=result)
+        elapsed = time.perf_counter() - started
+        PREWARM_PASS_SECONDS.observe(elapsed)
+        self.last_pass_at = time.time()
+        summary = {result: results.count(result) for result in set(results)}
+        log.info("Pre-warm pass finished", extra={'duration_ms': round(elapsed * 1000, 1), **summary})
+        return summary
+
+    def freshness_samples(self):
+        if not self.leader:
+            return []
+        fresh = sum(location.is_fresh(self.max_age) for location in self.locations)
+        return [({'state': 'fresh'}, fresh), ({'state': 'stale'}, len(self.locations) - fresh)]
+
+    def oldest_age(self):
+        ages = [time.time() - location.warmed_at for location in self.locations if location.warmed_at]
+        return max(ages) if ages else 0
+
+    def status(self):
+        return {
+            'leader': self.leader,
+            'disabled': self.disabled,
+            'interval': PREWARM_INTERVAL,
+            'max_age': self.max_age,
+            'last_pass_at': self.last_pass_at,
+            'locations': [location.snapshot(self.max_age) for location in self.locations],
+        }
@@ -0,0 +1,283 @@
+import logging
+import os
+import random
+import threading
+import time
+
+import metrics
+from llm import LLMBusyError
+
+log = logging.getLogger(__name__)
+
+# Whole budget for one model call, retries and failovers included, and the
+# cap on any single attempt. Without these an upstream incident turns into
+# requests that hang for as long as the socket does.
+LLM_CALL_DEADLINE = float(os.getenv('LLM_CALL_DEADLINE', '30'))
+LLM_ATTEMPT_TIMEOUT = float(os.getenv('LLM_ATTEMPT_TIMEOUT', '20'))
+LLM_MAX_ATTEMPTS = int(os.getenv('LLM_MAX_ATTEMPTS', '3'))
+# Exponential backoff between retries of the same model: base * 2^n, capped,
+# with full jitter. Failing over to another model does not wait.
+LLM_BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', '0.5'))
+LLM_BACKOFF_MAX = float(os.getenv('LLM_BACKOFF_MAX', '4'))
+
+# A model's breaker opens after this many failures in a row, stays open for
+# BREAKER_OPEN_SECONDS, then lets one probe call through (half-open)
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_OPEN_SECONDS = float(os.getenv('BREAKER_OPEN_SECONDS', '30'))
+
+# Failover candidates: an explicit list, or else the discovered models minus
+# variants that can't stand in for a chat model
+LLM_FAILOVER_MODELS = [name.strip() for name in os.getenv('LLM_FAILOVER_MODELS', '').split(',') if name.strip()]
+LLM_FAILOVER_EXCLUDE = [part.strip() for part in os.getenv(
+    'LLM_FAILOVER_EXCLUDE', 'tts,image,robotics,computer-use,embedding,gemma,nano-banana,exp,preview').split(',') if part.strip()]
+LLM_FAILOVER_MAX_MODELS = int(os.getenv('LLM_FAILOVER_MAX_MODELS', '3'))
+
+# Weight of the newest observation in the latency / error-rate averages
+EWMA_ALPHA = 0.2
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+BREAKER_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+LLM_ATTEMPTS = metrics.counter('llm_attempts_total', 'Model call attempts by model and outcome.', ('model', 'outcome'))
+LLM_FAILOVERS = metrics.counter('llm_failovers_total', 'Attempts sent to a model other than the first choice.')
+
+
+def failover_candidates(discovered):
+    if LLM_FAILOVER_MODELS:
+        return LLM_FAILOVER_MODELS
+    usable = [name for name in discovered if not any(part in name for part in LLM_FAILOVER_EXCLUDE)]
+    return usable[:LLM_FAILOVER_MAX_MODELS]
+
+
+def classify_error(error):
+    """"fatal" (the request itself is bad), "model" (this model is unusable) or "transient"."""
+    code = getattr(error, 'code', None)
+    if isinstance(code, int):
+        if code == 404:
+            return 'model'
+        if code in (400, 401, 403):
+            return 'fatal'
+        return 'transient'
+    if type(error).__name__ in ('BlockedPromptException', 'StopCandidateException'):
+        return 'fatal'
+    if isinstance(error, (ValueError, TypeError, KeyError)):
+        return 'fatal'
+    return 'transient'
+
+
+class ModelHealth:
+    """Circuit breaker plus latency / error-rate averages for one model."""
+
+    def __init__(self, name):
+        self.name = name
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0
+        self.probe_in_flight = False
+        self.latency = None
+        self.error_rate = 0.0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= BREAKER_OPEN_SECONDS:
+                self.state = HALF_OPEN
+                self.probe_in_flight = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return True
+            return False
+
+    def retry_after(self):
+        if self.state != OPEN:
+            return 0
+        return max(0, BREAKER_OPEN_SECONDS - (time.monotonic() - self.opened_at))
+
+    def record_success(self, seconds):
+        with self._lock:
+            self.calls += 1
+            self.latency = seconds if self.latency is None else (1 - EWMA_ALPHA) * self.latency + EWMA_ALPHA * seconds
+            self.error_rate *= 1 - EWMA_ALPHA
+            self.consecutive_failures = 0
+            if self.state != CLOSED:
+                log.info("Circuit closed", extra={'model': self.name})
+            self.state = CLOSED
+            self.probe_in_flight = False
+
+    def record_failure(self, open_now=False):
+        with self._lock:
+            self.calls += 1
+            self.error_rate = (1 - EWMA_ALPHA) * self.error_rate + EWMA_ALPHA
+            self.consecutive_failures += 1
+            self.probe_in_flight = False
+            if self.state != OPEN and (open_now or self.state == HALF_OPEN
+                                       or self.consecutive_failures >= BREAKER_FAILURE_THRESHOLD):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                log.warning("Circuit opened", extra={'model': self.name, 'failures': self.consecutive_failures})
+
+    def score(self):
+        # Expected seconds per successful answer; unobserved models rank last
+        if self.latency is None:
+            return float('inf')
+        return self.latency / max(1 - self.error_rate, 0.05)
+
+    def snapshot(self):
+        return {
+            'state': self.state,
+            'consecutive_failures': self.consecutive_failures,
+            'latency_ms': round(self.latency * 1000, 1) if self.latency is not None else None,
+            'error_rate': round(self.error_rate, 3),
+            'calls': self.calls,
+            'retry_after': round(self.retry_after(), 1),
+        }
+
+
+def backoff_delay(attempt):
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+
+
+class ResilientModel:
+    """Retries, per-model circuit breakers and failover around a model.
+
+    primary is the model normally used (it may change its model_name, as
+    LazyModel does after a refresh); build_model(name) makes a model for a
+    failover candidate and candidate_names() lists them. Same
+    generate_content interface as the model it wraps.
+    """
+
+    def __init__(self, primary, build_model, candidate_names, pass_timeout=True):
+        self.primary = primary
+        self.build_model = build_model
+        self.candidate_names = candidate_names
+        # genai models take request_options={'timeout': ...}; the fake doesn't need it
+        self.pass_timeout = pass_timeout
+        self._models = {}
+        self._health = {}
+        self._lock = threading.Lock()
+
+    @property
+    def model_name(self):
+        return self.primary.model_name
+
+    def health(self, name):
+        with self._lock:
+            if name not in self._health:
+                self._health[name] = ModelHealth(name)
+            return self._health[name]
+
+    def _model(self, name):
+        if name == self.primary.model_name:
+            return self.primary
+        with self._lock:
+            if name not in self._models:
+                self._models[name] = self.build_model(name)
+            return self._models[name]
+
+    def ranked(self):
+        """Model names in the order they should be tried.
+
+        The primary always comes first (_pick skips it while its breaker
+        refuses calls); the other candidates follow by observed latency and
+        error rate.
+        """
+        primary = self.primary.model_name
+        others = [name for name in failover_candidates(self.candidate_names()) if name != primary]
+        others.sort(key=lambda name: self.health(name).score())
+        return [primary] + others
+
+    def status(self):
+        return {name: self.health(name).snapshot() for name in self.ranked()}
+
+    def _pick(self, tried_last):
+        # First allowed model, preferring one other than the model that just
+        # failed. allow() claims a half-open model's probe, so stop at the first.
+        for name in self.ranked():
+            if name != tried_last and self.health(name).allow():
+                return name
+        if tried_last and self.health(tried_last).allow():
+            return tried_last
+        return None
+
+    def _call_kwargs(self, kwargs, remaining):
+        if self.pass_timeout:
+            kwargs = dict(kwargs)
+            options = dict(kwargs.get('request_options') or {})
+            options['timeout'] = min(options.get('timeout', LLM_ATTEMPT_TIMEOUT), LLM_ATTEMPT_TIMEOUT, remaining)
+            kwargs['request_options'] = options
+        return kwargs
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        if stream:
+            return self._stream(prompt, kwargs)
+        return self._with_retries(lambda name, model, call_kwargs: model.generate_content(prompt, **call_kwargs), kwargs)
+
+    def _with_retries(self, attempt_fn, kwargs):
+        deadline = time.monotonic() + LLM_CALL_DEADLINE
+        last_name = None
+        last_error = None
+        for attempt in range(LLM_MAX_ATTEMPTS):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            name = self._pick(last_name)
+            if name is None:
+                break
+            if name != self.primary.model_name:
+                LLM_FAILOVERS.inc()
+            health = self.health(name)
+            started = time.monotonic()
+            try:
+                result = attempt_fn(name, self._model(name), self._call_kwargs(kwargs, remaining))
+            except Exception as e:
+                kind = classify_error(e)
+                if kind == 'fatal':
+                    # Says nothing about the model's health; free a half-open probe slot
+                    health.probe_in_flight = False
+                    LLM_ATTEMPTS.inc(model=name, outcome='rejected')
+                    raise
+                health.record_failure(open_now=(kind == 'model'))
+                LLM_ATTEMPTS.inc(model=name, outcome='error')
+                log.warning("Model call failed", extra={'model': name, 'attempt': attempt + 1, 'error': str(e)})
+                last_name, last_error = name, e
+                next_name = self._pick_preview(name)
+                if next_name == name and attempt + 1 < LLM_MAX_ATTEMPTS:
+                    time.sleep(min(backoff_delay(attempt), max(deadline - time.monotonic(), 0)))
+                continue
+            health.record_success(time.monotonic() - started)
+            LLM_ATTEMPTS.inc(model=name, outcome='ok')
+            return result
+
+        if last_error is None:
+            retry_after = min((self.health(name).retry_after() for name in self.ranked()), default=BREAKER_OPEN_SECONDS)
+            raise LLMBusyError("Every model's circuit is open", reason='circuit_open',
+                               retry_after=max(1, int(retry_after + 0.999)))
+        raise LLMBusyError(f"Model call failed after retries: {last_error}", reason='upstream_error') from last_error
+
+    def _pick_preview(self, failed):
+        # Whether the next attempt would go to a different model (no backoff then)
+        for name in self.ranked():
+            if name != failed and self.health(name).state != OPEN:
+                return name
+        return failed
+
+    def _stream(self, prompt, kwargs):
+        # Retries and failover are only possible until the first chunk has
+        # been handed to the caller; after that a failure is final.
+        def first_chunk(name, model, call_kwargs):
+            chunks = iter(model.generate_content(prompt, stream=True, **call_kwargs))
+            return name, next(chunks, None), chunks
+
+        name, first, chunks = self._with_retries(first_chunk, kwargs)
+        if first is not None:
+            yield first
+        try:
+            yield from chunks
+        except Exception as e:
+            if classify_error(e) != 'fatal':
+                self.health(name).record_failure()
+                LLM_ATTEMPTS.inc(model=name, outcome='stream_error')
+            raise
@@ -0,0 +1,255 @@
+"""Translations of the scheme catalog, made offline and served from memory.
+
+    python scheme_translations.py                      # every language, stale schemes only
+    python scheme_translations.py --languages hi,ta --batch-size 8
+    python scheme_translations.py --check              # list what is missing or stale
+
+The translations live in one JSON file (SCHEME_TRANSLATIONS_PATH) that is
+deployed with the app. It is not in the repository: run the pipeline (with
+GEMINI_API_KEY set) as a build step before deploying, or every ?lang= is
+answered in English. Each entry carries the hash of the English text it
+was made from, so editing a scheme in schemes.py only invalidates that
+scheme: until the pipeline is run again it is served in English.
+/api/schemes says which it sent in Content-Language.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import llm
+from schemes import SCHEMES, SchemeIndex
+
+log = logging.getLogger(__name__)
+
+SCHEME_TRANSLATIONS_PATH = os.getenv(
+    'SCHEME_TRANSLATIONS_PATH', os.path.join(os.path.dirname(__file__), 'scheme_translations.json'))
+ARTIFACT_FORMAT = 1
+
+# The languages the chat offers (ChatAssistant.tsx), by the code used in ?lang=
+LANGUAGES = {
+    'hi': 'Hindi',
+    'te': 'Telugu',
+    'ta': 'Tamil',
+    'kn': 'Kannada',
+    'mr': 'Marathi',
+    'pa': 'Punjabi',
+    'gu': 'Gujarati',
+    'bn': 'Bengali',
+}
+# Scheme names, links and the state/crop filter values stay as they are
+TRANSLATED_FIELDS = ['description', 'eligibility', 'benefits']
+
+TRANSLATION_SYSTEM_PROMPT = """
+You translate Indian government agriculture scheme descriptions for farmers.
+Use simple, everyday words a farmer would use, not legal or bureaucratic language.
+Keep scheme names, acronyms, amounts (₹), percentages and numbers exactly as written.
+"""
+
+TRANSLATION_RESPONSE_SCHEMA = {
+    'type': 'array',
+    'items': {
+        'type': 'object',
+        'properties': {'id': {'type': 'string'}, **{field: {'type': 'string'} for field in TRANSLATED_FIELDS}},
+        'required': ['id'] + TRANSLATED_FIELDS,
+    },
+}
+TRANSLATION_GENERATION_CONFIG = {
+    'response_mime_type': 'application/json',
+    'response_schema': TRANSLATION_RESPONSE_SCHEMA,
+}
+
+
+def language_code(lang):
+    """'hi', 'Hindi' or 'hindi' -> 'hi'; None for English or unset; KeyError if unsupported."""
+    if not lang:
+        return None
+    key = lang.strip().lower()
+    if key in ('en', 'english'):
+        return None
+    if key in LANGUAGES:
+        return key
+    for code, name in LANGUAGES.items():
+        if name.lower() == key:
+            return code
+    raise KeyError(lang)
+
+
+def source_hash(scheme):
+    source = {field: scheme[field] for field in TRANSLATED_FIELDS}
+    return hashlib.sha256(json.dumps(source, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+
+def load_artifact(path=SCHEME_TRANSLATIONS_PATH):
+    try:
+        with open(path, encoding='utf-8') as f:
+            artifact = json.load(f)
+    except FileNotFoundError:
+        return {'format': ARTIFACT_FORMAT, 'version': 0, 'languages': {}}
+    if artifact.get('format') != ARTIFACT_FORMAT:
+        raise ValueError(f"{path}: unsupported translation format {artifact.get('format')}")
+    return artifact
+
+
+def write_artifact(artifact, path=SCHEME_TRANSLATIONS_PATH):
+    artifact['version'] = artifact.get('version', 0) + 1
+    artifact['generated_at'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(artifact, f, ensure_ascii=False, indent=1, sort_keys=True)
+        f.write('\n')
+    os.replace(tmp_path, path)
+
+
+def stale_schemes(artifact, code, schemes=SCHEMES):
+    """Schemes with no translation into this language, or one made from older text."""
+    entries = artifact['languages'].get(code, {})
+    return [scheme for scheme in schemes if entries.get(scheme['id'], {}).get('hash') != source_hash(scheme)]
+
+
+def translated_catalog(artifact, code, schemes=SCHEMES):
+    """The catalog in one language; schemes without a current translation stay in English."""
+    entries = artifact['languages'].get(code, {})
+    catalog = []
+    translated = 0
+    for scheme in schemes:
+        entry = entries.get(scheme['id'])
+        if entry and entry.get('hash') == source_hash(scheme):
+            scheme = {**scheme, **entry['fields']}
+            translated += 1
+        catalog.append(scheme)
+    return catalog, translated
+
+
+class TranslatedSchemes:
+    """A SchemeIndex per language, built from the artifact at startup."""
+
+    def __init__(self, english_index, path=SCHEME_TRANSLATIONS_PATH):
+        self.english_index = english_index
+        artifact = load_artifact(path)
+        self.version = artifact['version']
+        self.indexes = {}
+        self.coverage = {}
+        for code in LANGUAGES:
+            catalog, translated = translated_catalog(artifact, code, english_index.schemes)
+            self.indexes[code] = SchemeIndex(catalog) if translated else english_index
+            self.coverage[code] = translated
+        if not self.version:
+            log.warning("No scheme translations found, every language is served in English",
+                        extra={'path': path})
+        log.info("Loaded scheme translations", extra={'version': self.version, 'translated': self.coverage})
+
+    def index_for(self, lang):
+        """SchemeIndex to serve for ?lang=; raises KeyError for an unsupported language."""
+        code = language_code(lang)
+        return self.english_index if code is None else self.indexes[code]
+
+    def content_language(self, lang):
+        """Content-Language of index_for(lang): "hi", "hi, en" when partly translated, else "en"."""
+        code = language_code(lang)
+        translated = self.coverage.get(code, 0) if code else 0
+        if not translated:
+            return 'en'
+        return code if translated == len(self.english_index.schemes) else f'{code}, en'
+
+
+def translation_prompt(language, batch):
+    source = [{'id': scheme['id'], **{field: scheme[field] for field in TRANSLATED_FIELDS}} for scheme in batch]
+    return (f"Translate the {', '.join(TRANSLATED_FIELDS)} of each scheme below into {language}. "
+            f"Return one object per scheme with the same id.\n\n"
+            f"{json.dumps(source, ensure_ascii=False, indent=1)}")
+
+
+def parse_translations(text, batch):
+    """{scheme id: fields} for the usable entries of one model answer."""
+    wanted = {scheme['id'] for scheme in batch}
+    try:
+        items = json.loads(text)
+    except ValueError:
+        return {}
+    results = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict) or item.get('id') not in wanted:
+            continue
+        fields = {field: ' '.join(str(item.get(field) or '').split()) for field in TRANSLATED_FIELDS}
+        if all(fields.values()):
+            results[item['id']] = fields
+    return results
+
+
+def translate_language(model, code, schemes, batch_size):
+    language = LANGUAGES[code]
+    results = {}
+    for start in range(0, len(schemes), batch_size):
+        batch = schemes[start:start + batch_size]
+        try:
+            response = llm.generate_content(model, translation_prompt(language, batch),
+                                            generation_config=TRANSLATION_GENERATION_CONFIG)
+            found = parse_translations(response.text, batch)
+        except Exception as e:
+            log.warning("Translation batch failed", extra={'language': language, 'error': str(e)})
+            found = {}
+        for scheme in batch:
+            if scheme['id'] in found:
+                results[scheme['id']] = {'hash': source_hash(scheme), 'fields': found[scheme['id']]}
+        print(f"{language}: {min(start + batch_size, len(schemes))}/{len(schemes)} "
+              f"({len(found)}/{len(batch)} usable)", file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--languages', default=','.join(LANGUAGES), help=f"codes, from: {', '.join(LANGUAGES)}")
+    parser.add_argument('--batch-size', type=int, default=10, help='schemes per model call')
+    parser.add_argument('--concurrency', type=int, default=4, help='languages translated at the same time')
+    parser.add_argument('--all', action='store_true', help='retranslate current entries too')
+    parser.add_argument('--check', action='store_true', help="only report what's missing or stale")
+    parser.add_argument('--path', default=SCHEME_TRANSLATIONS_PATH)
+    args = parser.parse_args()
+
+    codes = [code.strip() for code in args.languages.split(',') if code.strip()]
+    unknown = [code for code in codes if code not in LANGUAGES]
+    if unknown:
+        parser.error(f"unknown languages: {', '.join(unknown)}")
+
+    artifact = load_artifact(args.path)
+    todo = {code: list(SCHEMES) if args.all else stale_schemes(artifact, code) for code in codes}
+    for code, schemes in todo.items():
+        print(f"{LANGUAGES[code]}: {len(schemes)} of {len(SCHEMES)} schemes to translate")
+    if args.check or not any(todo.values()):
+        sys.exit(1 if args.check and any(todo.values()) else 0)
+
+    from dotenv import load_dotenv
+    import google.generativeai as genai
+    import logs
+    load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
+    logs.setup()
+    if os.getenv('GEMINI_API_KEY'):
+        genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+    model = llm.make_model(system_instruction=TRANSLATION_SYSTEM_PROMPT)
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = {code: pool.submit(translate_language, model, code, schemes, args.batch_size)
+                   for code, schemes in todo.items() if schemes}
+    for code, future in futures.items():
+        entries = artifact['languages'].setdefault(code, {})
+        entries.update(future.result())
+    # Drop translations of schemes that no longer exist
+    ids = {scheme['id'] for scheme in SCHEMES}
+    for entries in artifact['languages'].values():
+        for scheme_id in [scheme_id for scheme_id in entries if scheme_id not in ids]:
+            del entries[scheme_id]
+    write_artifact(artifact, args.path)
+    print(f"Wrote {args.path} (version {artifact['version']})")
+    missing = sum(len(stale_schemes(artifact, code)) for code in codes)
+    if missing:
+        print(f"{missing} translations still missing; run again to retry them", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
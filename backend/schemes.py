@@ -0,0 +1,521 @@
+import hashlib
+import json
+from collections import defaultdict
+from functools import lru_cache
+
+# Schemes Data
+#
+# "state" is None for central schemes, which apply in every state.
+# "crops" lists the crops a scheme is limited to; empty means any crop.
+SCHEMES = [
+    {
+        "id": "pm-kisan",
+        "title": "PM-KISAN",
+        "description": "Pradhan Mantri Kisan Samman Nidhi provides financial assistance to landholding farmer families.",
+        "eligibility": "Small and marginal farmer families with cultivable land",
+        "benefits": "₹6,000 per year in three equal installments",
+        "link": "https://pmkisan.gov.in/",
+        "state": None,
+        "crops": []
+    },
+    {
+        "id": "pmfby",
+        "title": "PMFBY",
+        "description": "Pradhan Mantri Fasal Bima Yojana provides insurance coverage for crop loss.",
+        "eligibility": "All farmers including sharecroppers and tenant farmers",
+        "benefits": "Premium: 2% for Kharif, 1.5% for Rabi, 5% for commercial crops",
+        "link": "https://pmfby.gov.in/",
+        "state": None,
+        "crops": []
+    },
+    {
+        "id": "smam",
+        "title": "SMAM",
+        "description": "Sub-Mission on Agricultural Mechanization promotes agricultural mechanization among small and marginal farmers.",
+        "eligibility": "Individual farmers, custom hiring centers, farmer groups",
+        "benefits": "Financial assistance for purchasing agricultural machinery",
+        "link": "https://cemca.org.in/smam-kisan-yojana/",
+        "state": None,
+        "crops": []
+    },
+    {
+        "id": "pkvy",
+        "title": "PKVY",
+        "description": "Paramparagat Krishi Vikas Yojana promotes organic farming practices.",
+        "eligibility": "Farmers willing to practice organic farming",
+        "benefits": "Financial assistance of ₹50,000 per hectare/3 years",
+        "link": "https://pmujjwalayojana.in/paramparagat-krishi-vikas-yojana/",
+        "state": None,
+        "crops": []
+    },
+    {
+        "id": "nfsm",
+        "title": "NFSM",
+        "description": "National Food Security Mission increases production of rice, wheat, pulses, and coarse cereals.",
+        "eligibility": "Farmers in identified districts across the country",
+        "benefits": "Assistance for seeds, treatments, nutrient management etc.",
+        "link": "https://www.nfsm.gov.in/",
+        "state": None,
+        "crops": ["rice", "wheat", "pulses", "maize", "millets"]
+    },
+    {
+        "id": "ysr-rythu-bharosa",
+        "title": "YSR Rythu Bharosa",
+        "description": "Income support for farmers in Andhra Pradesh.",
+        "eligibility": "All resident farmers including tenant farmers.",
+        "benefits": "₹13,500 per year financial assistance.",
+        "link": "https://services.india.gov.in/service/detail/ysr-raithu-bharosa-new-farmer-registration-andhra-pradesh-1",
+        "state": "Andhra Pradesh",
+        "crops": []
+    },
+    {
+        "id": "ap-input-subsidy-scheme",
+        "title": "AP Input Subsidy Scheme",
+        "description": "Support for farmers facing crop loss.",
+        "eligibility": "Farmers affected by natural calamities.",
+        "benefits": "Input subsidy based on damage percentage.",
+        "link": "https://apagrisnet.gov.in/",
+        "state": "Andhra Pradesh",
+        "crops": []
+    },
+    {
+        "id": "arunachal-farmer-welfare-scheme",
+        "title": "Arunachal Farmer Welfare Scheme",
+        "description": "Support for agricultural modernization.",
+        "eligibility": "Small and marginal farmers.",
+        "benefits": "Assistance for seeds, tools, and irrigation.",
+        "link": "https://agri.arunachal.gov.in/",
+        "state": "Arunachal Pradesh",
+        "crops": []
+    },
+    {
+        "id": "assam-farmer-loan-waiver-scheme",
+        "title": "Assam Farmer Loan Waiver Scheme",
+        "description": "Debt relief for small and marginal farmers.",
+        "eligibility": "Farmers with overdue crop loans.",
+        "benefits": "Loan waiver and interest subsidy.",
+        "link": "https://diragri.assam.gov.in/",
+        "state": "Assam",
+        "crops": []
+    },
+    {
+        "id": "assam-tractor-distribution-scheme-cta",
+        "title": "Assam Tractor Distribution Scheme (CTA)",
+        "description": "Provide tractors to farmer groups.",
+        "eligibility": "Registered farmer groups.",
+        "benefits": "Subsidized tractors under state program.",
+        "link": "https://diragri.assam.gov.in/",
+        "state": "Assam",
+        "crops": []
+    },
+    {
+        "id": "bihar-diesel-subsidy-scheme",
+        "title": "Bihar Diesel Subsidy Scheme",
+        "description": "Subsidy for irrigation using diesel pumps.",
+        "eligibility": "All farmers owning diesel irrigation pumps.",
+        "benefits": "Subsidy per litre of diesel.",
+        "link": "https://dbtagriculture.bihar.gov.in/",
+        "state": "Bihar",
+        "crops": []
+    },
+    {
+        "id": "bihar-fasal-sahayata-yojana",
+        "title": "Bihar Fasal Sahayata Yojana",
+        "description": "State crop assistance instead of PMFBY.",
+        "eligibility": "Farmers facing yield loss.",
+        "benefits": "₹7,500–₹10,000 per hectare compensation.",
+        "link": "https://esahkari.bihar.gov.in/coop/FSY/REG_Rabi_2425_update.aspx",
+        "state": "Bihar",
+        "crops": []
+    },
+    {
+        "id": "rajiv-gandhi-kisan-nyay-yojana",
+        "title": "Rajiv Gandhi Kisan Nyay Yojana",
+        "description": "Income support to promote crop productivity.",
+        "eligibility": "Registered farmers of Chhattisgarh.",
+        "benefits": "₹9,000 per acre depending on crop.",
+        "link": "https://agriportal.cg.nic.in/",
+        "state": "Chhattisgarh",
+        "crops": []
+    },
+    {
+        "id": "goa-krishi-card-scheme",
+        "title": "Goa Krishi Card Scheme",
+        "description": "Provides benefits and subsidies to Goan farmers.",
+        "eligibility": "Residents engaged in agriculture.",
+        "benefits": "Fertilizer, seed and machinery subsidy.",
+        "link": "https://agri.goa.gov.in/",
+        "state": "Goa",
+        "crops": []
+    },
+    {
+        "id": "mukhya-mantri-kisan-sahay-yojana",
+        "title": "Mukhya Mantri Kisan Sahay Yojana",
+        "description": "Assistance for farmers during natural calamities.",
+        "eligibility": "Farmers suffering crop damage.",
+        "benefits": "Up to ₹25,000 per hectare.",
+        "link": "https://ikhedut.gujarat.gov.in/",
+        "state": "Gujarat",
+        "crops": []
+    },
+    {
+        "id": "ikhedut-portal-schemes",
+        "title": "IKhedut Portal Schemes",
+        "description": "Unified portal for farm subsidies and tools.",
+        "eligibility": "All Gujarat farmers.",
+        "benefits": "Subsidy for seeds, machinery, irrigation.",
+        "link": "https://ikhedut.gujarat.gov.in/",
+        "state": "Gujarat",
+        "crops": []
+    },
+    {
+        "id": "meri-fasal-mera-byora",
+        "title": "Meri Fasal Mera Byora",
+        "description": "Crop registration and subsidy distribution.",
+        "eligibility": "All farmers of Haryana.",
+        "benefits": "Direct benefit transfer for crops.",
+        "link": "https://fasal.haryana.gov.in/",
+        "state": "Haryana",
+        "crops": []
+    },
+    {
+        "id": "bhavantar-bharpai-yojana",
+        "title": "Bhavantar Bharpai Yojana",
+        "description": "Price deficit compensation.",
+        "eligibility": "Registered farmers selling crops.",
+        "benefits": "Difference paid if market price < MSP.",
+        "link": "https://sarkariyojana.com/bhavantar-bharpai-yojana-haryana/",
+        "state": "Haryana",
+        "crops": []
+    },
+    {
+        "id": "hp-mukhya-mantri-kisan-evam-khetihar-mazdoor-samman-nidhi",
+        "title": "HP Mukhya Mantri Kisan Evam Khetihar Mazdoor Samman Nidhi",
+        "description": "Financial aid to small farmers.",
+        "eligibility": "Small and marginal farmers.",
+        "benefits": "₹3,000 financial assistance.",
+        "link": "https://www.hpagrisnet.gov.in/",
+        "state": "Himachal Pradesh",
+        "crops": []
+    },
+    {
+        "id": "jharkhand-krishi-rin-maafi",
+        "title": "Jharkhand Krishi Rin Maafi",
+        "description": "Loan waiver for state farmers.",
+        "eligibility": "Small and marginal farmers with crop loans.",
+        "benefits": "Loan waiver up to ₹50,000.",
+        "link": "https://jkrmy.jharkhand.gov.in/",
+        "state": "Jharkhand",
+        "crops": []
+    },
+    {
+        "id": "raitha-siri-scheme",
+        "title": "Raitha Siri Scheme",
+        "description": "Support for millet farmers.",
+        "eligibility": "Farmers growing minor millets.",
+        "benefits": "₹10,000 per hectare input subsidy.",
+        "link": "https://raitamitra.karnataka.gov.in/",
+        "state": "Karnataka",
+        "crops": ["millets"]
+    },
+    {
+        "id": "ganga-kalyana-scheme",
+        "title": "Ganga Kalyana Scheme",
+        "description": "Irrigation borewell subsidy.",
+        "eligibility": "Small and marginal farmers.",
+        "benefits": "Subsidy for drilling borewells.",
+        "link": "https://kmdc.karnataka.gov.in/31/ganga-kalyana-schmeme/en",
+        "state": "Karnataka",
+        "crops": []
+    },
+    {
+        "id": "kerala-subhiksha-keralam",
+        "title": "Kerala Subhiksha Keralam",
+        "description": "State food security and farming mission.",
+        "eligibility": "Farmers and farmer groups.",
+        "benefits": "Support for seeds, machinery, training.",
+        "link": "https://www.aims.kerala.gov.in/subhikshakeralam",
+        "state": "Kerala",
+        "crops": []
+    },
+    {
+        "id": "mp-krishi-rin-samadhan-yojana",
+        "title": "MP Krishi Rin Samadhan Yojana",
+        "description": "Waiver and restructuring of crop loans.",
+        "eligibility": "Small and marginal farmers.",
+        "benefits": "Loan relief and subsidy.",
+        "link": "https://mpkrishi.mp.gov.in/",
+        "state": "Madhya Pradesh",
+        "crops": []
+    },
+    {
+        "id": "mukhya-mantri-krishak-samagra-samman-yojana",
+        "title": "Mukhya Mantri Krishak Samagra Samman Yojana",
+        "description": "Income support scheme.",
+        "eligibility": "All registered farmers.",
+        "benefits": "Annual financial assistance.",
+        "link": "https://mpkrishi.mp.gov.in/",
+        "state": "Madhya Pradesh",
+        "crops": []
+    },
+    {
+        "id": "mahadbt-farmer-schemes",
+        "title": "MahaDBT Farmer Schemes",
+        "description": "Unified portal for subsidies and farm schemes.",
+        "eligibility": "All Maharashtra farmers.",
+        "benefits": "Seed, irrigation, machinery subsidy.",
+        "link": "https://mahadbt.maharashtra.gov.in/",
+        "state": "Maharashtra",
+        "crops": []
+    },
+    {
+        "id": "chhatrapati-shivaji-maharaj-shetkari-sanman-yojana",
+        "title": "Chhatrapati Shivaji Maharaj Shetkari Sanman Yojana",
+        "description": "Loan waiver program.",
+        "eligibility": "Small farmers with overdue loans.",
+        "benefits": "Loan waiver up to ₹1 lakh.",
+        "link": "https://krishi.maharashtra.gov.in/",
+        "state": "Maharashtra",
+        "crops": []
+    },
+    {
+        "id": "manipur-agriculture-assistance-scheme",
+        "title": "Manipur Agriculture Assistance Scheme",
+        "description": "Financial help during crop loss.",
+        "eligibility": "Farmers affected by natural calamities.",
+        "benefits": "Relief assistance.",
+        "link": "https://agrimanipur.mn.gov.in/",
+        "state": "Manipur",
+        "crops": []
+    },
+    {
+        "id": "megha-lamp-scheme",
+        "title": "Megha-LAMP Scheme",
+        "description": "Livelihood improvement for farmers.",
+        "eligibility": "Rural farmers and SHGs.",
+        "benefits": "Training, inputs, irrigation support.",
+        "link": "https://megagriculture.gov.in/",
+        "state": "Meghalaya",
+        "crops": []
+    },
+    {
+        "id": "new-land-use-policy-nlup",
+        "title": "New Land Use Policy (NLUP)",
+        "description": "Livelihood and agriculture modernization.",
+        "eligibility": "Resident farmers of Mizoram.",
+        "benefits": "Support for farming and tools.",
+        "link": "https://mamit.nic.in/scheme/nlup-scheme/",
+        "state": "Mizoram",
+        "crops": []
+    },
+    {
+        "id": "nagaland-agriculture-mechanization-scheme",
+        "title": "Nagaland Agriculture Mechanization Scheme",
+        "description": "Support for machinery and farming tools.",
+        "eligibility": "Small and marginal farmers.",
+        "benefits": "Machinery subsidy.",
+        "link": "https://agriculture.nagaland.gov.in/smam/",
+        "state": "Nagaland",
+        "crops": []
+    },
+    {
+        "id": "kalia-scheme",
+        "title": "KALIA Scheme",
+        "description": "Income support and financial protection for farmers.",
+        "eligibility": "Small, marginal farmers & landless labourers.",
+        "benefits": "₹10,000 yearly assistance + insurance.",
+        "link": "https://jaagrukbharat.com/kalia-portal-2024-empowering-farmers-in-odisha-with-agricultural-support-1412133",
+        "state": "Odisha",
+        "crops": []
+    },
+    {
+        "id": "punjab-smart-connect-farmers-scheme",
+        "title": "Punjab Smart Connect Farmers Scheme",
+        "description": "Mobile phones for farmers for agri updates.",
+        "eligibility": "Small and marginal farmers.",
+        "benefits": "Free smartphones.",
+        "link": "https://farmerregistration.anaajkharid.in/",
+        "state": "Punjab",
+        "crops": []
+    },
+    {
+        "id": "rajasthan-kisan-mitra-energy-scheme",
+        "title": "Rajasthan Kisan Mitra Energy Scheme",
+        "description": "Electricity subsidy for farmers.",
+        "eligibility": "Farmers using agricultural connections.",
+        "benefits": "₹1,000 monthly electricity subsidy.",
+        "link": "https://agriculture.rajasthan.gov.in/",
+        "state": "Rajasthan",
+        "crops": []
+    },
+    {
+        "id": "organic-farming-mission",
+        "title": "Organic Farming Mission",
+        "description": "Support for 100% organic agriculture.",
+        "eligibility": "Farmers participating in organic practices.",
+        "benefits": "Subsidy for organic inputs.",
+        "link": "https://sikkimagrisnet.org/",
+        "state": "Sikkim",
+        "crops": []
+    },
+    {
+        "id": "tamil-nadu-crop-insurance-scheme",
+        "title": "Tamil Nadu Crop Insurance Scheme",
+        "description": "State-backed crop insurance program.",
+        "eligibility": "Registered farmers.",
+        "benefits": "Compensation during crop loss.",
+        "link": "https://tnsericulture.tn.gov.in/cropinsurance",
+        "state": "Tamil Nadu",
+        "crops": []
+    },
+    {
+        "id": "rythu-bandhu-scheme",
+        "title": "Rythu Bandhu Scheme",
+        "description": "Income support for farmers.",
+        "eligibility": "All land-owning farmers.",
+        "benefits": "₹10,000 per acre/year.",
+        "link": "https://rythubharosa.telangana.gov.in/",
+        "state": "Telangana",
+        "crops": []
+    },
+    {
+        "id": "tripura-farmer-input-assistance",
+        "title": "Tripura Farmer Input Assistance",
+        "description": "Support during crop damage.",
+        "eligibility": "Farmers affected by disasters.",
+        "benefits": "Input subsidy.",
+        "link": "https://agri.tripura.gov.in/",
+        "state": "Tripura",
+        "crops": []
+    },
+    {
+        "id": "up-kisan-samman-nidhi-state-top-up",
+        "title": "UP Kisan Samman Nidhi (State Top-Up)",
+        "description": "Additional farmer support.",
+        "eligibility": "All PM-KISAN beneficiaries.",
+        "benefits": "Extra state financial support.",
+        "link": "https://farmerregistry.up.in/",
+        "state": "Uttar Pradesh",
+        "crops": []
+    },
+    {
+        "id": "up-free-irrigation-scheme",
+        "title": "UP Free Irrigation Scheme",
+        "description": "Free canal water for irrigation.",
+        "eligibility": "All registered farmers.",
+        "benefits": "Zero irrigation charges.",
+        "link": "https://farmerregistry.up.in/",
+        "state": "Uttar Pradesh",
+        "crops": []
+    },
+    {
+        "id": "uttarakhand-organic-agriculture-scheme",
+        "title": "Uttarakhand Organic Agriculture Scheme",
+        "description": "Support for organic farming in hill regions.",
+        "eligibility": "Hill farmers.",
+        "benefits": "Organic inputs subsidy.",
+        "link": "https://agriculture.uk.gov.in/",
+        "state": "Uttarakhand",
+        "crops": []
+    },
+    {
+        "id": "krishak-bandhu-scheme",
+        "title": "Krishak Bandhu Scheme",
+        "description": "Income support + crop insurance for state farmers.",
+        "eligibility": "All land-owning farmers.",
+        "benefits": "₹10,000 yearly aid + insurance cover.",
+        "link": "https://krishakbandhu.wb.gov.in/users/sign_up",
+        "state": "West Bengal",
+        "crops": []
+    }
+]
+
+# Short forms farmers (and older clients) use for state names
+STATE_ALIASES = {
+    "ap": "Andhra Pradesh",
+    "andhra": "Andhra Pradesh",
+    "up": "Uttar Pradesh",
+    "uttar": "Uttar Pradesh",
+    "mp": "Madhya Pradesh",
+    "madhya": "Madhya Pradesh",
+    "hp": "Himachal Pradesh",
+    "himachal": "Himachal Pradesh",
+    "arunachal": "Arunachal Pradesh",
+    "wb": "West Bengal",
+    "bengal": "West Bengal",
+    "tn": "Tamil Nadu",
+    "orissa": "Odisha",
+}
+
+CROP_ALIASES = {
+    "paddy": "rice",
+    "millet": "millets",
+    "coarse cereals": "millets",
+}
+
+
+class SchemeIndex:
+    """The scheme catalog with state/crop postings, built once at startup.
+
+    A filtered lookup is a couple of set operations instead of a scan of the
+    catalog, and each distinct filter's JSON body and ETag are memoized.
+    """
+
+    def __init__(self, schemes):
+        self.schemes = list(schemes)
+        self.central_ids = set()
+        self.state_ids = defaultdict(set)
+        self.crop_ids = defaultdict(set)
+        self.any_crop_ids = set()
+        self.states = {}
+
+        for position, scheme in enumerate(self.schemes):
+            if scheme['state'] is None:
+                self.central_ids.add(position)
+            else:
+                self.state_ids[scheme['state']].add(position)
+                self.states[scheme['state'].lower()] = scheme['state']
+            if scheme['crops']:
+                for crop in scheme['crops']:
+                    self.crop_ids[crop].add(position)
+            else:
+                self.any_crop_ids.add(position)
+
+        self._all_ids = set(range(len(self.schemes)))
+        self.lookup = lru_cache(maxsize=1024)(self._lookup)
+
+    def normalize_state(self, state):
+        if not state:
+            return None
+        key = state.strip().lower()
+        return self.states.get(key) or STATE_ALIASES.get(key) or state.strip()
+
+    def normalize_crop(self, crop):
+        if not crop:
+            return None
+        key = crop.strip().lower()
+        return CROP_ALIASES.get(key, key)
+
+    def filter_ids(self, state=None, crop=None):
+        ids = self._all_ids
+        if state:
+            ids = self.central_ids | self.state_ids.get(state, set())
+        if crop:
+            ids = ids & (self.any_crop_ids | self.crop_ids.get(crop, set()))
+        return sorted(ids)
+
+    def filter(self, state=None, crop=None):
+        ids = self.filter_ids(self.normalize_state(state), self.normalize_crop(crop))
+        return [self.schemes[i] for i in ids]
+
+    def _lookup(self, state, crop):
+        ids = self.filter_ids(state, crop)
+        body = json.dumps([self.schemes[i] for i in ids], ensure_ascii=False).encode('utf-8')
+        return body, hashlib.sha1(body).hexdigest()
+
+    def response_for(self, state=None, crop=None):
+        """Serialized JSON body and its ETag for one filter combination."""
+        return self.lookup(self.normalize_state(state), self.normalize_crop(crop))
+
+
+scheme_index = SchemeIndex(SCHEMES)
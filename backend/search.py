@@ -0,0 +1,220 @@
+import bisect
+import heapq
+import itertools
+import math
+import re
+import unicodedata
+from collections import defaultdict
+
+import numpy as np
+
+from schemes import SCHEMES
+
+# How much a hit in each field counts towards a scheme's term frequency
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'aliases': 2.5,
+    'description': 1.0,
+    'eligibility': 0.5,
+    'benefits': 0.5,
+}
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Query terms with a trigram similarity below this are not treated as typos
+MIN_TRIGRAM_SIMILARITY = 0.4
+# Typo matches score at their similarity times this factor
+FUZZY_PENALTY = 0.8
+# Bounds on typo and prefix lookups: index terms examined, and terms a query
+# token may expand to (the most similar ones)
+MAX_FUZZY_CANDIDATES = 2000
+MAX_EXPANSIONS = 20
+
+# Words that appear in nearly every scheme and only add noise
+STOPWORDS = {
+    'a', 'an', 'and', 'for', 'in', 'of', 'on', 'or', 'the', 'to', 'with', 'per',
+    'scheme', 'schemes', 'yojana', 'farmer', 'farmers', 'all',
+}
+
+# Spelling variants and native-script words mapped to one canonical token, so
+# "fasal beema", "फसल बीमा" and "Fasal Bima" land on the same postings.
+TERM_VARIANTS = {
+    'beema': 'bima', 'bheema': 'bima', 'vima': 'bima', 'बीमा': 'bima', 'विमा': 'bima', 'ಬಿಮಾ': 'bima', 'ವಿಮೆ': 'bima',
+    'fasl': 'fasal', 'phasal': 'fasal', 'फसल': 'fasal', 'ಫಸಲ್': 'fasal', 'ಬೆಳೆ': 'fasal',
+    'kissan': 'kisan', 'kisaan': 'kisan', 'किसान': 'kisan', 'ಕಿಸಾನ್': 'kisan',
+    'nidi': 'nidhi', 'निधि': 'nidhi', 'ನಿಧಿ': 'nidhi',
+    'samman': 'samman', 'sanman': 'samman', 'सम्मान': 'samman', 'ಸಮ್ಮಾನ್': 'samman',
+    'yojna': 'yojana', 'योजना': 'yojana', 'ಯೋಜನೆ': 'yojana',
+    'pradhan': 'pradhan', 'प्रधान': 'pradhan', 'mantri': 'mantri', 'मंत्री': 'mantri',
+    'raita': 'raitha', 'rythu': 'raitha', 'raithu': 'raitha', 'ರೈತ': 'raitha',
+    'jaivik': 'organic', 'जैविक': 'organic', 'ಸಾವಯವ': 'organic',
+    'sinchai': 'irrigation', 'सिंचाई': 'irrigation', 'ನೀರಾವರಿ': 'irrigation',
+    'karz': 'loan', 'rin': 'loan', 'ऋण': 'loan', 'कर्ज': 'loan', 'ಸಾಲ': 'loan',
+    'maafi': 'waiver', 'mafi': 'waiver', 'माफी': 'waiver', 'ಮನ್ನಾ': 'waiver',
+}
+
+# Extra names people use for a scheme, by scheme id
+SCHEME_ALIASES = {
+    'pm-kisan': ['kisan samman nidhi', 'pm kisan nidhi', 'किसान सम्मान निधि', 'ಕಿಸಾನ್ ಸಮ್ಮಾನ್ ನಿಧಿ'],
+    'pmfby': ['fasal bima yojana', 'crop insurance', 'फसल बीमा योजना', 'ಫಸಲ್ ಬಿಮಾ ಯೋಜನೆ'],
+    'smam': ['krishi yantrikaran', 'farm machinery subsidy', 'कृषि यंत्रीकरण'],
+    'pkvy': ['paramparagat krishi vikas', 'organic farming', 'परंपरागत कृषि विकास योजना'],
+    'nfsm': ['food security mission', 'राष्ट्रीय खाद्य सुरक्षा मिशन'],
+    'raitha-siri-scheme': ['raitha siri', 'ರೈತ ಸಿರಿ', 'millet subsidy'],
+    'ganga-kalyana-scheme': ['ganga kalyan', 'ಗಂಗಾ ಕಲ್ಯಾಣ', 'borewell subsidy'],
+    'rythu-bandhu-scheme': ['raitha bandhu', 'రైతు బంధు'],
+    'ysr-rythu-bharosa': ['raitha bharosa', 'వైఎస్ఆర్ రైతు భరోసా'],
+    'kalia-scheme': ['କାଳିଆ'],
+    'krishak-bandhu-scheme': ['কৃষক বন্ধু'],
+}
+
+SEARCHABLE_FIELDS = ['id', 'title', 'description', 'eligibility', 'benefits', 'link', 'state', 'crops']
+
+
+_TOKEN_PATTERN = re.compile(r'[\wऀ-෿]+')
+# Between schemes when a whole field is tokenized at once; never part of a word
+_SEPARATOR = '\x01'
+_FIELD_PATTERN = re.compile(r'[\wऀ-෿]+|\x01')
+
+
+def tokenize(text):
+    text = unicodedata.normalize('NFKC', text or '').casefold()
+    tokens = [TERM_VARIANTS.get(token, token) for token in _TOKEN_PATTERN.findall(text)]
+    return [token for token in tokens if token not in STOPWORDS]
+
+
+def trigrams(term):
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SchemeSearch:
+    """BM25 ranking over the scheme catalog with a trigram index for typos.
+
+    Per-(term, scheme) BM25 weights are computed when the index is built and
+    stored as one postings array per term, so a query is a weighted bincount
+    over a few array slices plus a partial sort for the top hits.
+    """
+
+    def __init__(self, schemes):
+        self.schemes = list(schemes)
+        # Each field of every scheme is tokenized in one pass, with a separator
+        # token between schemes; variants and stopwords are then resolved once
+        # per distinct token rather than once per occurrence
+        raw_ids = defaultdict(itertools.count(1).__next__, {_SEPARATOR: 0})
+        field_tokens = []
+        for field, weight in FIELD_WEIGHTS.items():
+            if field == 'aliases':
+                texts = [' '.join(SCHEME_ALIASES.get(scheme['id'], [])) for scheme in self.schemes]
+            else:
+                texts = [scheme.get(field, '') or '' for scheme in self.schemes]
+            text = unicodedata.normalize('NFKC', f' {_SEPARATOR} '.join(texts)).casefold()
+            field_tokens.append((weight, np.array([raw_ids[token] for token in _FIELD_PATTERN.findall(text)],
+                                                  dtype=np.int64)))
+        self.term_ids = {}
+        canonical = np.full(len(raw_ids), -1, dtype=np.int64)
+        for token, raw_id in raw_ids.items():
+            token = TERM_VARIANTS.get(token, token)
+            if raw_id and token not in STOPWORDS:
+                canonical[raw_id] = self.term_ids.setdefault(token, len(self.term_ids))
+        docs, terms, weights = [], [], []
+        for weight, raw in field_tokens:
+            keep = canonical[raw] >= 0
+            docs.append(np.cumsum(raw == 0)[keep])
+            terms.append(canonical[raw][keep])
+            weights.append(np.full(int(keep.sum()), weight))
+
+        total = len(self.schemes)
+        vocabulary = len(self.term_ids)
+        docs, terms, weights = np.concatenate(docs), np.concatenate(terms), np.concatenate(weights)
+        # Sum field weights per (term, scheme): the BM25 term frequency
+        pairs, inverse = np.unique(terms * max(total, 1) + docs, return_inverse=True)
+        tf = np.bincount(inverse, weights=weights, minlength=len(pairs))
+        pair_terms, pair_docs = pairs // max(total, 1), pairs % max(total, 1)
+
+        lengths = np.bincount(docs, weights=weights, minlength=total)
+        avg_length = lengths.mean() if total else 1.0
+        doc_freq = np.bincount(pair_terms, minlength=vocabulary)
+        idf = np.log(1 + (total - doc_freq + 0.5) / (doc_freq + 0.5))
+        norm = K1 * (1 - B + B * lengths / (avg_length or 1.0))
+        # pairs are sorted by term, then scheme: postings are contiguous slices
+        self.posting_docs = pair_docs
+        self.posting_scores = idf[pair_terms] * tf * (K1 + 1) / (tf + norm[pair_docs])
+        self.posting_offsets = np.concatenate(([0], np.cumsum(doc_freq)))
+
+        self.trigram_terms = defaultdict(list)
+        self.term_trigrams = []
+        for term in self.term_ids:
+            grams = trigrams(term)
+            self.term_trigrams.append(grams)
+            for gram in grams:
+                self.trigram_terms[gram].append(term)
+        self.trigram_terms = dict(self.trigram_terms)
+        self.sorted_terms = sorted(self.term_ids)
+
+    def expand(self, token):
+        """Index terms to look up for one query token, with their weights."""
+        if token in self.term_ids:
+            return [(token, 1.0)]
+        grams = trigrams(token)
+        # A term with Jaccard similarity >= t shares at least ceil(t * |grams|)
+        # of the token's trigrams, so it must contain one of the rarest
+        # |grams| - that + 1 of them: only those lists need to be read
+        needed = math.ceil(MIN_TRIGRAM_SIMILARITY * len(grams))
+        probes = sorted(grams, key=lambda gram: len(self.trigram_terms.get(gram, ())))[:len(grams) - needed + 1]
+        candidates = set()
+        for gram in probes:
+            candidates.update(self.trigram_terms.get(gram, ()))
+            if len(candidates) >= MAX_FUZZY_CANDIDATES:
+                break
+        matches = []
+        for term in candidates:
+            other = self.term_trigrams[self.term_ids[term]]
+            shared = len(grams & other)
+            similarity = shared / (len(grams) + len(other) - shared)
+            if similarity >= MIN_TRIGRAM_SIMILARITY:
+                matches.append((term, similarity * FUZZY_PENALTY))
+        if matches:
+            return heapq.nlargest(MAX_EXPANSIONS, matches, key=lambda match: (match[1], match[0]))
+        # A prefix is what people type while the list is still loading
+        if len(token) < 3:
+            return []
+        start = bisect.bisect_left(self.sorted_terms, token)
+        prefixed = itertools.takewhile(lambda term: term.startswith(token), self.sorted_terms[start:start + MAX_EXPANSIONS])
+        return [(term, 0.5) for term in prefixed]
+
+    def search(self, query, allowed_ids=None, limit=None):
+        """Return (total matches, [(position, score), ...] best first).
+
+        With a limit only the top `limit` hits are ranked, which is all a
+        paginated request needs.
+        """
+        positions, scores = [], []
+        for token in tokenize(query):
+            for term, weight in self.expand(token):
+                term_id = self.term_ids[term]
+                start, end = self.posting_offsets[term_id], self.posting_offsets[term_id + 1]
+                positions.append(self.posting_docs[start:end])
+                scores.append(self.posting_scores[start:end] * weight)
+        if not positions:
+            return 0, []
+        totals = np.bincount(np.concatenate(positions), weights=np.concatenate(scores), minlength=len(self.schemes))
+        if allowed_ids is not None:
+            allowed = np.zeros(len(self.schemes), dtype=bool)
+            allowed[np.asarray(allowed_ids, dtype=np.int64)] = True
+            totals[~allowed] = 0
+        # Every posting scores above zero, so zero means no match
+        matched = np.flatnonzero(totals)
+        total = len(matched)
+        if limit is not None and limit < total:
+            # Everything scoring at least the limit-th best, ties included
+            cutoff = -np.partition(-totals[matched], limit - 1)[limit - 1]
+            matched = matched[totals[matched] >= cutoff]
+        # Best first, ties by catalog order
+        matched = matched[np.lexsort((matched, -totals[matched]))][:limit]
+        return total, list(zip(matched.tolist(), totals[matched].tolist()))
+
+
+scheme_search = SchemeSearch(SCHEMES)
@@ -0,0 +1,204 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Where sessions live: "memory" (per worker) or "sqlite" (shared by workers).
+# With several workers the turns of one chat land in different processes, so
+# the default is then sqlite.
+SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'sqlite' if int(os.getenv('WEB_CONCURRENCY', '1')) > 1 else 'memory')
+SESSION_SQLITE_PATH = os.getenv('SESSION_SQLITE_PATH', os.path.join(os.path.dirname(__file__), 'sessions.sqlite3'))
+# Idle sessions are dropped after this many seconds
+SESSION_IDLE_TTL = int(os.getenv('SESSION_IDLE_TTL', str(2 * 60 * 60)))
+SESSION_MAX_SESSIONS = int(os.getenv('SESSION_MAX_SESSIONS', '10000'))
+# Per session: turns kept verbatim and their total size; older turns are
+# folded into the summary
+SESSION_MAX_TURNS = int(os.getenv('SESSION_MAX_TURNS', '12'))
+SESSION_MAX_CHARS = int(os.getenv('SESSION_MAX_CHARS', '6000'))
+SESSION_SUMMARY_MAX_CHARS = int(os.getenv('SESSION_SUMMARY_MAX_CHARS', '1200'))
+# Budget for history sent with each prompt, in (estimated) tokens
+SESSION_CONTEXT_TOKENS = int(os.getenv('SESSION_CONTEXT_TOKENS', '1200'))
+
+# Rough size of a token for budgeting; Gemini averages ~4 chars for English
+CHARS_PER_TOKEN = 4
+# How much of each folded turn survives in the summary
+SUMMARY_TURN_CHARS = 160
+
+SESSION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+SPEAKERS = {'user': 'Farmer', 'model': 'Advisor'}
+
+
+def valid_session_id(session_id):
+    return isinstance(session_id, str) and bool(SESSION_ID_PATTERN.match(session_id))
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _gist(turn):
+    # First sentence (or the first SUMMARY_TURN_CHARS) of a turn. Extractive
+    # on purpose: summarizing with the model would add a call to every turn.
+    text = ' '.join(turn['text'].split())
+    sentence = re.split(r'(?<=[.!?।])\s', text, maxsplit=1)[0]
+    if len(sentence) > SUMMARY_TURN_CHARS:
+        sentence = sentence[:SUMMARY_TURN_CHARS].rsplit(' ', 1)[0] + '...'
+    return f"{SPEAKERS[turn['role']]}: {sentence}"
+
+
+def fold_into_summary(summary, turns):
+    if not turns:
+        return summary
+    summary = '\n'.join(filter(None, [summary] + [_gist(turn) for turn in turns]))
+    # Rolling: the oldest gists fall off the front when the summary is full
+    if len(summary) > SESSION_SUMMARY_MAX_CHARS:
+        summary = summary[-SESSION_SUMMARY_MAX_CHARS:]
+        summary = summary[summary.find('\n') + 1:] if '\n' in summary else summary
+    return summary
+
+
+def new_session():
+    return {'summary': '', 'turns': []}
+
+
+def compact(session):
+    """Fold the oldest turns into the summary until the session is within bounds."""
+    turns = session['turns']
+    folded = []
+    while turns and (len(turns) > SESSION_MAX_TURNS or sum(len(t['text']) for t in turns) > SESSION_MAX_CHARS):
+        folded.append(turns.pop(0))
+    session['summary'] = fold_into_summary(session['summary'], folded)
+    return session
+
+
+def add_exchange(session, user_text, model_text, had_image=False):
+    if had_image:
+        user_text = f"[sent a photo] {user_text or ''}".strip()
+    session['turns'].append({'role': 'user', 'text': user_text or ''})
+    session['turns'].append({'role': 'model', 'text': model_text})
+    return compact(session)
+
+
+def build_context(session, budget_tokens=SESSION_CONTEXT_TOKENS):
+    """Text to put ahead of the new message, within budget_tokens.
+
+    Newest turns go in verbatim; turns that don't fit are collapsed into the
+    summary. Returns '' for a new session.
+    """
+    verbatim = []
+    used = estimate_tokens(session['summary']) if session['summary'] else 0
+    older = list(session['turns'])
+    while older:
+        cost = estimate_tokens(older[-1]['text'])
+        if used + cost > budget_tokens:
+            break
+        verbatim.insert(0, older.pop())
+        used += cost
+
+    summary = fold_into_summary(session['summary'], older)
+    if not summary and not verbatim:
+        return ''
+    sections = []
+    if summary:
+        sections.append(f"Summary of the earlier conversation:\n{summary}")
+    if verbatim:
+        sections.append("Most recent messages:\n" + '\n'.join(
+            f"{SPEAKERS[turn['role']]}: {turn['text']}" for turn in verbatim))
+    return '\n\n'.join(sections) + "\n\nContinue this conversation. The farmer's new message follows."
+
+
+class MemorySessionStore:
+    """Sessions in this process, LRU-evicted by idle time and total size."""
+
+    def __init__(self, max_sessions=SESSION_MAX_SESSIONS, idle_ttl=SESSION_IDLE_TTL):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return new_session()
+            used_at, session = entry
+            if time.time() - used_at > self.idle_ttl:
+                del self._sessions[session_id]
+                return new_session()
+            return json.loads(json.dumps(session))
+
+    def save(self, session_id, session):
+        now = time.time()
+        with self._lock:
+            self._sessions[session_id] = (now, session)
+            self._sessions.move_to_end(session_id)
+            while self._sessions:
+                oldest_id, (used_at, _) = next(iter(self._sessions.items()))
+                if len(self._sessions) <= self.max_sessions and now - used_at <= self.idle_ttl:
+                    break
+                del self._sessions[oldest_id]
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class SQLiteSessionStore:
+    """Sessions in a SQLite file shared by all workers on the machine."""
+
+    def __init__(self, path=SESSION_SQLITE_PATH, max_sessions=SESSION_MAX_SESSIONS, idle_ttl=SESSION_IDLE_TTL):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS chat_sessions ('
+                ' id TEXT PRIMARY KEY, data TEXT NOT NULL, used_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS chat_sessions_lru ON chat_sessions (used_at)')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def load(self, session_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT data FROM chat_sessions WHERE id = ? AND used_at >= ?',
+                (session_id, time.time() - self.idle_ttl),
+            ).fetchone()
+        return json.loads(row[0]) if row else new_session()
+
+    def save(self, session_id, session):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO chat_sessions (id, data, used_at) VALUES (?, ?, ?)',
+                (session_id, json.dumps(session, ensure_ascii=False), now),
+            )
+            conn.execute('DELETE FROM chat_sessions WHERE used_at < ?', (now - self.idle_ttl,))
+            conn.execute(
+                'DELETE FROM chat_sessions WHERE id IN ('
+                ' SELECT id FROM chat_sessions ORDER BY used_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_sessions,),
+            )
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM chat_sessions').fetchone()[0]
+
+
+def make_session_store():
+    if SESSION_BACKEND == 'sqlite':
+        return SQLiteSessionStore()
+    return MemorySessionStore()
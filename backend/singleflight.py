@@ -0,0 +1,146 @@
+import hashlib
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: in-process coalescing only
+    fcntl = None
+
+# Directory for cross-worker lock files. Unset means coalescing only happens
+# between requests inside the same worker process.
+SINGLEFLIGHT_LOCK_DIR = os.getenv('SINGLEFLIGHT_LOCK_DIR')
+# How long a follower waits for the leader before making its own call
+SINGLEFLIGHT_WAIT_TIMEOUT = float(os.getenv('SINGLEFLIGHT_WAIT_TIMEOUT', '60'))
+LOCK_POLL_INTERVAL = 0.05
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapse concurrent identical calls into one.
+
+    The first caller for a key runs fn(); callers that arrive while it is
+    running wait and get the same result, or the same exception.
+
+    With a lock directory, a file lock per key extends this to other worker
+    processes: a worker that finds the lock taken waits for it, then calls
+    recheck() (normally a shared-cache lookup) before doing the work itself.
+    """
+
+    def __init__(self, name, lock_dir=SINGLEFLIGHT_LOCK_DIR, wait_timeout=SINGLEFLIGHT_WAIT_TIMEOUT):
+        self.name = name
+        self.lock_dir = lock_dir if fcntl else None
+        self.wait_timeout = wait_timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.coalesced_across_workers = 0
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+    def do(self, key, fn, recheck=None):
+        key = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if call.done.wait(self.wait_timeout):
+                self.coalesced += 1
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            # Leader is stuck; don't make everyone hang with it
+            return fn()
+
+        try:
+            call.result = self._run_leader(key, fn, recheck)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _run_leader(self, key, fn, recheck):
+        if not self.lock_dir:
+            self.leaders += 1
+            return fn()
+
+        path = os.path.join(self.lock_dir, f"{self.name}-{key}.lock")
+        lock_file, locked, waited = self._lock_path(path)
+        try:
+            if waited and recheck is not None:
+                result = recheck()
+                if result is not None:
+                    self.coalesced_across_workers += 1
+                    return result
+            self.leaders += 1
+            return fn()
+        finally:
+            if locked:
+                # Keys are content hashes that rarely repeat, so don't leave a
+                # file behind per key. Removing it while still locked is safe:
+                # a waiter that then gets the old file notices and reopens.
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    def _lock_path(self, path):
+        """Returns (lock_file, locked, waited) for the lock file at path."""
+        deadline = time.monotonic() + self.wait_timeout
+        waited = False
+        while True:
+            lock_file = open(path, 'a')
+            locked, waited_now = self._acquire(lock_file, deadline)
+            waited = waited or waited_now
+            if not locked:
+                return lock_file, False, True
+            try:
+                current = os.stat(path).st_ino == os.fstat(lock_file.fileno()).st_ino
+            except FileNotFoundError:
+                current = False
+            if current:
+                return lock_file, True, waited
+            # The previous holder removed this file on release; lock the new one
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+            waited = True
+
+    def _acquire(self, lock_file, deadline):
+        """Returns (locked, waited). Gives up on the lock at deadline."""
+        # Poll with LOCK_NB rather than block, so a cooperative (gevent)
+        # worker keeps serving other requests while it waits.
+        waited = False
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True, waited
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    return False, True
+                waited = True
+                time.sleep(LOCK_POLL_INTERVAL)
+
+    def stats(self):
+        return {
+            'upstream_calls': self.leaders,
+            'coalesced': self.coalesced,
+            'coalesced_across_workers': self.coalesced_across_workers,
+            'in_flight': len(self._calls),
+        }
@@ -0,0 +1,127 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+from collections import namedtuple
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+log = logging.getLogger(__name__)
+
+# The Vite build output served by app.py
+STATIC_DIR = os.getenv('STATIC_DIR', os.path.join(os.path.dirname(__file__), '..', 'frontend', 'dist'))
+# Write .gz/.br siblings at startup (reused by the next worker / next boot)
+STATIC_PRECOMPRESS = os.getenv('STATIC_PRECOMPRESS', '1') != '0'
+# Files smaller than this aren't worth a Content-Encoding
+STATIC_MIN_COMPRESS_BYTES = int(os.getenv('STATIC_MIN_COMPRESS_BYTES', '1024'))
+
+COMPRESSIBLE_TYPES = {
+    'application/javascript', 'text/javascript', 'application/json', 'application/manifest+json',
+    'image/svg+xml', 'application/xml', 'application/wasm', 'font/ttf', 'application/vnd.ms-fontobject',
+}
+# Vite names bundled files like assets/index-B4kX9_2a.js; those never change
+# content under the same name and can be cached for good
+HASHED_ASSET = re.compile(r'(^|/)assets/.+-[A-Za-z0-9_-]{8,}\.[a-z0-9]+$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+# One encoding of a file: its bytes and a strong ETag
+Variant = namedtuple('Variant', ['data', 'etag'])
+Asset = namedtuple('Asset', ['mime_type', 'cache_control', 'variants'])
+
+ENCODERS = {'gzip': ('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))}
+if brotli is not None:
+    ENCODERS['br'] = ('.br', lambda data: brotli.compress(data, quality=11))
+# Preferred first when the client accepts several
+ENCODING_PREFERENCE = ['br', 'gzip']
+
+
+def is_compressible(mime_type):
+    return mime_type.startswith('text/') or mime_type in COMPRESSIBLE_TYPES
+
+
+def _load_variant(source_path, source_data, suffix, encode):
+    path = source_path + suffix
+    try:
+        if os.path.getmtime(path) >= os.path.getmtime(source_path):
+            with open(path, 'rb') as f:
+                return f.read()
+    except OSError:
+        pass
+    data = encode(source_data)
+    if STATIC_PRECOMPRESS:
+        # Write-then-rename: several workers may be doing this at once
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            log.warning("Could not write precompressed file", extra={'path': path, 'error': str(e)})
+    return data
+
+
+def memory_asset(data, mime_type, cache_control=REVALIDATE_CACHE_CONTROL):
+    """Asset for bytes built at runtime; encodings are made in memory only."""
+    digest = hashlib.sha1(data).hexdigest()[:20]
+    variants = {'identity': Variant(data, f'"{digest}"')}
+    if is_compressible(mime_type) and len(data) >= STATIC_MIN_COMPRESS_BYTES:
+        for encoding, (_, encode) in ENCODERS.items():
+            encoded = encode(data)
+            if len(encoded) < len(data):
+                variants[encoding] = Variant(encoded, f'"{digest}-{encoding}"')
+    return Asset(mime_type, cache_control, variants)
+
+
+class StaticFiles:
+    """The built frontend, held in memory with its gzip/brotli encodings."""
+
+    def __init__(self, root=STATIC_DIR):
+        self.root = os.path.abspath(root)
+        self.assets = {}
+        if not os.path.isdir(self.root):
+            log.warning("No frontend build found", extra={'path': self.root})
+            return
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(('.gz', '.br', '.tmp')):
+                    continue
+                path = os.path.join(directory, filename)
+                self.assets[os.path.relpath(path, self.root).replace(os.sep, '/')] = self._load(path)
+        log.info("Loaded frontend build", extra={'path': self.root, 'files': len(self.assets)})
+
+    def _load(self, path):
+        relative = os.path.relpath(path, self.root).replace(os.sep, '/')
+        mime_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha1(data).hexdigest()[:20]
+        variants = {'identity': Variant(data, f'"{digest}"')}
+        if is_compressible(mime_type) and len(data) >= STATIC_MIN_COMPRESS_BYTES:
+            for encoding, (suffix, encode) in ENCODERS.items():
+                encoded = _load_variant(path, data, suffix, encode)
+                if len(encoded) < len(data):
+                    variants[encoding] = Variant(encoded, f'"{digest}-{encoding}"')
+        cache_control = IMMUTABLE_CACHE_CONTROL if HASHED_ASSET.search(relative) else REVALIDATE_CACHE_CONTROL
+        return Asset(mime_type, cache_control, variants)
+
+    def get(self, path):
+        return self.assets.get(path.lstrip('/') or 'index.html')
+
+    @staticmethod
+    def negotiate(asset, accept_encodings):
+        """(encoding, Variant) to send; accept_encodings is request.accept_encodings."""
+        for encoding in ENCODING_PREFERENCE:
+            if encoding in asset.variants and accept_encodings[encoding] > 0:
+                return encoding, asset.variants[encoding]
+        return 'identity', asset.variants['identity']
+
+
+def looks_like_file(path):
+    # "/assets/app.js" is a missing file; "/weather" is a client-side route
+    return '.' in path.rsplit('/', 1)[-1]
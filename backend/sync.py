@@ -0,0 +1,157 @@
+"""Offline data for low-bandwidth clients, and the version history behind its deltas.
+
+    python sync.py            # record the current content as a new version, if it changed
+    python sync.py --check    # exit 1 if the content has no recorded version yet
+
+The bundle is the scheme catalog plus what clients need to run the advisory
+rule table themselves. Versions are numbered 1, 2, 3... in one JSON file
+(SYNC_VERSIONS_PATH) that is committed and deployed with the app, so every
+instance gives the same content the same version. The file keeps per-entry
+hashes of recent versions so a client can be sent only what changed since
+its own. Run this script after editing schemes.py or advisory_rules.py.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+
+from advisory_rules import ADVISORY_RULES
+from static_files import memory_asset
+from weather import RAIN_CODES, WEATHER_CODE_GROUPS
+
+log = logging.getLogger(__name__)
+
+SYNC_VERSIONS_PATH = os.getenv('SYNC_VERSIONS_PATH', os.path.join(os.path.dirname(__file__), 'sync_versions.json'))
+# Versions a delta can be computed from; older clients get the full bundle
+SYNC_MAX_VERSIONS = int(os.getenv('SYNC_MAX_VERSIONS', '50'))
+
+
+def sync_collections(schemes):
+    """{collection: {key: entry}} as sent to clients."""
+    return {
+        'schemes': {scheme['id']: scheme for scheme in schemes},
+        'rules': {field: [[conditions, advice] for conditions, advice in rules]
+                  for field, rules in ADVISORY_RULES.items()},
+        'weather_codes': {
+            'groups': {str(code): group for code, group in sorted(WEATHER_CODE_GROUPS.items())},
+            'rain': sorted(RAIN_CODES),
+        },
+    }
+
+
+def entry_hash(value):
+    encoded = json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha1(encoded).hexdigest()[:12]
+
+
+def content_hashes(collections):
+    return {name: {key: entry_hash(value) for key, value in entries.items()}
+            for name, entries in collections.items()}
+
+
+def diff(old_hashes, collections):
+    """Per collection: added and changed entries, removed keys. Empty parts are left out."""
+    changes = {}
+    for name, entries in collections.items():
+        before = old_hashes.get(name, {})
+        part = {
+            'added': {key: value for key, value in entries.items() if key not in before},
+            'changed': {key: value for key, value in entries.items()
+                        if key in before and before[key] != entry_hash(value)},
+            'removed': sorted(key for key in before if key not in entries),
+        }
+        part = {kind: items for kind, items in part.items() if items}
+        if part:
+            changes[name] = part
+    return changes
+
+
+def read_versions(path=SYNC_VERSIONS_PATH):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f).get('versions', [])
+    except FileNotFoundError:
+        return []
+
+
+def is_recorded(hashes, versions):
+    return bool(versions) and versions[-1]['hashes'] == hashes
+
+
+def current_version(versions):
+    """Version to serve: the latest recorded one, or 0 when there is none.
+
+    Content edited without running this script keeps the last recorded
+    number, so every instance still agrees on it. Clients on that version
+    are sent the changes since it each time they sync, until the script
+    records the new content as the next version.
+    """
+    return versions[-1]['version'] if versions else 0
+
+
+def write_versions(versions, path=SYNC_VERSIONS_PATH):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'versions': versions}, f, indent=1, sort_keys=True)
+        f.write('\n')
+    os.replace(tmp_path, path)
+
+
+class SyncBundles:
+    """Every response /api/sync can give, built and compressed once at startup.
+
+    bundle(since) is the full data when since is 0 or unknown, otherwise
+    only the changes since that version.
+    """
+
+    def __init__(self, schemes, path=SYNC_VERSIONS_PATH):
+        collections = sync_collections(schemes)
+        hashes = content_hashes(collections)
+        versions = read_versions(path)
+        self.version = current_version(versions)
+        if not is_recorded(hashes, versions):
+            log.warning("Sync content has no recorded version; run sync.py", extra={'version': self.version})
+        self.full = self._asset(0, True, diff({}, collections))
+        self.deltas = {
+            entry['version']: self._asset(entry['version'], False, diff(entry['hashes'], collections))
+            for entry in versions
+        }
+        log.info("Built sync bundles", extra={
+            'version': self.version, 'deltas': len(self.deltas),
+            'full_bytes': len(self.full.variants['identity'].data),
+        })
+
+    def _asset(self, since, full, changes):
+        body = {'version': self.version, 'since': since, 'full': full, 'changes': changes}
+        data = json.dumps(body, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return memory_asset(data, 'application/json')
+
+    def bundle(self, since):
+        return self.deltas.get(since) or self.full
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--check', action='store_true', help='only report whether a new version is needed')
+    parser.add_argument('--path', default=SYNC_VERSIONS_PATH)
+    args = parser.parse_args()
+
+    from schemes import SCHEMES
+    hashes = content_hashes(sync_collections(SCHEMES))
+    versions = read_versions(args.path)
+    if is_recorded(hashes, versions):
+        print(f"Content unchanged (version {current_version(versions)})")
+        return
+    version = current_version(versions) + 1
+    if args.check:
+        print(f"Content has changed; run sync.py to record version {version}")
+        sys.exit(1)
+    versions = (versions + [{'version': version, 'hashes': hashes}])[-SYNC_MAX_VERSIONS:]
+    write_versions(versions, args.path)
+    print(f"Recorded version {version} in {args.path}")
+
+
+if __name__ == '__main__':
+    main()
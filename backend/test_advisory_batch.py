@@ -0,0 +1,37 @@
+import json
+import os
+import tempfile
+
+import pytest
+
+os.environ.setdefault('LLM_PROVIDER', 'fake')
+os.environ.setdefault('FAKE_LLM_LATENCY', 'fixed:1')
+os.environ.setdefault('JOBS_SQLITE_PATH', os.path.join(tempfile.mkdtemp(), 'jobs.sqlite3'))
+
+import app  # noqa: E402
+
+GOOD_WEATHER = {
+    'current': {'temperature': 30, 'windspeed': 5, 'weathercode': 1},
+    'forecast': [{'high': 31, 'low': 20, 'code': 61, 'condition': 'Slight rain'}],
+}
+
+
+def batch_lines(body, mode=None):
+    response = app.app.test_client().post('/api/farming-advisory/batch' + (f'?mode={mode}' if mode else ''),
+                                          json=body)
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+@pytest.mark.parametrize('mode', [None, 'fast'])
+def test_malformed_item_does_not_fail_the_batch(mode):
+    bad_day = {'forecast': [{'high': 'hot'}]}
+    lines = batch_lines({'items': [{'weather': GOOD_WEATHER}, {'weather': 'abc'},
+                                   {'weather': bad_day}, {'weather': GOOD_WEATHER}]}, mode)
+
+    results = {line['index']: line for line in lines if 'index' in line}
+    assert set(results) == {0, 1, 2, 3}
+    assert results[1] == {'index': 1, 'error': 'Invalid weather data'}
+    assert results[2] == {'index': 2, 'error': 'Invalid weather data'}
+    assert 'advisory' in results[0] and 'advisory' in results[3]
+    assert lines[-1]['done'] and lines[-1]['errors'] == 2
@@ -0,0 +1,103 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import resilience
+from llm import LLMBusyError
+from resilience import CLOSED, HALF_OPEN, OPEN, ResilientModel
+
+
+class ModelGone(Exception):
+    code = 404
+
+
+class StubModel:
+    def __init__(self, name, fail=None):
+        self.model_name = name
+        self.fail = fail
+        self.calls = 0
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        if self.fail:
+            raise self.fail(f"{self.model_name} down")
+        return SimpleNamespace(text=f"{self.model_name}: {prompt}")
+
+
+def make_resilient(primary, *others):
+    models = {model.model_name: model for model in others}
+    return ResilientModel(primary, build_model=models.__getitem__,
+                          candidate_names=lambda: [primary.model_name, *models], pass_timeout=False)
+
+
+def half_open(model, name):
+    health = model.health(name)
+    health.state = OPEN
+    health.opened_at = time.monotonic() - resilience.BREAKER_OPEN_SECONDS
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(resilience, 'backoff_delay', lambda attempt: 0)
+
+
+def test_breaker_opens_after_threshold_and_probes_once_half_open():
+    model = make_resilient(StubModel('a'))
+    health = model.health('a')
+    for _ in range(resilience.BREAKER_FAILURE_THRESHOLD):
+        assert health.allow()
+        health.record_failure()
+    assert health.state == OPEN
+    assert not health.allow()
+
+    half_open(model, 'a')
+    assert health.allow()
+    assert health.state == HALF_OPEN
+    assert not health.allow()  # probe already claimed
+    health.record_success(0.1)
+    assert health.state == CLOSED
+    assert health.allow()
+
+
+def test_failed_probe_reopens_breaker():
+    model = make_resilient(StubModel('a'))
+    half_open(model, 'a')
+    health = model.health('a')
+    assert health.allow()
+    health.record_failure()
+    assert health.state == OPEN
+    assert not health.allow()
+
+
+def test_failover_reaches_every_half_open_secondary():
+    b, c = StubModel('b', fail=ConnectionError), StubModel('c')
+    model = make_resilient(StubModel('a', fail=ModelGone), b, c)
+    half_open(model, 'b')
+    half_open(model, 'c')
+
+    response = model.generate_content('hello')
+
+    assert response.text == 'c: hello'
+    assert b.calls == 1 and c.calls == 1
+    assert model.health('b').state == OPEN
+    assert model.health('c').state == CLOSED
+
+
+def test_pick_only_claims_probe_of_chosen_model():
+    model = make_resilient(StubModel('a'), StubModel('b'), StubModel('c'))
+    half_open(model, 'b')
+    half_open(model, 'c')
+
+    assert model._pick(None) == 'a'
+    assert not model.health('b').probe_in_flight
+    assert not model.health('c').probe_in_flight
+
+
+def test_all_breakers_open_raises_busy():
+    model = make_resilient(StubModel('a'), StubModel('b'))
+    for name in ('a', 'b'):
+        model.health(name).record_failure(open_now=True)
+    with pytest.raises(LLMBusyError) as error:
+        model.generate_content('hello')
+    assert error.value.reason == 'circuit_open'
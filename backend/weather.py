@@ -0,0 +1,209 @@
+import hashlib
+import math
+
+# WMO weather codes that WeatherAlerts.tsx treats as rain (see isRainy there)
+RAIN_CODES = {51, 53, 55, 61, 63, 65, 80, 81, 82, 95}
+
+# Coarse condition groups for WMO weather codes. Anything that produces the
+# same farming advice belongs in the same group.
+WEATHER_CODE_GROUPS = {
+    0: 'clear', 1: 'clear',
+    2: 'cloudy', 3: 'cloudy',
+    45: 'fog', 48: 'fog',
+    51: 'drizzle', 53: 'drizzle', 55: 'drizzle', 56: 'drizzle', 57: 'drizzle',
+    61: 'rain', 63: 'rain', 65: 'heavy_rain', 66: 'rain', 67: 'heavy_rain',
+    80: 'rain', 81: 'rain', 82: 'heavy_rain',
+    71: 'snow', 73: 'snow', 75: 'snow', 77: 'snow', 85: 'snow', 86: 'snow',
+    95: 'thunderstorm', 96: 'thunderstorm', 99: 'thunderstorm',
+}
+
+# Display names, as getWeatherCondition in WeatherAlerts.tsx
+WEATHER_CODE_NAMES = {
+    0: "Clear sky", 1: "Mainly clear", 2: "Partly cloudy", 3: "Overcast",
+    45: "Fog", 48: "Depositing rime fog",
+    51: "Light drizzle", 53: "Moderate drizzle", 55: "Dense drizzle",
+    61: "Slight rain", 63: "Moderate rain", 65: "Heavy rain",
+    71: "Slight snow", 73: "Moderate snow", 75: "Heavy snow",
+    95: "Thunderstorm",
+}
+
+# Fallback when only the condition text is available (e.g. "Moderate rain")
+CONDITION_KEYWORDS = [
+    ('thunder', 'thunderstorm'),
+    ('heavy rain', 'heavy_rain'),
+    ('drizzle', 'drizzle'),
+    ('rain', 'rain'),
+    ('snow', 'snow'),
+    ('fog', 'fog'),
+    ('overcast', 'cloudy'),
+    ('cloud', 'cloudy'),
+    ('clear', 'clear'),
+]
+
+# Band edges (upper-exclusive). They follow the thresholds the advisories
+# actually turn on: cold stress below 10°C, heat above 35/38°C, wind above 20 km/h.
+TEMP_BANDS = [10, 15, 20, 25, 30, 35, 38, 42]
+WIND_BANDS = [10, 20, 30, 45]
+HUMIDITY_BANDS = [30, 50, 70, 85]
+
+
+def validate_weather(weather):
+    """Raise ValueError unless a client's advisory payload has the shape read below."""
+    if not isinstance(weather, dict):
+        raise ValueError('weather must be an object')
+    current = weather.get('current') or {}
+    if not isinstance(current, dict):
+        raise ValueError('weather.current must be an object')
+    _check_fields(current, 'weather.current',
+                  ('temp', 'temperature', 'wind', 'windspeed', 'humidity', 'code', 'weathercode'))
+    forecast = weather.get('forecast') or []
+    if not isinstance(forecast, list):
+        raise ValueError('weather.forecast must be a list')
+    for day in forecast_days(forecast):
+        _check_fields(day, 'weather.forecast[]', ('high', 'low', 'code'))
+
+
+def _check_fields(mapping, where, numbers):
+    for name in numbers:
+        value = mapping.get(name)
+        if value is None:
+            continue
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            number = math.nan
+        if not math.isfinite(number):
+            raise ValueError(f'{where}.{name} must be a number')
+    if not isinstance(mapping.get('condition') or '', str):
+        raise ValueError(f'{where}.condition must be a string')
+
+
+def current_conditions(weather):
+    """Read the current block of an advisory payload.
+
+    WeatherAlerts.tsx forwards Open-Meteo's current_weather as-is
+    (temperature/windspeed/weathercode), while older callers send
+    temp/wind/code/humidity. Accept both.
+    """
+    current = weather.get('current') or {}
+    return {
+        'temp': _first(current, 'temp', 'temperature'),
+        'wind': _first(current, 'wind', 'windspeed'),
+        'humidity': current.get('humidity'),
+        'condition': current.get('condition') or '',
+        'code': _first(current, 'code', 'weathercode'),
+    }
+
+
+def _first(mapping, *names):
+    for name in names:
+        if mapping.get(name) is not None:
+            return mapping[name]
+    return None
+
+
+def condition_name(code):
+    try:
+        return WEATHER_CODE_NAMES.get(int(code), "Variable")
+    except (TypeError, ValueError):
+        return "Variable"
+
+
+def weather_group(code=None, condition=''):
+    if code is not None:
+        try:
+            group = WEATHER_CODE_GROUPS.get(int(code))
+        except (TypeError, ValueError):
+            group = None
+        if group:
+            return group
+    condition = (condition or '').lower()
+    for keyword, group in CONDITION_KEYWORDS:
+        if keyword in condition:
+            return group
+    return 'variable'
+
+
+def is_rainy(code=None, condition=''):
+    if code is not None:
+        try:
+            return int(code) in RAIN_CODES
+        except (TypeError, ValueError):
+            pass
+    return weather_group(None, condition) in ('drizzle', 'rain', 'heavy_rain', 'thunderstorm')
+
+
+def band(value, edges):
+    if value is None:
+        return 'na'
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return 'na'
+    lower = None
+    for edge in edges:
+        if value < edge:
+            return f"{'' if lower is None else lower}-{edge}"
+        lower = edge
+    return f"{lower}-"
+
+
+def forecast_days(forecast):
+    return [day for day in (forecast or []) if isinstance(day, dict)]
+
+
+def forecast_trend(days):
+    # Compare the last forecast high with the first one
+    highs = [float(day['high']) for day in days if day.get('high') is not None]
+    if len(highs) >= 2:
+        delta = highs[-1] - highs[0]
+        if delta >= 3:
+            return 'up'
+        if delta <= -3:
+            return 'down'
+    return 'flat'
+
+
+def forecast_signature(forecast):
+    # Which days bring rain, plus where the highs/lows sit and which way they move
+    days = forecast_days(forecast)
+    if not days:
+        return 'none'
+    rain = ''.join('R' if is_rainy(day.get('code'), day.get('condition')) else '-' for day in days)
+    highs = [float(day['high']) for day in days if day.get('high') is not None]
+    lows = [float(day['low']) for day in days if day.get('low') is not None]
+    return '|'.join([
+        f"rain:{rain}",
+        f"hi:{band(max(highs), TEMP_BANDS) if highs else 'na'}",
+        f"lo:{band(min(lows), TEMP_BANDS) if lows else 'na'}",
+        f"trend:{forecast_trend(days)}",
+    ])
+
+
+def quantize_weather(weather):
+    """Canonical, human-readable bucket for an advisory payload."""
+    current = current_conditions(weather)
+    return '/'.join([
+        f"t:{band(current['temp'], TEMP_BANDS)}",
+        f"w:{band(current['wind'], WIND_BANDS)}",
+        f"h:{band(current['humidity'], HUMIDITY_BANDS)}",
+        f"c:{weather_group(current['code'], current['condition'])}",
+        f"f:{forecast_signature(weather.get('forecast'))}",
+    ])
+
+
+def advisory_cache_key(weather):
+    return hashlib.sha256(quantize_weather(weather).encode('utf-8')).hexdigest()
+
+
+def weather_alerts(weather):
+    """The warnings WeatherAlerts.tsx shows above the forecast."""
+    current = current_conditions(weather)
+    alerts = []
+    if current['temp'] is not None and float(current['temp']) > 35:
+        alerts.append("Heatwave warning: Ensure proper irrigation.")
+    if current['wind'] is not None and float(current['wind']) > 20:
+        alerts.append("High winds: Secure loose structures.")
+    if current['code'] is not None and float(current['code']) >= 95:
+        alerts.append("Thunderstorm alert: Avoid open fields.")
+    return alerts
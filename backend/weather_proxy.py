@@ -0,0 +1,246 @@
+import datetime
+import logging
+import os
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import metrics
+from admission import TokenBucketLimiter
+from cache import CACHE_SQLITE_PATH, ResponseCache, SQLiteBackend, make_cache
+from singleflight import SingleFlight
+from weather import condition_name
+
+log = logging.getLogger(__name__)
+
+# Upstreams WeatherAlerts.tsx used to call from the phone. Point these at a
+# local stand-in for tests and load runs.
+GEOCODE_URL = os.getenv('GEOCODE_URL', 'https://nominatim.openstreetmap.org/search')
+FORECAST_URL = os.getenv('FORECAST_URL', 'https://api.open-meteo.com/v1/forecast')
+# Nominatim's usage policy asks for an identifying User-Agent
+WEATHER_USER_AGENT = os.getenv('WEATHER_USER_AGENT', 'ai-agri-advisor/1.0')
+WEATHER_CONNECT_TIMEOUT = float(os.getenv('WEATHER_CONNECT_TIMEOUT', '3'))
+WEATHER_READ_TIMEOUT = float(os.getenv('WEATHER_READ_TIMEOUT', '8'))
+# Keep-alive connections kept per upstream host, and retries of a failed GET
+WEATHER_POOL_SIZE = int(os.getenv('WEATHER_POOL_SIZE', '20'))
+WEATHER_HTTP_RETRIES = int(os.getenv('WEATHER_HTTP_RETRIES', '1'))
+
+# Place names don't move: resolved locations are kept for weeks in SQLite so
+# they survive restarts and are shared by every worker. Lookups that found
+# nothing are kept for a day.
+GEOCODE_CACHE_PATH = os.getenv('GEOCODE_CACHE_PATH', CACHE_SQLITE_PATH)
+GEOCODE_CACHE_TTL = int(os.getenv('GEOCODE_CACHE_TTL', str(30 * 24 * 60 * 60)))
+GEOCODE_MISS_TTL = int(os.getenv('GEOCODE_MISS_TTL', str(24 * 60 * 60)))
+GEOCODE_CACHE_MAX_ENTRIES = int(os.getenv('GEOCODE_CACHE_MAX_ENTRIES', '50000'))
+# Nominatim allows one request per second from the whole server. Each worker
+# process gets its share of that; lookups past it are refused (503) rather
+# than risking a ban of the server's IP.
+GEOCODE_RATE_PER_MINUTE = float(os.getenv('GEOCODE_RATE_PER_MINUTE', '60'))
+GEOCODE_BURST = int(os.getenv('GEOCODE_BURST', '1'))
+
+# Forecasts are cached per coordinate cell: 2 decimals is about 1 km, far
+# finer than the model grid Open-Meteo interpolates from
+FORECAST_CACHE_TTL = int(os.getenv('FORECAST_CACHE_TTL', '600'))
+FORECAST_CACHE_MAX_ENTRIES = int(os.getenv('FORECAST_CACHE_MAX_ENTRIES', '4096'))
+FORECAST_COORD_DECIMALS = int(os.getenv('FORECAST_COORD_DECIMALS', '2'))
+FORECAST_DAYS = 5
+
+NOT_FOUND_MESSAGE = "Location not found. Please try a different city or PIN code."
+MISMATCH_MESSAGE = "Location not found. Please check if the City name and PIN code match."
+
+WEATHER_UPSTREAM_SECONDS = metrics.histogram(
+    'weather_upstream_seconds', 'Geocoding and forecast calls by upstream and outcome.', ('upstream', 'outcome'))
+
+
+class LocationNotFound(Exception):
+    pass
+
+
+class UpstreamError(Exception):
+    pass
+
+
+class GeocodeRateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Geocoding rate limit reached, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+def make_session():
+    retry = Retry(total=WEATHER_HTTP_RETRIES, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504),
+                  allowed_methods=frozenset(['GET']), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=WEATHER_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = WEATHER_USER_AGENT
+    return session
+
+
+http = make_session()
+
+geocode_cache = ResponseCache('geocode', SQLiteBackend(GEOCODE_CACHE_PATH, 'geocode', GEOCODE_CACHE_MAX_ENTRIES,
+                                                       GEOCODE_CACHE_TTL))
+geocode_limiter = TokenBucketLimiter(
+    'geocode', GEOCODE_RATE_PER_MINUTE / max(1, int(os.getenv('WEB_CONCURRENCY', '1'))), GEOCODE_BURST)
+geocode_miss_cache = SQLiteBackend(GEOCODE_CACHE_PATH, 'geocode_miss', GEOCODE_CACHE_MAX_ENTRIES, GEOCODE_MISS_TTL)
+forecast_cache = make_cache('forecast', FORECAST_CACHE_MAX_ENTRIES, FORECAST_CACHE_TTL)
+
+# Everyone in a district looks up the same few places at the same time
+geocode_flight = SingleFlight('geocode')
+forecast_flight = SingleFlight('forecast')
+
+
+def _get_json(upstream, url, params):
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        response = http.get(url, params=params, timeout=(WEATHER_CONNECT_TIMEOUT, WEATHER_READ_TIMEOUT))
+        response.raise_for_status()
+        data = response.json()
+        outcome = 'ok'
+        return data
+    except (requests.RequestException, ValueError) as e:
+        log.warning("Weather upstream failed", extra={'upstream': upstream, 'error': str(e)})
+        raise UpstreamError(f"{upstream} request failed") from e
+    finally:
+        WEATHER_UPSTREAM_SECONDS.observe(time.perf_counter() - started, upstream=upstream, outcome=outcome)
+
+
+def _clean_pincode(pincode):
+    return ''.join((pincode or '').split())
+
+
+def geocode_key(city, pincode):
+    return f"{' '.join((city or '').casefold().split())}\x00{_clean_pincode(pincode)}"
+
+
+def describe_place(match):
+    # Same display string WeatherAlerts.tsx builds: place, taluk, district, state
+    address = match.get('address') or {}
+    place = (address.get('city') or address.get('town') or address.get('village') or address.get('hamlet')
+             or address.get('suburb') or (match.get('display_name') or '').split(',')[0])
+    taluk = address.get('taluk') or address.get('subdistrict') or address.get('county') or ''
+    district = address.get('district') or address.get('state_district') or ''
+    state = address.get('state') or ''
+    parts = [place]
+    if taluk and taluk != place:
+        parts.append(taluk)
+    if district and district != taluk:
+        parts.append(district)
+    if state:
+        parts.append(state)
+    return {
+        'name': place,
+        'display': ', '.join(parts),
+        'district': district,
+        'state': state,
+        'lat': float(match['lat']),
+        'lon': float(match['lon']),
+    }
+
+
+def pick_match(results, city, pincode):
+    if not results:
+        raise LocationNotFound(MISMATCH_MESSAGE if city.strip() and pincode.strip() else NOT_FOUND_MESSAGE)
+    pincode = _clean_pincode(pincode)
+    if not pincode:
+        return results[0]
+    for item in results:
+        if _clean_pincode((item.get('address') or {}).get('postcode')) == pincode:
+            return item
+    # Results for the city, but none in that PIN code
+    raise LocationNotFound(MISMATCH_MESSAGE)
+
+
+def geocode(city, pincode=''):
+    """Location dict for a city and/or PIN code.
+
+    Raises LocationNotFound, UpstreamError, or GeocodeRateLimited when the
+    lookup isn't cached and the upstream budget is spent.
+    """
+    city, pincode = (city or '').strip(), (pincode or '').strip()
+    if not city and not pincode:
+        raise LocationNotFound(NOT_FOUND_MESSAGE)
+    key = geocode_key(city, pincode)
+    cached = geocode_cache.get(key)
+    if cached is not None:
+        return cached
+    missed = geocode_miss_cache.get(key)
+    if missed is not None:
+        raise LocationNotFound(missed)
+
+    def lookup():
+        retry_after = geocode_limiter.take('upstream')
+        if retry_after:
+            raise GeocodeRateLimited(retry_after)
+        query = f"{city} {pincode}" if pincode else city
+        results = _get_json('geocode', GEOCODE_URL, {'format': 'json', 'q': query, 'addressdetails': 1})
+        try:
+            location = describe_place(pick_match(results, city, pincode))
+        except LocationNotFound as e:
+            geocode_miss_cache.set(key, str(e))
+            raise
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            raise UpstreamError("geocode returned an unexpected response") from e
+        geocode_cache.set(key, location)
+        return location
+
+    return geocode_flight.do(key, lookup, recheck=lambda: geocode_cache.get(key))
+
+
+def forecast_cell(lat, lon):
+    return round(float(lat), FORECAST_COORD_DECIMALS), round(float(lon), FORECAST_COORD_DECIMALS)
+
+
+def advisory_weather(data):
+    """Open-Meteo's answer in the payload shape /api/farming-advisory takes."""
+    current = data['current_weather']
+    daily = data['daily']
+    forecast = []
+    for index, date in enumerate(daily['time'][:FORECAST_DAYS]):
+        code = daily['weathercode'][index]
+        forecast.append({
+            'day': datetime.date.fromisoformat(date).strftime('%a'),
+            'high': round(daily['temperature_2m_max'][index]),
+            'low': round(daily['temperature_2m_min'][index]),
+            'condition': condition_name(code),
+            'code': code,
+        })
+    return {
+        'current': {
+            'temperature': current['temperature'],
+            'windspeed': current['windspeed'],
+            'weathercode': current['weathercode'],
+            'condition': condition_name(current['weathercode']),
+        },
+        'forecast': forecast,
+    }
+
+
+def forecast(lat, lon):
+    """Current weather plus the daily forecast for the cell around (lat, lon)."""
+    lat, lon = forecast_cell(lat, lon)
+    key = f"{lat:.{FORECAST_COORD_DECIMALS}f},{lon:.{FORECAST_COORD_DECIMALS}f}"
+    cached = forecast_cache.get(key)
+    if cached is not None:
+        return cached
+
+    def fetch():
+        data = _get_json('forecast', FORECAST_URL, {
+            'latitude': lat,
+            'longitude': lon,
+            'current_weather': 'true',
+            'daily': 'temperature_2m_max,temperature_2m_min,weathercode',
+            'timezone': 'auto',
+        })
+        try:
+            weather = advisory_weather(data)
+        except (KeyError, TypeError, ValueError, IndexError) as e:
+            raise UpstreamError("forecast returned an unexpected response") from e
+        forecast_cache.set(key, weather)
+        return weather
+
+    return forecast_flight.do(key, fetch, recheck=lambda: forecast_cache.get(key))
@@ -1,5 +1,5 @@
 import React, { useState, useEffect, useRef } from 'react';
-import { callGemini } from '../services/api';
+import { streamGemini } from '../services/api';
 
 interface Message {
     id: number;
@@ -8,6 +8,11 @@ interface Message {
     image?: string;
 }
 
+// crypto.randomUUID only exists in secure contexts (HTTPS or localhost), and the
+// app is also opened over plain HTTP on a LAN address; getRandomValues works in both
+const newSessionId = (): string =>
+    Array.from(crypto.getRandomValues(new Uint8Array(16)), (byte) => byte.toString(16).padStart(2, '0')).join('');
+
 const ChatAssistant: React.FC = () => {
     const [messages, setMessages] = useState<Message[]>([
         { id: 1, text: "Namaste! I am your AI agriculture assistant. Ask me anything about farming in your language.", sender: "bot" }
@@ -20,6 +25,11 @@ const ChatAssistant: React.FC = () => {
     const [isSpeaking, setIsSpeaking] = useState(false);
 
     const messagesEndRef = useRef<HTMLDivElement>(null);
+    // The backend keeps the conversation history for this id
+    const sessionIdRef = useRef<string>('');
+    if (!sessionIdRef.current) {
+        sessionIdRef.current = newSessionId();
+    }
 
     const languages = [
         "English", "Hindi", "Telugu", "Tamil", "Kannada", "Marathi", "Punjabi", "Gujarati", "Bengali"
@@ -132,15 +142,22 @@ const ChatAssistant: React.FC = () => {
 
         setIsTyping(true);
 
-        // Call backend with multimodal support
-        const aiResponse = await callGemini(newUserMessage.text, newUserMessage.image, selectedLanguage);
+        // Call backend with multimodal support, rendering the answer as it streams in
+        const botMessageId = Date.now() + 1;
+        const showBotText = (text: string) => {
+            setIsTyping(false);
+            setMessages(prev => {
+                const existing = prev.find(m => m.id === botMessageId);
+                if (existing) {
+                    return prev.map(m => m.id === botMessageId ? { ...m, text } : m);
+                }
+                return [...prev, { id: botMessageId, text, sender: "bot" }];
+            });
+        };
 
-        setIsTyping(false);
+        const aiResponse = await streamGemini(newUserMessage.text, newUserMessage.image, selectedLanguage, showBotText, sessionIdRef.current);
 
-        setMessages(prev => [
-            ...prev,
-            { id: Date.now() + 1, text: aiResponse, sender: "bot" }
-        ]);
+        showBotText(aiResponse);
 
         // Auto-speak response if desirable, or let user click to speak. 
         // For accessibility, auto-speaking might be intrusive, but user requested "announce report".
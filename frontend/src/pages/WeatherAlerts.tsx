@@ -92,136 +92,122 @@ const WeatherAlerts: React.FC = () => {
         return advisory;
     };
 
-    const fetchWeather = async (city: string, pin: string) => {
-        setLoading(true);
-        setError("");
-        try {
-            let lat, lon;
-
-            // Geocoding using Nominatim
-            const query = pin ? `${city} ${pin}` : city;
-            const geoRes = await fetch(
-                `https://nominatim.openstreetmap.org/search?format=json&q=${encodeURIComponent(query)}&addressdetails=1`
-            );
-            const geoData = await geoRes.json();
-
-            if (!geoData || geoData.length === 0) {
-                if (city.trim() && pin.trim()) {
-                    throw new Error("Location not found. Please check if the City name and PIN code match.");
-                }
-                throw new Error("Location not found. Please try a different city or PIN code.");
-            }
-
-            let bestMatch = geoData[0];
-
-            if (pin.trim()) {
-                const cleanPin = pin.trim();
-                const match = geoData.find((item: any) => {
-                    const postalCode = item.address?.postcode;
-                    // Check if postalCode exists and if it loosely matches (sometimes APIs return spaces or slightly different formats)
-                    return postalCode && postalCode.replace(/\s/g, '') === cleanPin.replace(/\s/g, '');
-                });
-
-                if (match) {
-                    bestMatch = match;
-                } else {
-                    // We found results (e.g. for the city), but NONE matched the PIN.
-                    // This is the specific "City/PIN Mismatch" case that was previously being hidden.
-                    throw new Error("Location not found. Please check if the City name and PIN code match.");
-                }
+    // Fallback when /api/weather is down or busy: the phone calls the
+    // upstreams itself and the advisory comes from the local rules above
+    const fetchWeatherDirect = async (city: string, pin: string) => {
+        const query = pin ? `${city} ${pin}` : city;
+        const geoRes = await fetch(
+            `https://nominatim.openstreetmap.org/search?format=json&q=${encodeURIComponent(query)}&addressdetails=1`
+        );
+        const geoData = await geoRes.json();
+
+        if (!geoData || geoData.length === 0) {
+            if (city.trim() && pin.trim()) {
+                throw new Error("Location not found. Please check if the City name and PIN code match.");
             }
+            throw new Error("Location not found. Please try a different city or PIN code.");
+        }
 
-            lat = bestMatch.lat;
-            lon = bestMatch.lon;
-
-            // Extract detailed location info
-            const address = bestMatch.address;
-            const placeName = address.city || address.town || address.village || address.hamlet || address.suburb || bestMatch.display_name.split(",")[0];
-            const taluk = address.taluk || address.subdistrict || address.county || "";
-            const district = address.district || address.state_district || "";
-            const state = address.state || "";
-
-            // Construct display string
-            let locationParts = [placeName];
-            if (taluk && taluk !== placeName) locationParts.push(taluk);
-            if (district && district !== taluk) locationParts.push(district);
-            if (state) locationParts.push(state);
-
-            setLocation(locationParts.join(", "));
-
-            // Weather Data using Open-Meteo
-            const weatherRes = await fetch(
-                `https://api.open-meteo.com/v1/forecast?latitude=${lat}&longitude=${lon}&current_weather=true&daily=temperature_2m_max,temperature_2m_min,weathercode&timezone=auto`
-            );
-            const weatherData = await weatherRes.json();
-
-            if (weatherData.error) {
-                throw new Error("Failed to fetch weather data.");
+        let bestMatch = geoData[0];
+        if (pin.trim()) {
+            const cleanPin = pin.trim().replace(/\s/g, '');
+            bestMatch = geoData.find((item: any) => item.address?.postcode?.replace(/\s/g, '') === cleanPin);
+            if (!bestMatch) {
+                throw new Error("Location not found. Please check if the City name and PIN code match.");
             }
+        }
 
-            // Map API response to our WeatherData interface
-            const current = weatherData.current_weather;
-            const daily = weatherData.daily;
-
-            const forecast = daily.time.slice(0, 5).map((date: string, index: number) => ({
-                day: new Date(date).toLocaleDateString('en-US', { weekday: 'short' }),
-                high: Math.round(daily.temperature_2m_max[index]),
-                low: Math.round(daily.temperature_2m_min[index]),
-                condition: getWeatherCondition(daily.weathercode[index]),
-                code: daily.weathercode[index]
-            }));
+        const address = bestMatch.address;
+        const placeName = address.city || address.town || address.village || address.hamlet || address.suburb || bestMatch.display_name.split(",")[0];
+        const taluk = address.taluk || address.subdistrict || address.county || "";
+        const district = address.district || address.state_district || "";
+        const state = address.state || "";
+        let locationParts = [placeName];
+        if (taluk && taluk !== placeName) locationParts.push(taluk);
+        if (district && district !== taluk) locationParts.push(district);
+        if (state) locationParts.push(state);
+
+        const weatherRes = await fetch(
+            `https://api.open-meteo.com/v1/forecast?latitude=${bestMatch.lat}&longitude=${bestMatch.lon}&current_weather=true&daily=temperature_2m_max,temperature_2m_min,weathercode&timezone=auto`
+        );
+        const weatherData = await weatherRes.json();
+        if (weatherData.error) {
+            throw new Error("Failed to fetch weather data.");
+        }
 
-            // Default to local logic first (instant)
-            let advisory = generateAdvisories({ ...current, code: current.weathercode }, forecast);
+        const current = weatherData.current_weather;
+        const daily = weatherData.daily;
+        const forecast = daily.time.slice(0, 5).map((date: string, index: number) => ({
+            day: new Date(date).toLocaleDateString('en-US', { weekday: 'short' }),
+            high: Math.round(daily.temperature_2m_max[index]),
+            low: Math.round(daily.temperature_2m_min[index]),
+            condition: getWeatherCondition(daily.weathercode[index]),
+            code: daily.weathercode[index]
+        }));
+
+        const alerts: string[] = [];
+        if (current.temperature > 35) alerts.push("Heatwave warning: Ensure proper irrigation.");
+        if (current.windspeed > 20) alerts.push("High winds: Secure loose structures.");
+        if (current.weathercode >= 95) alerts.push("Thunderstorm alert: Avoid open fields.");
+
+        return {
+            location: { display: locationParts.join(", ") },
+            weather: {
+                current: { ...current, condition: getWeatherCondition(current.weathercode) },
+                forecast
+            },
+            alerts,
+            advisory: generateAdvisories(
+                { temp: current.temperature, wind: current.windspeed, code: current.weathercode }, forecast)
+        };
+    };
 
-            // Try to get AI-powered advice
+    const fetchWeather = async (city: string, pin: string) => {
+        setLoading(true);
+        setError("");
+        try {
+            // One round trip: the backend geocodes, fetches the forecast and
+            // builds the advisory (with cached locations and forecasts)
+            let data: any = null;
+            let notFound = "";
             try {
-                const apiResponse = await fetch(`${import.meta.env.VITE_API_URL}/api/farming-advisory`, {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({
-                        weather: {
-                            current: { ...current, condition: getWeatherCondition(current.weathercode) },
-                            forecast: forecast
-                        }
-                    })
-                });
-
-                if (apiResponse.ok) {
-                    const aiAdvisory = await apiResponse.json();
-                    // Validate keys exist before replacing
-                    if (aiAdvisory.irrigation && aiAdvisory.protection) {
-                        advisory = aiAdvisory;
-                    }
+                const params = new URLSearchParams({ city, pincode: pin });
+                const res = await fetch(`${import.meta.env.VITE_API_URL}/api/weather?${params.toString()}`);
+                const body = await res.json();
+                if (res.ok) {
+                    data = body;
+                } else if (res.status === 404) {
+                    notFound = body.error || "Location not found. Please try a different city or PIN code.";
                 }
             } catch (e) {
-                console.log("AI Advisory failed, using local fallback:", e);
-                // Silent failure, falls back to local 'advisory' variable
+                console.log("Weather service failed:", e);
+            }
+            if (notFound) {
+                throw new Error(notFound);
+            }
+            if (!data) {
+                // Busy (503), upstream error (502) or unreachable
+                data = await fetchWeatherDirect(city, pin);
             }
 
+            setLocation(data.location.display);
+
+            const current = data.weather.current;
             setWeather({
                 current: {
                     temp: Math.round(current.temperature),
                     feelsLike: Math.round(current.temperature), // OpenMeteo basic doesn't give feels_like freely easily, approximating
-                    condition: getWeatherCondition(current.weathercode),
+                    condition: current.condition,
                     humidity: 60, // Placeholder as basic OpenMeteo current_weather doesn't have humidity
                     wind: Math.round(current.windspeed),
                     gusts: Math.round(current.windspeed * 1.2), // Estimate
                     code: current.weathercode
                 },
-                forecast,
-                alerts: [], // OpenMeteo requires separate endpoint for alerts or parsing, leaving empty for now or mocking if needed
-                advisories: advisory
+                forecast: data.weather.forecast,
+                alerts: data.alerts,
+                advisories: data.advisory
             });
 
-            // Simulate alerts based on conditions for demo
-            const simulatedAlerts: string[] = [];
-            if (current.temperature > 35) simulatedAlerts.push("Heatwave warning: Ensure proper irrigation.");
-            if (current.windspeed > 20) simulatedAlerts.push("High winds: Secure loose structures.");
-            if (current.weathercode >= 95) simulatedAlerts.push("Thunderstorm alert: Avoid open fields.");
-
-            setWeather(prev => prev ? { ...prev, alerts: simulatedAlerts } : null);
-
         } catch (err: any) {
             setError(err.message || "An error occurred while fetching data.");
             setWeather(null);
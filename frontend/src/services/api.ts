@@ -25,3 +25,85 @@ export async function callGemini(prompt: string, image?: string | null, language
         return "Sorry, I am unable to connect to the server. Please ensure the backend is running.";
     }
 }
+
+// Photos go up as a binary multipart file instead of a base64 string in JSON,
+// which is a third smaller on the wire.
+async function buildImageForm(prompt: string, image: string, language?: string, sessionId?: string): Promise<FormData> {
+    const form = new FormData();
+    form.append("message", prompt);
+    form.append("language", language || "English");
+    if (sessionId) form.append("session_id", sessionId);
+    form.append("image", await (await fetch(image)).blob(), "photo");
+    return form;
+}
+
+// Same fields as callGemini, but reads the Server-Sent Events stream from
+// /api/chat/stream and reports the text accumulated so far as chunks arrive.
+export async function streamGemini(
+    prompt: string,
+    image: string | null | undefined,
+    language: string | undefined,
+    onText: (textSoFar: string) => void,
+    sessionId?: string
+): Promise<string> {
+    try {
+        const response = await fetch(`${import.meta.env.VITE_API_URL}/api/chat/stream`, {
+            method: "POST",
+            headers: image
+                ? { "Accept": "text/event-stream" }
+                : { "Content-Type": "application/json", "Accept": "text/event-stream" },
+            body: image ? await buildImageForm(prompt, image, language, sessionId) : JSON.stringify({
+                message: prompt,
+                image: image,
+                language: language,
+                session_id: sessionId
+            })
+        });
+        if (!response.ok || !response.body) {
+            const errorText = await response.text();
+            console.error(`Gemini API Error (${response.status}):`, errorText);
+            return `Sorry, I encountered an error: ${response.status} - ${errorText}`;
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        let text = "";
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // Events are separated by a blank line
+            let boundary = buffer.indexOf("\n\n");
+            while (boundary !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                boundary = buffer.indexOf("\n\n");
+
+                let eventName = "message";
+                let data = "";
+                for (const line of rawEvent.split("\n")) {
+                    if (line.startsWith("event:")) eventName = line.slice(6).trim();
+                    else if (line.startsWith("data:")) data += line.slice(5).trim();
+                }
+                if (!data) continue;
+
+                const payload = JSON.parse(data);
+                if (eventName === "chunk") {
+                    text += payload.text;
+                    onText(text);
+                } else if (eventName === "error") {
+                    console.error("Gemini stream error:", payload);
+                    return text || `Sorry, I encountered an error: ${payload.details || payload.error}`;
+                }
+            }
+        }
+
+        return text || "Sorry, I couldn't get a response from Gemini.";
+    } catch (error) {
+        console.error("Error calling AI API:", error);
+        return "Sorry, I am unable to connect to the server. Please ensure the backend is running.";
+    }
+}